@@ -0,0 +1,635 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from database import (CORR_TYPES, CORRESPONDENCE_COUNT_BY_TYPE_SQL, IMPORT_FIELDS, INSERT_CORRESPONDENCE_SQL,
+                      PERIODS, RANKS, SEARCH_CORRESPONDENCE_SQL, URGENCIES, CorrespondenceImporter, DatabaseManager,
+                      FontCache, PdfReport, ResultCache, SearchFilters, date_to_day, db_connection,
+                      plan_batch_reports, run_batch_reports, with_filters)
+from export import REPORT_FORMATS
+
+# Бюджет на импорт database.py для запуска отчетов из командной строки.
+STARTUP_BUDGET_MS = 50
+
+# Текстовые столбцы схемы версии 4: по ним --storage строит базу для
+# сравнения с хранением через справочники и номера дней (версия 5).
+LEGACY_SCHEMA_VERSION = 4
+
+LEGACY_INSERT_SQL = '''
+    INSERT INTO correspondence (date, corr_type, urgency, incoming, outgoing, period, duty_dus_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Агрегация по самой таблице, без свертки correspondence_daily: ее время
+# определяется размером строк и тем, сколько страниц читается с диска.
+STORAGE_AGGREGATE_SQL = {
+    LEGACY_SCHEMA_VERSION: '''
+        SELECT corr_type, urgency, SUM(incoming), SUM(outgoing)
+        FROM correspondence
+        WHERE date BETWEEN ? AND ?
+        GROUP BY corr_type, urgency
+    ''',
+    5: '''
+        SELECT corr_type_id, urgency_id, SUM(incoming), SUM(outgoing)
+        FROM correspondence
+        WHERE day BETWEEN ? AND ?
+        GROUP BY corr_type_id, urgency_id
+    ''',
+}
+
+
+# Распределения синтетических данных: телефонная нагрузка преобладает,
+# большая часть сообщений обычной срочности, количества - малые целые.
+CORR_TYPE_WEIGHTS = [55, 30, 15]
+URGENCY_WEIGHTS = [40, 20, 8, 8, 5, 3, 2, 4, 3, 2, 2, 2, 1]
+FIRST_NAMES = ["Иван", "Петр", "Сергей", "Алексей", "Дмитрий", "Андрей", "Николай", "Михаил"]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+              "Морозов", "Волков", "Новиков", "Федоров"]
+PATRONYMICS = ["Иванович", "Петрович", "Сергеевич", "Алексеевич", "Дмитриевич", "Андреевич"]
+GENERATOR_END_DATE = date(2024, 12, 31)
+GENERATOR_BATCH = 50000
+SUITE_SIZES = [10000, 100000, 1000000]
+
+
+def generate_data(db_manager, rows, seed=1, officers=24, days=None):
+    # Записи идут по дням подряд, как при ежедневном вводе; смены дежурят по
+    # графику, иногда с подменой. Один seed - одна и та же база.
+    rng = random.Random(seed)
+    with db_manager.connections.transaction() as connection:
+        for _ in range(officers):
+            connection.execute('''
+                INSERT INTO duty_dus (rank, first_name, last_name, last_last_name) VALUES (?, ?, ?, ?)
+            ''', (rng.choice(RANKS), rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(PATRONYMICS)))
+    officer_ids = [row[0] for row in db_manager.update_duty_dus_list()]
+    days = days or max(30, min(3 * 365, rows // 20))
+    first_day = GENERATOR_END_DATE - timedelta(days=days - 1)
+    dates = [(first_day + timedelta(days=i)).isoformat() for i in range(days)]
+
+    def make_generated_row(i):
+        day_index = i * days // rows
+        period_index = rng.randrange(len(PERIODS))
+        officer_id = officer_ids[(day_index * len(PERIODS) + period_index) % len(officer_ids)]
+        if rng.random() < 0.1:
+            officer_id = rng.choice(officer_ids)
+        return (dates[day_index],
+                rng.choices(CORR_TYPES, CORR_TYPE_WEIGHTS)[0],
+                rng.choices(URGENCIES, URGENCY_WEIGHTS)[0],
+                int(rng.expovariate(0.25)),
+                int(rng.expovariate(0.35)),
+                PERIODS[period_index],
+                officer_id)
+
+    legacy = db_manager.schema_version() == LEGACY_SCHEMA_VERSION
+    for batch_start in range(0, rows, GENERATOR_BATCH):
+        batch = (make_generated_row(i) for i in range(batch_start, min(rows, batch_start + GENERATOR_BATCH)))
+        if legacy:
+            with db_manager.connections.transaction() as connection:
+                connection.executemany(LEGACY_INSERT_SQL, batch)
+        else:
+            db_manager.add_correspondence_many(batch)
+    return dates[0], dates[-1]
+
+
+def measure(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def run_suite(sizes, seed, workdir):
+    results = []
+
+    def record(size, operation, seconds, rows=None):
+        results.append({"size": size, "operation": operation, "seconds": seconds, "rows": rows})
+        print(f"{size:>10} {operation:<40} {seconds * 1e3:12.3f} мс" + (f"  ({rows} строк)" if rows is not None else ""))
+
+    for size in sizes:
+        db_path = os.path.join(workdir, f"suite-{size}.db")
+        # Замеры запросов - без кэша результатов, иначе повторы measure
+        # показывали бы попадания в кэш; кэш замеряется отдельной строкой.
+        db_manager = DatabaseManager(db_path, result_cache=ResultCache(max_entries=0))
+        try:
+            seconds, _ = measure(db_manager.create_tables, repeat=1)
+            record(size, "create_tables", seconds)
+
+            start = time.perf_counter()
+            first_day, last_day = generate_data(db_manager, size, seed)
+            record(size, "bulk_insert", time.perf_counter() - start, size)
+
+            last = date.fromisoformat(last_day)
+            month_start = (last - timedelta(days=29)).isoformat()
+            year_start = max(first_day, (last - timedelta(days=364)).isoformat())
+            officer_id = db_manager.update_duty_dus_list()[0][0]
+
+            inserts = 200
+            start = time.perf_counter()
+            for i in range(inserts):
+                db_manager.add_correspondence(last_day, CORR_TYPES[0], URGENCIES[0], i % 5, i % 3, PERIODS[0],
+                                              officer_id)
+            record(size, "add_correspondence (на вставку)", (time.perf_counter() - start) / inserts)
+
+            for label, start_date in (("месяц", month_start), ("год", year_start)):
+                seconds, rows = measure(lambda: db_manager.search_correspondence(start_date, last_day))
+                record(size, f"search_correspondence ({label})", seconds, len(rows))
+                seconds, rows = measure(lambda: db_manager.search_correspondence_page(start_date, last_day))
+                record(size, f"search_correspondence_page ({label})", seconds, len(rows))
+                seconds, rows = measure(lambda: db_manager.get_correspondence_count_by_type(start_date, last_day))
+                record(size, f"get_correspondence_count_by_type ({label})", seconds, len(rows))
+                seconds, analytics = measure(lambda: db_manager.get_load_analytics(start_date, last_day))
+                record(size, f"get_load_analytics ({label})", seconds, len(analytics.shifts))
+
+            seconds, rows = measure(db_manager.update_duty_dus_list)
+            record(size, "update_duty_dus_list", seconds, len(rows))
+
+            cached_manager = DatabaseManager(db_path)
+            try:
+                def press_search():
+                    cached_manager.search_correspondence_page(month_start, last_day)
+                    cached_manager.get_load_analytics(month_start, last_day)
+                    return cached_manager.count_correspondence(month_start, last_day)
+                press_search()
+                seconds, rows = measure(press_search)
+                record(size, "повторный поиск (месяц, кэш)", seconds, rows)
+            finally:
+                cached_manager.close()
+
+            pdf_path = os.path.join(workdir, "suite.pdf")
+            report = PdfReport(db_manager, last_day, last_day)
+            seconds, _ = measure(lambda: report.write(pdf_path), repeat=3)
+            record(size, "pdf_export (день)", seconds, db_manager.count_correspondence(last_day, last_day))
+            report = PdfReport(db_manager, year_start, last_day, include_results=False)
+            seconds, _ = measure(lambda: report.write(pdf_path), repeat=3)
+            record(size, "pdf_export (год, только итоги)", seconds)
+        finally:
+            db_manager.close()
+        os.remove(db_path)
+    return results
+
+
+def suite_metadata(seed, sizes):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": seed,
+        "sizes": sizes,
+    }
+
+
+def make_row(i):
+    day = 1 + i % 28
+    return (f"2024-02-{day:02d}", "ТЛФ", "ОБК", i % 7, i % 5, "С 10:00 по 22:00", 1)
+
+
+def make_insert_parameters(row):
+    return (date_to_day(row[0]),) + row[1:]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return time.perf_counter() - start
+
+
+def bench_db_connection(db_path, inserts, searches):
+    # Поведение до ConnectionManager: новое соединение на каждый вызов.
+    def insert(i):
+        with db_connection(db_path) as connection:
+            connection.execute(INSERT_CORRESPONDENCE_SQL, make_insert_parameters(make_row(i)))
+            connection.commit()
+
+    def search(i):
+        with db_connection(db_path) as connection:
+            connection.execute(with_filters(SEARCH_CORRESPONDENCE_SQL)[0],
+                               (date_to_day("2024-02-01"), date_to_day("2024-02-07"))).fetchall()
+
+    return timed(insert, inserts), timed(search, searches)
+
+
+def bench_connection_manager(db_path, inserts, searches):
+    # Без кэша результатов: сравнивается работа с соединениями, а не попадания.
+    db_manager = DatabaseManager(db_path, result_cache=ResultCache(max_entries=0))
+    try:
+        insert_time = timed(lambda i: db_manager.add_correspondence(*make_row(i)), inserts)
+        search_time = timed(lambda i: db_manager.search_correspondence("2024-02-01", "2024-02-07"), searches)
+    finally:
+        db_manager.close()
+    return insert_time, search_time
+
+
+def prepare(db_path):
+    db_manager = DatabaseManager(db_path)
+    db_manager.create_tables()
+    db_manager.add_duty_dus("пр-к", "Иван", "Иванов", "Иванович")
+    db_manager.close()
+
+
+def uses_range_index(details, alias):
+    # Диапазон дат должен читаться по индексу: idx_correspondence_* для
+    # записей, первичный ключ (day, ...) или idx_correspondence_daily_* для свертки.
+    return any(detail.startswith(f"SEARCH {alias} USING ") and
+               ("INDEX idx_correspondence_" in detail or "PRIMARY KEY (day" in detail) for detail in details)
+
+
+def print_query_plans(db_path):
+    # Возвращает запросы, которые перестали использовать индексы по дате.
+    db_manager = DatabaseManager(db_path)
+    failures = []
+    try:
+        for name, sql, alias in (("search_correspondence", SEARCH_CORRESPONDENCE_SQL, "c"),
+                                 ("get_correspondence_count_by_type", CORRESPONDENCE_COUNT_BY_TYPE_SQL, "r")):
+            for filters in (None, SearchFilters(duty_dus_id=1), SearchFilters(urgency_id=1)):
+                sql_with_filters, parameters = with_filters(sql, filters, alias)
+                print(f"{name} {filters or ''}:")
+                days = [date_to_day("2024-02-01"), date_to_day("2024-02-07")]
+                details = db_manager.explain_query_plan(sql_with_filters, days + parameters)
+                for detail in details:
+                    print(f"    {detail}")
+                if not uses_range_index(details, alias):
+                    failures.append(f"{name} {filters or ''}".strip())
+    finally:
+        db_manager.close()
+    return failures
+
+
+def bench_pdf_report(db_path, rows, pdf_path):
+    db_manager = DatabaseManager(db_path)
+    try:
+        db_manager.add_correspondence_many(make_row(i) for i in range(rows))
+        report = PdfReport(db_manager, "2024-02-01", "2024-02-28", duty_dus_name="пр-к Иванов Иван Иванович")
+        start = time.perf_counter()
+        report.write(pdf_path)
+        return time.perf_counter() - start
+    finally:
+        db_manager.close()
+
+
+def bench_font_cache(db_path, exports, pdf_path, cache_dir):
+    # Первый прогон разбирает шрифты и пишет дисковый кэш, второй - как новый процесс.
+    db_manager = DatabaseManager(db_path)
+    try:
+        summaries = []
+        for _ in range(2):
+            font_cache = FontCache(cache_dir)
+            for _ in range(exports):
+                PdfReport(db_manager, "2024-02-01", "2024-02-01", font_cache=font_cache).write(pdf_path)
+            summaries.append(font_cache.summary())
+        return summaries
+    finally:
+        db_manager.close()
+
+
+def bench_storage(db_path, rows, seed):
+    # Одна и та же синтетическая база в схеме версии 4 и после перехода на
+    # версию 5; размер файла - после VACUUM, чтобы не учитывать свободные страницы.
+    db_manager = DatabaseManager(db_path)
+    try:
+        db_manager.migrate(LEGACY_SCHEMA_VERSION)
+        first_day, last_day = generate_data(db_manager, rows, seed)
+        results = []
+        for version, parameters in ((LEGACY_SCHEMA_VERSION, (first_day, last_day)),
+                                    (5, (date_to_day(first_day), date_to_day(last_day)))):
+            if version != LEGACY_SCHEMA_VERSION:
+                start = time.perf_counter()
+                db_manager.migrate(version)
+                results.append((f"миграция {LEGACY_SCHEMA_VERSION} -> {version}", time.perf_counter() - start, None))
+            db_manager.vacuum()
+            sql = STORAGE_AGGREGATE_SQL[version]
+            seconds, _ = measure(lambda: db_manager.connections.execute(sql, parameters).fetchall())
+            results.append((f"агрегация, схема {version}", seconds, os.path.getsize(db_path)))
+        return results
+    finally:
+        db_manager.close()
+
+
+def bench_import(db_path, rows, csv_path):
+    with open(csv_path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(IMPORT_FIELDS)
+        writer.writerows(make_row(i) for i in range(rows))
+    db_manager = DatabaseManager(db_path)
+    try:
+        start = time.perf_counter()
+        result = CorrespondenceImporter(db_manager).run(csv_path)
+        return time.perf_counter() - start, result
+    finally:
+        db_manager.close()
+
+
+def bench_table_export(db_path, rows, workdir, seed=1):
+    # Выгрузка всего диапазона синтетической базы в CSV и XLSX.
+    db_manager = DatabaseManager(db_path, result_cache=ResultCache(max_entries=0))
+    try:
+        db_manager.create_tables()
+        first_day, last_day = generate_data(db_manager, rows, seed)
+        results = []
+        for file_format in ("csv", "xlsx"):
+            path = os.path.join(workdir, f"export.{file_format}")
+            start = time.perf_counter()
+            REPORT_FORMATS[file_format](db_manager, first_day, last_day).write(path)
+            results.append((file_format, time.perf_counter() - start, os.path.getsize(path)))
+        return results
+    finally:
+        db_manager.close()
+
+
+def bench_batch_reports(db_path, rows, workdir, seed=1):
+    # PDF по каждому ДУС за последний месяц синтетической базы: в одном
+    # процессе и в пуле по числу ядер.
+    db_manager = DatabaseManager(db_path)
+    try:
+        db_manager.create_tables()
+        _, last_day = generate_data(db_manager, rows, seed)
+        first_day = (date.fromisoformat(last_day) - timedelta(days=29)).isoformat()
+        items = plan_batch_reports(db_manager, first_day, last_day, "duty_dus", output_dir=workdir)
+    finally:
+        db_manager.close()
+    results = []
+    for jobs in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        run_batch_reports(db_path, first_day, last_day, items, jobs=jobs)
+        results.append((jobs, len(items), time.perf_counter() - start))
+    return results
+
+
+def insert_latencies(db_manager, count, offset=0, until=None):
+    # Задержки add_correspondence, мс; until - продолжать, пока он не вернет True.
+    latencies = []
+    i = 0
+    while i < count or (until and not until()):
+        start = time.perf_counter()
+        db_manager.add_correspondence(*make_row(offset + i))
+        latencies.append((time.perf_counter() - start) * 1e3)
+        i += 1
+    return latencies
+
+
+def bench_backup(db_path, rows, workdir, seed=1, inserts=500):
+    # Снимок базы в фоновом потоке при непрерывном вводе: пропускная
+    # способность копирования и задержки вставки в сравнении с вводом без него.
+    db_manager = DatabaseManager(db_path)
+    try:
+        db_manager.create_tables()
+        generate_data(db_manager, rows, seed)
+        baseline = insert_latencies(db_manager, inserts)
+        results = [("без копирования", None, baseline)]
+        for label, compact in (("backup API", False), ("VACUUM INTO", True)):
+            done = threading.Event()
+            backup = {}
+
+            def run(compact=compact):
+                try:
+                    backup["result"] = db_manager.backup(os.path.join(workdir, "backups"), compact=compact)
+                finally:
+                    done.set()
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            latencies = insert_latencies(db_manager, inserts, len(baseline), until=done.is_set)
+            thread.join()
+            results.append((label, backup["result"], latencies))
+        return results
+    finally:
+        db_manager.close()
+
+
+def start_service(db_path, batch=None):
+    # Служба в отдельном процессе, как на узле связи; адрес - из первой строки вывода.
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.py"),
+               "--db", db_path, "serve", "--port", "0"]
+    if batch:
+        command += ["--batch", str(batch)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    return process, process.stdout.readline().rsplit(" ", 1)[-1].strip()
+
+
+def run_clients(make_client, clients, requests):
+    # Каждый клиент - рабочее место: вставки по одной, каждый десятый запрос - поиск.
+    latencies = [[] for _ in range(clients)]
+    errors = []
+
+    def work(number):
+        db_manager = make_client()
+        try:
+            for i in range(requests):
+                start = time.perf_counter()
+                if i % 10 == 9:
+                    db_manager.search_correspondence_page("2024-02-01", "2024-02-07")
+                else:
+                    db_manager.add_correspondence(*make_row(number * requests + i))
+                latencies[number].append((time.perf_counter() - start) * 1e3)
+        except sqlite3.Error as e:
+            errors.append(str(e))
+        finally:
+            db_manager.close()
+
+    threads = [threading.Thread(target=work, args=(number,)) for number in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, [value for values in latencies for value in values], errors
+
+
+def bench_service(workdir, clients, requests):
+    # Одни и те же клиенты: напрямую в файл базы (как сейчас), через службу
+    # с транзакцией на каждую запись и через службу с group commit.
+    from service import ServiceClient
+    results = []
+    for label, batch in (("напрямую в файл", None), ("служба, без пачек", 1), ("служба, group commit", None)):
+        db_path = os.path.join(workdir, f"service-{len(results)}.db")
+        prepare(db_path)
+        if label == "напрямую в файл":
+            elapsed, latencies, errors = run_clients(lambda: DatabaseManager(db_path), clients, requests)
+            results.append((label, elapsed, latencies, errors, None))
+            continue
+        process, url = start_service(db_path, batch)
+        try:
+            elapsed, latencies, errors = run_clients(lambda: ServiceClient(url), clients, requests)
+            stats = ServiceClient(url).stats()
+        finally:
+            process.terminate()
+            process.communicate()
+        results.append((label, elapsed, latencies, errors, stats))
+    return results
+
+
+def bench_startup():
+    # -X importtime пишет в stderr по строке на модуль; верхний уровень без отступа.
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import database"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1000
+    qt_modules = sorted(name for name in modules if name.startswith(("PyQt5", "fpdf")))
+    return modules.get("database", 0.0), qt_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности базы и отчетов")
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--plans", action="store_true", help="вывести EXPLAIN QUERY PLAN запросов поиска")
+    parser.add_argument("--pdf-rows", type=int, default=0, help="замерить PdfReport на указанном числе строк")
+    parser.add_argument("--exports", type=int, default=0, help="замерить кэш шрифтов на повторных выгрузках")
+    parser.add_argument("--startup", action="store_true",
+                        help=f"проверить импорт database.py по -X importtime (бюджет {STARTUP_BUDGET_MS} мс)")
+    parser.add_argument("--suite", action="store_true",
+                        help="прогнать набор замеров на синтетических базах размеров --sizes")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=SUITE_SIZES, help="размеры баз через запятую, до 10000000")
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора синтетических данных")
+    parser.add_argument("--json", help="файл для результатов --suite в формате JSON")
+    parser.add_argument("--generate", metavar="DB", help="заполнить базу DB синтетическими данными (--rows)")
+    parser.add_argument("--rows", type=int, default=100000, help="число записей для --generate и --storage")
+    parser.add_argument("--import-rows", type=int, default=0, help="замерить загрузку CSV на указанном числе строк")
+    parser.add_argument("--export-rows", type=int, default=0,
+                        help="замерить выгрузку CSV и XLSX на синтетической базе с указанным числом строк")
+    parser.add_argument("--batch", action="store_true",
+                        help="замерить пакетную выгрузку PDF по каждому ДУС за месяц синтетической базы (--rows)")
+    parser.add_argument("--backup", action="store_true",
+                        help="замерить резервное копирование при непрерывном вводе на синтетической базе (--rows)")
+    parser.add_argument("--service-clients", type=int, default=0,
+                        help="нагрузочный тест службы serve указанным числом одновременных клиентов")
+    parser.add_argument("--service-requests", type=int, default=200, help="запросов от каждого клиента")
+    parser.add_argument("--storage", action="store_true",
+                        help="сравнить размер базы и скорость агрегации для схем версий 4 и 5 (--rows)")
+    args = parser.parse_args()
+
+    if args.storage:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, seconds, size in bench_storage(os.path.join(tmp, "storage.db"), args.rows, args.seed):
+                print(f"{label:<22} {seconds * 1e3:10.1f} мс" + (f"  {size / 1e6:8.2f} МБ" if size else ""))
+        return
+
+    if args.backup:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, backup, latencies in bench_backup(os.path.join(tmp, "backup.db"), args.rows, tmp, args.seed):
+                quantiles = statistics.quantiles(latencies, n=100)
+                line = (f"{label:<16} вставка: p50 {quantiles[49]:6.2f} мс, p99 {quantiles[98]:6.2f} мс, "
+                        f"макс {max(latencies):6.2f} мс")
+                if backup:
+                    line += (f"; снимок {backup.size / 1e6:.1f} МБ за {backup.seconds:.2f} с "
+                             f"({backup.size / 1e6 / backup.seconds:.0f} МБ/с)")
+                print(line)
+        return
+
+    if args.service_clients:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = bench_service(tmp, args.service_clients, args.service_requests)
+        print(f"{args.service_clients} клиентов по {args.service_requests} запросов (каждый десятый - поиск)")
+        for label, elapsed, latencies, errors, stats in results:
+            quantiles = statistics.quantiles(latencies, n=100)
+            line = (f"{label:<22} {len(latencies) / elapsed:7.0f} запросов/с, p50 {quantiles[49]:7.2f} мс, "
+                    f"p99 {quantiles[98]:7.2f} мс, ошибок {len(errors)}")
+            if stats and stats["batches"]:
+                line += f", записей в транзакции {stats['requests'] / stats['batches']:.1f}"
+            print(line)
+        return
+
+    if args.generate:
+        db_manager = DatabaseManager(args.generate)
+        try:
+            db_manager.create_tables()
+            first_day, last_day = generate_data(db_manager, args.rows, args.seed)
+        finally:
+            db_manager.close()
+        print(f"{args.generate}: {args.rows} записей с {first_day} по {last_day}")
+        return
+
+    if args.suite:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_suite(args.sizes, args.seed, tmp)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as output:
+                json.dump({"meta": suite_metadata(args.seed, args.sizes), "results": results}, output,
+                          ensure_ascii=False, indent=2)
+        return
+
+    if args.startup:
+        import_ms, heavy_modules = bench_startup()
+        print(f"import database: {import_ms:.1f} мс (бюджет {STARTUP_BUDGET_MS} мс)")
+        if heavy_modules:
+            print(f"лишние модули при старте: {', '.join(heavy_modules)}")
+        if import_ms > STARTUP_BUDGET_MS or heavy_modules:
+            sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, bench in (("db_connection", bench_db_connection),
+                            ("ConnectionManager", bench_connection_manager)):
+            db_path = os.path.join(tmp, f"{name}.db")
+            prepare(db_path)
+            results[name] = bench(db_path, args.inserts, args.searches)
+        if args.plans:
+            plan_failures = print_query_plans(db_path)
+        if args.pdf_rows:
+            pdf_path = os.path.join(tmp, "report.pdf")
+            pdf_time = bench_pdf_report(db_path, args.pdf_rows, pdf_path)
+            pdf_size = os.path.getsize(pdf_path)
+        if args.import_rows:
+            import_time, import_result = bench_import(db_path, args.import_rows, os.path.join(tmp, "import.csv"))
+        if args.export_rows:
+            export_results = bench_table_export(os.path.join(tmp, "export.db"), args.export_rows, tmp, args.seed)
+        if args.batch:
+            batch_results = bench_batch_reports(os.path.join(tmp, "batch.db"), args.rows, tmp, args.seed)
+        if args.exports:
+            font_summaries = bench_font_cache(db_path, args.exports, os.path.join(tmp, "fonts.pdf"),
+                                              os.path.join(tmp, "fonts"))
+
+    print(f"SQLite {sqlite3.sqlite_version}, {args.inserts} вставок, {args.searches} поисков")
+    for name, (insert_time, search_time) in results.items():
+        print(f"{name:>18}: вставка {insert_time * 1e6 / args.inserts:8.1f} мкс/оп, "
+              f"поиск {search_time * 1e3 / args.searches:8.3f} мс/оп")
+    if args.pdf_rows:
+        print(f"PdfReport: {args.pdf_rows} строк за {pdf_time:.2f} с "
+              f"({args.pdf_rows / pdf_time:.0f} строк/с), {pdf_size / 1e6:.1f} МБ")
+    if args.import_rows:
+        print(f"Загрузка CSV: {import_result.inserted} строк за {import_time:.2f} с "
+              f"({import_result.inserted / import_time:.0f} строк/с), отклонено {import_result.rejected}")
+    if args.export_rows:
+        for file_format, seconds, size in export_results:
+            print(f"Выгрузка {file_format.upper()}: {args.export_rows} строк за {seconds:.2f} с "
+                  f"({args.export_rows / seconds:.0f} строк/с), {size / 1e6:.1f} МБ")
+    if args.batch:
+        for jobs, reports, seconds in batch_results:
+            print(f"Пакетная выгрузка, процессов {jobs}: {reports} отчетов за {seconds:.2f} с "
+                  f"({seconds / reports * 1e3:.0f} мс/отчет)")
+    if args.exports:
+        print(f"{args.exports} выгрузок, холодный кэш: {font_summaries[0]}")
+        print(f"{args.exports} выгрузок, дисковый кэш: {font_summaries[1]}")
+    if args.plans and plan_failures:
+        print(f"Запросы без индекса по дате: {'; '.join(plan_failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,218 @@
 import sys
-from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-                             QLineEdit, QPushButton, QComboBox, QTableWidget, QTableWidgetItem,
-                             QDateEdit, QTabWidget, QMessageBox, QFileDialog, QFormLayout, QCheckBox)
-from PyQt5.QtCore import QDate,Qt
+import argparse
+import bisect
+import concurrent.futures
+import copy
+import csv
+import functools
+import heapq
+import io
+import itertools
+import json
+import logging
+import logging.handlers
+import operator
+import os
+import pickle
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
 from contextlib import contextmanager
-from fpdf import FPDF
-from datetime import datetime
+from datetime import date as date_type, datetime, timedelta
+
+# PyQt5 и fpdf импортируются лениво: графический интерфейс живет в gui.py и
+# загружается только при запуске окна, fpdf - только при построении отчета.
+# Так командная строка (отчеты по cron, обслуживание базы) стартует без Qt.
+
+# Справочные значения формы добавления нагрузки.
+CORR_TYPES = ["ТЛФ", "ТЛГ", "ЗС СПД"]
+URGENCIES = [
+    "ОБК", "ДСП", "Секр.", "Срч.",
+    "Смл", "Ркт", "Воздух", "Мнлт",
+    "Секр. срч.", "Секр. смл.", "Секр. мнлт.",
+    "СС", "ОВ"
+]
+PERIODS = [
+    "С 10:00 по 22:00",
+    "С 22:00 по 10:00"
+]
+RANKS = ["ефр.", "пр-к", "ст. л-т"]
+
+# Настройки SQLite, применяемые к каждому соединению ConnectionManager.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# Размер кэша подготовленных выражений sqlite3 на одно соединение.
+CACHED_STATEMENTS = 256
+
+# Границы корзин гистограммы задержек, мс; последняя корзина - все, что дольше.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+SLOW_OPERATION_MS = 200
+SLOW_LOG_MAX_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+# Через сколько инструкций виртуальной машины SQLite вызывается progress handler.
+PROGRESS_STEP = 1000
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def add(self, seconds, rows=None):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if rows:
+            self.rows += rows
+
+    def percentile(self, fraction):
+        # Верхняя граница корзины, в которую попадает заданная доля замеров.
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return self.max * 1000
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "max_ms": self.max * 1000,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "rows": self.rows,
+            "buckets": dict(zip([f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["more"], self.buckets)),
+        }
+
+# Замеры операций DatabaseManager, отчетов и фаз GUI. Выключенный объект
+# сводится к одной проверке флага на операцию; во включенном соединения
+# получают trace callback и progress handler, которые считают выполненные
+# выражения и шаги VM текущей операции. Операции дольше slow_ms пишутся в
+# ротируемый журнал вместе с выражениями и их планами.
+class Instrumentation:
+    def __init__(self, enabled=False, slow_ms=SLOW_OPERATION_MS, log_path=None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.histograms = defaultdict(LatencyHistogram)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.logger = None
+        self.log_path = None
+        self.caches = []
+        if log_path:
+            self.set_log_path(log_path)
+
+    def register_cache(self, cache):
+        # Счетчики попаданий кэшей выводятся вместе с гистограммами.
+        if cache not in self.caches:
+            self.caches.append(cache)
+
+    def set_log_path(self, log_path, max_bytes=SLOW_LOG_MAX_BYTES, backup_count=SLOW_LOG_BACKUPS):
+        # Один обработчик на файл журнала, сколько бы объектов в него ни писало.
+        self.logger = logging.getLogger(f"correspondence.slow.{os.path.abspath(log_path)}")
+        if not self.logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                           backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+        self.log_path = log_path
+        self.enabled = True
+
+    def install(self, connection):
+        if self.enabled:
+            connection.set_trace_callback(self._trace)
+            connection.set_progress_handler(self._progress, PROGRESS_STEP)
+        else:
+            connection.set_trace_callback(None)
+            connection.set_progress_handler(None, PROGRESS_STEP)
+
+    def _trace(self, statement):
+        operation = getattr(self._local, "operation", None)
+        if operation is not None:
+            operation["statements"] += 1
+            if len(operation["sql"]) < 20:
+                operation["sql"].append(statement)
+
+    def _progress(self):
+        operation = getattr(self._local, "operation", None)
+        if operation is not None:
+            operation["vm_steps"] += PROGRESS_STEP
+        return 0
+
+    @contextmanager
+    def timed(self, name, explain=None):
+        if not self.enabled:
+            yield None
+            return
+        parent = getattr(self._local, "operation", None)
+        operation = {"rows": None, "statements": 0, "vm_steps": 0, "sql": []}
+        self._local.operation = operation
+        start = time.perf_counter()
+        try:
+            yield operation
+        finally:
+            elapsed = time.perf_counter() - start
+            self._local.operation = parent
+            if parent is not None:
+                parent["statements"] += operation["statements"]
+                parent["vm_steps"] += operation["vm_steps"]
+            self.record(name, elapsed, operation, explain)
+
+    def record(self, name, elapsed, operation, explain=None):
+        with self._lock:
+            self.histograms[name].add(elapsed, operation["rows"])
+        if elapsed * 1000 < self.slow_ms or not self.log_path:
+            return
+        self.logger.info("%s %.1f мс, строк: %s, выражений: %d, шагов VM: ~%d", name, elapsed * 1000,
+                         operation["rows"], operation["statements"], operation["vm_steps"])
+        for statement in operation["sql"]:
+            self.logger.info("    %s", " ".join(statement.split()))
+            if explain and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                for detail in explain(statement):
+                    self.logger.info("        %s", detail)
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())}
+
+    def format_summary(self):
+        lines = [f"{'операция':<40} {'вызовов':>8} {'всего мс':>10} {'p50':>6} {'p95':>6} {'макс мс':>9}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<40} {stats['count']:>8} {stats['total_ms']:>10.1f} {stats['p50_ms']:>6} "
+                         f"{stats['p95_ms']:>6} {stats['max_ms']:>9.1f}")
+        for cache in self.caches:
+            lines.append(cache.format_summary())
+        return "\n".join(lines)
+
+def instrumented(name):
+    # Замер метода DatabaseManager; для списков результата учитывается число строк.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with instrumentation.timed(name, self.explain_query_plan) as operation:
+                result = method(self, *args, **kwargs)
+                if isinstance(result, list):
+                    operation["rows"] = len(result)
+                return result
+        return wrapper
+    return decorator
 
 @contextmanager
 def db_connection(db_path):
@@ -16,545 +222,2459 @@ def db_connection(db_path):
     finally:
         connection.close()
 
+def read_only_uri(path):
+    from pathlib import Path
+    return Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+
+# Долгоживущие настроенные соединения, по одному на поток. Все записи идут
+# через transaction(): COMMIT при успехе, ROLLBACK при исключении, вложенные
+# вызовы объединяются во внешнюю транзакцию. after_commit() откладывает
+# действие (сброс кэшей) до COMMIT внешней транзакции: сброшенный раньше кэш
+# успел бы заполниться снимком без этой записи.
+class ConnectionManager:
+    def __init__(self, db_path, pragmas=None, cached_statements=CACHED_STATEMENTS, instrumentation=None,
+                 read_only=False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.instrumentation = instrumentation or Instrumentation()
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connect(self):
+        target = read_only_uri(self.db_path) if self.read_only else self.db_path
+        connection = sqlite3.connect(target, cached_statements=self.cached_statements, isolation_level=None,
+                                     check_same_thread=False, uri=self.read_only)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                connection.execute(f"PRAGMA {name} = {value}")
+        self.instrumentation.install(connection)
+        return connection
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            self._local.connection = connection
+            self._local.depth = 0
+            self._local.pending = []
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield connection
+            finally:
+                self._local.depth -= 1
+            return
+        self._local.depth = 1
+        self._local.pending = []
+        try:
+            connection.execute("BEGIN")
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+            pending, self._local.pending = self._local.pending, []
+        for callback in pending:
+            callback()
+
+    def after_commit(self, callback):
+        # Вне транзакции текущего потока выполняется сразу; при ROLLBACK отбрасывается.
+        if getattr(self._local, "depth", 0):
+            self._local.pending.append(callback)
+        else:
+            callback()
+
+    def execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def release(self):
+        # Закрывает соединение текущего потока, например перед его завершением.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return None
+        with self._lock:
+            self._connections.remove(connection)
+        connection.close()
+        del self._local.connection
+        return connection
+
+    def set_instrumentation(self, enabled):
+        self.instrumentation.enabled = enabled
+        with self._lock:
+            for connection in self._connections:
+                self.instrumentation.install(connection)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+# Даты принимаются в нескольких форматах и приводятся к 'YYYY-MM-DD'. С версии
+# схемы 5 correspondence хранит номер дня от 1970-01-01 (INTEGER): он короче
+# текста и так же подходит для диапазонных условий по индексу.
+DATE_FORMAT = "%Y-%m-%d"
+INPUT_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S",
+                      "%d.%m.%Y", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M")
+
+def normalize_date(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, date_type):
+        return value.strftime(DATE_FORMAT)
+    text = str(value).strip()
+    for date_format in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"Неизвестный формат даты: {value!r}")
+
+EPOCH_ORDINAL = date_type(1970, 1, 1).toordinal()
+
+def date_to_day(value):
+    return datetime.strptime(normalize_date(value), DATE_FORMAT).toordinal() - EPOCH_ORDINAL
+
+def day_to_date(day):
+    return date_type.fromordinal(day + EPOCH_ORDINAL).strftime(DATE_FORMAT)
+
+def _migrate_base_schema(connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS duty_dus (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rank TEXT NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            last_last_name TEXT NOT NULL
+        )
+    ''')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS correspondence (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            corr_type TEXT NOT NULL,
+            urgency TEXT NOT NULL,
+            incoming INTEGER,
+            outgoing INTEGER,
+            period TEXT NOT NULL,
+            duty_dus_id INTEGER,
+            FOREIGN KEY(duty_dus_id) REFERENCES duty_dus(id)
+        )
+    ''')
+
+def _migrate_normalize_dates(connection):
+    rows = connection.execute('''
+        SELECT id, date FROM correspondence
+        WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    ''').fetchall()
+    updates, rejected = [], []
+    for row_id, value in rows:
+        try:
+            updates.append((normalize_date(value), row_id))
+        except ValueError:
+            rejected.append((row_id, value))
+    connection.executemany('UPDATE correspondence SET date = ? WHERE id = ?', updates)
+    if rejected:
+        # Старые версии такие записи в запросы не включали. Они переносятся в
+        # correspondence_quarantine без изменений, чтобы их можно было исправить вручную.
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS correspondence_quarantine AS SELECT * FROM correspondence WHERE 0
+        ''')
+        connection.executemany('INSERT INTO correspondence_quarantine SELECT * FROM correspondence WHERE id = ?',
+                               [(row_id,) for row_id, _ in rejected])
+        connection.executemany('DELETE FROM correspondence WHERE id = ?', [(row_id,) for row_id, _ in rejected])
+        logging.getLogger("correspondence.migrate").warning(
+            "Записей с нераспознанной датой: %d, перенесены в correspondence_quarantine (id: %s)", len(rejected),
+            ", ".join(f"{row_id} ({value!r})" for row_id, value in rejected[:20]))
+
+def _migrate_date_indexes(connection):
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_correspondence_date ON correspondence (date)')
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS idx_correspondence_date_type_urgency
+        ON correspondence (date, corr_type, urgency)
+    ''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_correspondence_duty_dus ON correspondence (duty_dus_id)')
+
+# Суточная свертка нагрузки: одна строка на (день, период, тип, срочность,
+# ДУС). Поддерживается триггерами на correspondence, поэтому итоги за любой
+# диапазон читаются за O(дней x категорий), а не O(записей). Отсутствующий
+# ДУС хранится как 0, так как столбцы первичного ключа не допускают NULL.
+# TEXT_ROLLUP_* - свертка по текстовым столбцам схемы версии 4; с версии 5
+# ее заменяет свертка по справочникам (ROLLUP_*).
+TEXT_ROLLUP_KEY = "day, period, corr_type, urgency, duty_dus_id"
+
+TEXT_ROLLUP_ADD_SQL = '''
+    INSERT INTO correspondence_daily (day, period, corr_type, urgency, duty_dus_id, incoming, outgoing, row_count)
+    VALUES (NEW.date, NEW.period, NEW.corr_type, NEW.urgency, COALESCE(NEW.duty_dus_id, 0),
+            COALESCE(NEW.incoming, 0), COALESCE(NEW.outgoing, 0), 1)
+    ON CONFLICT (day, period, corr_type, urgency, duty_dus_id) DO UPDATE SET
+        incoming = incoming + excluded.incoming,
+        outgoing = outgoing + excluded.outgoing,
+        row_count = row_count + 1;
+'''
+
+TEXT_ROLLUP_SUBTRACT_SQL = '''
+    UPDATE correspondence_daily SET
+        incoming = incoming - COALESCE(OLD.incoming, 0),
+        outgoing = outgoing - COALESCE(OLD.outgoing, 0),
+        row_count = row_count - 1
+    WHERE day = OLD.date AND period = OLD.period AND corr_type = OLD.corr_type
+      AND urgency = OLD.urgency AND duty_dus_id = COALESCE(OLD.duty_dus_id, 0);
+    DELETE FROM correspondence_daily
+    WHERE day = OLD.date AND period = OLD.period AND corr_type = OLD.corr_type
+      AND urgency = OLD.urgency AND duty_dus_id = COALESCE(OLD.duty_dus_id, 0) AND row_count = 0;
+'''
+
+TEXT_ROLLUP_SOURCE_SQL = '''
+    SELECT date, period, corr_type, urgency, COALESCE(duty_dus_id, 0),
+           SUM(COALESCE(incoming, 0)), SUM(COALESCE(outgoing, 0)), COUNT(*)
+    FROM correspondence
+    GROUP BY date, period, corr_type, urgency, COALESCE(duty_dus_id, 0)
+'''
+
+def _migrate_daily_rollup(connection):
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS correspondence_daily (
+            day TEXT NOT NULL,
+            period TEXT NOT NULL,
+            corr_type TEXT NOT NULL,
+            urgency TEXT NOT NULL,
+            duty_dus_id INTEGER NOT NULL,
+            incoming INTEGER NOT NULL,
+            outgoing INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            PRIMARY KEY ({TEXT_ROLLUP_KEY})
+        ) WITHOUT ROWID
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_correspondence_daily_insert
+        AFTER INSERT ON correspondence BEGIN
+            {TEXT_ROLLUP_ADD_SQL}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_correspondence_daily_delete
+        AFTER DELETE ON correspondence BEGIN
+            {TEXT_ROLLUP_SUBTRACT_SQL}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_correspondence_daily_update
+        AFTER UPDATE ON correspondence BEGIN
+            {TEXT_ROLLUP_SUBTRACT_SQL}
+            {TEXT_ROLLUP_ADD_SQL}
+        END
+    ''')
+    connection.execute('DELETE FROM correspondence_daily')
+    connection.execute(f'INSERT INTO correspondence_daily {TEXT_ROLLUP_SOURCE_SQL}')
+
+# Справочники типов, срочностей и периодов дежурства (с версии 5). Порядок
+# id совпадает с порядком значений в форме добавления нагрузки.
+LOOKUP_TABLES = {
+    "corr_types": ("corr_type", CORR_TYPES),
+    "urgencies": ("urgency", URGENCIES),
+    "periods": ("period", PERIODS),
+}
+
+# Свертка по справочникам и номерам дней схемы версии 5.
+ROLLUP_KEY = "day, period_id, corr_type_id, urgency_id, duty_dus_id"
+
+ROLLUP_ADD_SQL = '''
+    INSERT INTO correspondence_daily (day, period_id, corr_type_id, urgency_id, duty_dus_id,
+                                      incoming, outgoing, row_count)
+    VALUES (NEW.day, NEW.period_id, NEW.corr_type_id, NEW.urgency_id, COALESCE(NEW.duty_dus_id, 0),
+            COALESCE(NEW.incoming, 0), COALESCE(NEW.outgoing, 0), 1)
+    ON CONFLICT (day, period_id, corr_type_id, urgency_id, duty_dus_id) DO UPDATE SET
+        incoming = incoming + excluded.incoming,
+        outgoing = outgoing + excluded.outgoing,
+        row_count = row_count + 1;
+'''
+
+ROLLUP_SUBTRACT_SQL = '''
+    UPDATE correspondence_daily SET
+        incoming = incoming - COALESCE(OLD.incoming, 0),
+        outgoing = outgoing - COALESCE(OLD.outgoing, 0),
+        row_count = row_count - 1
+    WHERE day = OLD.day AND period_id = OLD.period_id AND corr_type_id = OLD.corr_type_id
+      AND urgency_id = OLD.urgency_id AND duty_dus_id = COALESCE(OLD.duty_dus_id, 0);
+    DELETE FROM correspondence_daily
+    WHERE day = OLD.day AND period_id = OLD.period_id AND corr_type_id = OLD.corr_type_id
+      AND urgency_id = OLD.urgency_id AND duty_dus_id = COALESCE(OLD.duty_dus_id, 0) AND row_count = 0;
+'''
+
+ROLLUP_SOURCE_SQL = '''
+    SELECT day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0),
+           SUM(COALESCE(incoming, 0)), SUM(COALESCE(outgoing, 0)), COUNT(*)
+    FROM correspondence
+    GROUP BY day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0)
+'''
+
+def _rebuild_daily_rollup(connection):
+    connection.execute('DELETE FROM correspondence_daily')
+    connection.execute(f'INSERT INTO correspondence_daily {ROLLUP_SOURCE_SQL}')
+
+# Добавляет к свертке итоги записей с id > ?. Используется массовой
+# загрузкой, которая на время пакета снимает построчный триггер.
+ROLLUP_MERGE_SQL = f'''
+    INSERT INTO correspondence_daily ({ROLLUP_KEY}, incoming, outgoing, row_count)
+    SELECT day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0),
+           SUM(COALESCE(incoming, 0)), SUM(COALESCE(outgoing, 0)), COUNT(*)
+    FROM correspondence
+    WHERE id > ?
+    GROUP BY day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0)
+    ON CONFLICT ({ROLLUP_KEY}) DO UPDATE SET
+        incoming = incoming + excluded.incoming,
+        outgoing = outgoing + excluded.outgoing,
+        row_count = row_count + excluded.row_count
+'''
+
+# Снимает триггер свертки на время массовой операции; его SQL берется из
+# sqlite_master, и триггер создается заново в той же транзакции.
+@contextmanager
+def suspended_trigger(connection, name):
+    trigger_sql = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()[0]
+    connection.execute(f'DROP TRIGGER {name}')
+    yield connection
+    connection.execute(trigger_sql)
+
+def _migrate_normalized_storage(connection):
+    for table, (column, values) in LOOKUP_TABLES.items():
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+        connection.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(value,) for value in values])
+        # Значения, введенные в старых версиях и отсутствующие в форме, тоже сохраняются.
+        connection.execute(f'''
+            INSERT OR IGNORE INTO {table} (name)
+            SELECT DISTINCT {column} FROM correspondence ORDER BY {column}
+        ''')
+    for trigger in ("insert", "delete", "update"):
+        connection.execute(f'DROP TRIGGER IF EXISTS trg_correspondence_daily_{trigger}')
+    connection.execute('DROP TABLE IF EXISTS correspondence_daily')
+    connection.execute('''
+        CREATE TABLE correspondence_v5 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day INTEGER NOT NULL,
+            corr_type_id INTEGER NOT NULL REFERENCES corr_types(id),
+            urgency_id INTEGER NOT NULL REFERENCES urgencies(id),
+            incoming INTEGER,
+            outgoing INTEGER,
+            period_id INTEGER NOT NULL REFERENCES periods(id),
+            duty_dus_id INTEGER REFERENCES duty_dus(id)
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO correspondence_v5 (id, day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id)
+        SELECT c.id, CAST(julianday(c.date) - 2440587.5 AS INTEGER), t.id, u.id,
+               c.incoming, c.outgoing, p.id, c.duty_dus_id
+        FROM correspondence c
+        JOIN corr_types t ON t.name = c.corr_type
+        JOIN urgencies u ON u.name = c.urgency
+        JOIN periods p ON p.name = c.period
+        ORDER BY c.id
+    ''')
+    connection.execute('DROP TABLE correspondence')
+    connection.execute('ALTER TABLE correspondence_v5 RENAME TO correspondence')
+    connection.execute('CREATE INDEX idx_correspondence_day ON correspondence (day)')
+    connection.execute('''
+        CREATE INDEX idx_correspondence_day_type_urgency
+        ON correspondence (day, corr_type_id, urgency_id)
+    ''')
+    connection.execute('CREATE INDEX idx_correspondence_duty_dus ON correspondence (duty_dus_id)')
+    connection.execute(f'''
+        CREATE TABLE correspondence_daily (
+            day INTEGER NOT NULL,
+            period_id INTEGER NOT NULL,
+            corr_type_id INTEGER NOT NULL,
+            urgency_id INTEGER NOT NULL,
+            duty_dus_id INTEGER NOT NULL,
+            incoming INTEGER NOT NULL,
+            outgoing INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            PRIMARY KEY ({ROLLUP_KEY})
+        ) WITHOUT ROWID
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER trg_correspondence_daily_insert
+        AFTER INSERT ON correspondence BEGIN
+            {ROLLUP_ADD_SQL}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER trg_correspondence_daily_delete
+        AFTER DELETE ON correspondence BEGIN
+            {ROLLUP_SUBTRACT_SQL}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER trg_correspondence_daily_update
+        AFTER UPDATE ON correspondence BEGIN
+            {ROLLUP_SUBTRACT_SQL}
+            {ROLLUP_ADD_SQL}
+        END
+    ''')
+    _rebuild_daily_rollup(connection)
+
+# Состояние массовой загрузки по файлам: сколько записей файла уже обработано.
+# Обновляется в той же транзакции, что и пакет записей.
+def _migrate_import_progress(connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            inserted INTEGER NOT NULL,
+            rejected INTEGER NOT NULL,
+            finished INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+# Составные индексы под отбор на вкладке статистики: равенство по ДУС или
+# срочности плюс диапазон дней, в порядке (day, id) внутри значения. Отбор по
+# типу и периоду (3 и 2 значения) обходится индексом по дням.
+def _migrate_filter_indexes(connection):
+    connection.execute('DROP INDEX IF EXISTS idx_correspondence_duty_dus')
+    connection.execute('CREATE INDEX idx_correspondence_duty_dus_day ON correspondence (duty_dus_id, day)')
+    connection.execute('CREATE INDEX idx_correspondence_urgency_day ON correspondence (urgency_id, day)')
+    connection.execute('''
+        CREATE INDEX idx_correspondence_daily_duty_dus ON correspondence_daily (duty_dus_id, day)
+    ''')
+
+# Архивы закрытых периодов (с версии 8) - отдельные файлы рядом с базой, куда
+# перенесены записи correspondence. Границы - весь период архива, а не первый и
+# последний день с записями.
+def _migrate_archives(connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            name TEXT PRIMARY KEY,
+            start_day INTEGER NOT NULL,
+            end_day INTEGER NOT NULL,
+            row_count INTEGER NOT NULL
+        )
+    ''')
+
+# Журнал изменений по дням (с версии 9): триггеры свертки отмечают каждый
+# день, чьи итоги изменились, возрастающим номером seq. По нему ResultCache
+# любого процесса узнает, какие дни изменили другие соединения, и сбрасывает
+# только пересекающиеся с ними результаты. Свертку меняет любая запись в
+# correspondence, включая массовую загрузку и перенос в архив. Строка на
+# день, поэтому журнал не растет с числом записей.
+CHANGE_LOG_SQL = '''
+    INSERT INTO correspondence_changes (day, seq)
+    VALUES ({row}.day, (SELECT COALESCE(MAX(seq), 0) + 1 FROM correspondence_changes))
+    ON CONFLICT (day) DO UPDATE SET seq = excluded.seq;
+'''
+
+def _migrate_change_log(connection):
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS correspondence_changes (
+            day INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_correspondence_changes_seq ON correspondence_changes (seq)')
+    for trigger, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+        connection.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_correspondence_changes_{trigger}
+            AFTER {trigger.upper()} ON correspondence_daily BEGIN
+                {CHANGE_LOG_SQL.format(row=row)}
+            END
+        ''')
+
+# Шаги миграции схемы. Номер шага = значение PRAGMA user_version после его
+# выполнения; новые шаги добавляются только в конец списка.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_normalize_dates,
+    _migrate_date_indexes,
+    _migrate_daily_rollup,
+    _migrate_normalized_storage,
+    _migrate_import_progress,
+    _migrate_filter_indexes,
+    _migrate_archives,
+    _migrate_change_log,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# После этих шагов база перестраивается целиком, и VACUUM возвращает
+# освободившееся место.
+VACUUM_AFTER_VERSIONS = {5}
+
+# Имена ДУС в выборку не входят: строка несет duty_dus_id, а подписи берутся
+# из DutyDusDirectory.
+CORRESPONDENCE_COLUMNS_SQL = '''
+    date(c.day * 86400, 'unixepoch'), t.name, u.name, c.incoming, c.outgoing, p.name, c.duty_dus_id
+'''
+
+CORRESPONDENCE_JOINS_SQL = '''
+    FROM correspondence c
+    JOIN corr_types t ON t.id = c.corr_type_id
+    JOIN urgencies u ON u.id = c.urgency_id
+    JOIN periods p ON p.id = c.period_id
+'''
+
+# Запросы поиска и итогов - шаблоны: {filters} заменяется условиями отбора
+# (with_filters), параметры которых идут перед LIMIT.
+SearchFilters = namedtuple("SearchFilters", "corr_type_id urgency_id period_id duty_dus_id",
+                           defaults=(None, None, None, None))
+
+def with_filters(template, filters=None, alias="c"):
+    conditions, parameters = [], []
+    for column, value in zip(SearchFilters._fields, filters or SearchFilters()):
+        if value is not None:
+            conditions.append(f"AND {alias}.{column} = ?")
+            parameters.append(value)
+    return template.format(filters=" ".join(conditions)), parameters
+
+SEARCH_CORRESPONDENCE_SQL = f'''
+    SELECT {CORRESPONDENCE_COLUMNS_SQL}
+    {CORRESPONDENCE_JOINS_SQL}
+    WHERE c.day BETWEEN ? AND ? {{filters}}
+'''
+
+# Постраничная выборка по ключу (day, id): каждая страница начинается сразу
+# за последней строкой предыдущей, без OFFSET, поэтому стоимость не растет с
+# глубиной прокрутки. Нижняя граница диапазона сдвигается до дня последней
+# строки, чтобы поиск по индексу начинался с нее.
+SEARCH_CORRESPONDENCE_PAGE_SQL = f'''
+    SELECT c.id, {CORRESPONDENCE_COLUMNS_SQL}
+    {CORRESPONDENCE_JOINS_SQL}
+    WHERE c.day BETWEEN ? AND ? AND (c.day > ? OR c.id > ?) {{filters}}
+    ORDER BY c.day, c.id
+    LIMIT ?
+'''
+
+SEARCH_PAGE_SIZE = 500
+
+# Та же постраничная выборка с id справочников вместо имен - для выгрузок:
+# имена подставляются по словарям в Python, что на миллионе строк заметно
+# быстрее трех JOIN на каждую строку.
+CORRESPONDENCE_IDS_PAGE_SQL = '''
+    SELECT c.id, c.day, c.corr_type_id, c.urgency_id, c.incoming, c.outgoing, c.period_id, c.duty_dus_id
+    FROM correspondence c
+    WHERE c.day BETWEEN ? AND ? AND (c.day > ? OR c.id > ?) {filters}
+    ORDER BY c.day, c.id
+    LIMIT ?
+'''
+
+EXPORT_PAGE_SIZE = 5000
+
+def merge_pages(cursors, limit):
+    # Страница каждого раздела (горячая база, архивы) уже упорядочена по
+    # (day, id); общая страница - первые limit строк их слияния.
+    if len(cursors) == 1:
+        return cursors[0].fetchall()
+    return list(itertools.islice(heapq.merge(*cursors, key=lambda row: (row[1], row[0])), limit))
+
+CORRESPONDENCE_COUNT_BY_TYPE_SQL = '''
+    SELECT t.name, u.name, SUM(r.incoming) AS incoming_total, SUM(r.outgoing) AS outgoing_total
+    FROM correspondence_daily r
+    JOIN corr_types t ON t.id = r.corr_type_id
+    JOIN urgencies u ON u.id = r.urgency_id
+    WHERE r.day BETWEEN ? AND ? {filters}
+    GROUP BY r.corr_type_id, r.urgency_id
+'''
+
+# Число записей по свертке: row_count уже посчитан по дням и категориям.
+CORRESPONDENCE_COUNT_SQL = '''
+    SELECT COALESCE(SUM(r.row_count), 0) FROM correspondence_daily r WHERE r.day BETWEEN ? AND ? {filters}
+'''
+
+# Аналитика нагрузки читает свертку одним проходом по первичному ключу, а
+# все разрезы (категории, подытоги по типу, общий итог, дни, смены, ДУС)
+# накапливает aggregate_load по ходу чтения, без отдельного GROUP BY на каждый.
+LOAD_ANALYTICS_SQL = '''
+    SELECT r.day, r.period_id, r.corr_type_id, r.urgency_id, r.duty_dus_id, r.incoming, r.outgoing, r.row_count
+    FROM correspondence_daily r
+    WHERE r.day BETWEEN ? AND ? {filters}
+'''
+
+def sum_by_key(rows, key_size, order=None):
+    # Складывает итоги строк с одинаковыми первыми key_size полями.
+    totals = {}
+    for row in rows:
+        key = tuple(row[:key_size])
+        current = totals.get(key)
+        totals[key] = tuple(row[key_size:]) if current is None else tuple(map(operator.add, current, row[key_size:]))
+    return tuple(key + value for key, value in sorted(totals.items(), key=order))
+
+def lookup_order(*values_lists):
+    # Ключ сортировки строк в порядке справочников (CORR_TYPES, ...); значения
+    # не из списка идут после известных.
+    positions = [{value: i for i, value in enumerate(values)} for values in values_lists]
+    return lambda item: [(position.get(value, len(position)), value)
+                         for position, value in zip(positions, item[0])]
+
+# Каждая строка разреза заканчивается итогами: входящая, исходящая, записей.
+LoadAnalytics = namedtuple("LoadAnalytics", "categories type_totals grand_total days shifts duty_dus")
+
+def aggregate_load(rows, corr_types, urgencies, periods):
+    # corr_types, urgencies, periods - словари id -> имя.
+    categories, shifts, duty_dus = {}, {}, {}
+    for day, period_id, corr_type_id, urgency_id, duty_dus_id, incoming, outgoing, row_count in rows:
+        totals = categories.get((corr_type_id, urgency_id))
+        if totals is None:
+            totals = categories[corr_type_id, urgency_id] = [0, 0, 0]
+        totals[0] += incoming
+        totals[1] += outgoing
+        totals[2] += row_count
+        totals = shifts.get((day, period_id))
+        if totals is None:
+            totals = shifts[day, period_id] = [0, 0, 0]
+        totals[0] += incoming
+        totals[1] += outgoing
+        totals[2] += row_count
+        totals = duty_dus.get(duty_dus_id)
+        if totals is None:
+            totals = duty_dus[duty_dus_id] = [0, 0, 0]
+        totals[0] += incoming
+        totals[1] += outgoing
+        totals[2] += row_count
+
+    # Подытоги, общий итог и ряд по дням складываются из уже свернутых
+    # разрезов: в них десятки и сотни строк, а не вся свертка.
+    type_totals, days, grand_total = defaultdict(lambda: [0, 0, 0]), defaultdict(lambda: [0, 0, 0]), [0, 0, 0]
+    for (corr_type_id, _), totals in categories.items():
+        for i, value in enumerate(totals):
+            type_totals[corr_type_id][i] += value
+            grand_total[i] += value
+    for (day, _), totals in shifts.items():
+        for i, value in enumerate(totals):
+            days[day][i] += value
+
+    return LoadAnalytics(
+        tuple((corr_types[corr_type_id], urgencies[urgency_id], *totals)
+              for (corr_type_id, urgency_id), totals in sorted(categories.items())),
+        tuple((corr_types[corr_type_id], *totals) for corr_type_id, totals in sorted(type_totals.items())),
+        tuple(grand_total),
+        tuple((day_to_date(day), *totals) for day, totals in sorted(days.items())),
+        tuple((day_to_date(day), periods[period_id], *totals) for (day, period_id), totals in sorted(shifts.items())),
+        tuple((duty_dus_id, *totals) for duty_dus_id, totals in sorted(duty_dus.items())))
+
+# Вставка с уже разрешенными номером дня и id справочников (массовая загрузка).
+INSERT_CORRESPONDENCE_IDS_SQL = '''
+    INSERT INTO correspondence (day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Значения справочников передаются по имени; неизвестное имя дает NULL и
+# ошибку NOT NULL constraint, как и любое другое нарушение схемы.
+INSERT_CORRESPONDENCE_SQL = '''
+    INSERT INTO correspondence (day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id)
+    VALUES (?, (SELECT id FROM corr_types WHERE name = ?), (SELECT id FROM urgencies WHERE name = ?), ?, ?,
+            (SELECT id FROM periods WHERE name = ?), ?)
+'''
+
+DutyDus = namedtuple("DutyDus", "id rank first_name last_name last_last_name full_name short_name")
+
+# Справочник ДУС в памяти с готовыми подписями. Перечитывается, только если
+# PRAGMA data_version соединения показывает запись из другого соединения или
+# DatabaseManager сам изменил duty_dus (такую запись data_version своего
+# соединения не отражает). Значения data_version разных соединений не
+# сравнимы, поэтому последнее увиденное хранится для каждого соединения.
+class DutyDusDirectory:
+    def __init__(self, connections):
+        self.connections = connections
+        self.entries = {}
+        self.data_versions = {}
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        with self.lock:
+            self.data_versions.clear()
+
+    def forget(self, connection):
+        with self.lock:
+            self.data_versions.pop(connection, None)
+
+    def refresh(self):
+        connection = self.connections.connection
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        with self.lock:
+            if self.data_versions.get(connection) == data_version:
+                return False
+            rows = connection.execute('''
+                SELECT id, rank, first_name, last_name, last_last_name FROM duty_dus ORDER BY id
+            ''').fetchall()
+            self.entries = {row[0]: DutyDus(*row, format_duty_dus_full(row), format_duty_dus_short(*row[1:]))
+                            for row in rows}
+            self.data_versions[connection] = data_version
+            return True
+
+    def list(self):
+        self.refresh()
+        return list(self.entries.values())
+
+    def get(self, duty_dus_id):
+        self.refresh()
+        return self.entries.get(duty_dus_id)
+
+    def short_name(self, duty_dus_id):
+        # Без проверки data_version: вызывается на каждую строку, refresh
+        # выполняется при выборке страницы.
+        duty_dus = self.entries.get(duty_dus_id)
+        return duty_dus.short_name if duty_dus else ""
+
+# Ограничения ResultCache: число запросов и суммарное число строк в кэше.
+RESULT_CACHE_ENTRIES = 128
+RESULT_CACHE_ROWS = 200000
+
+# LRU-кэш результатов запросов по диапазону дат. Ключ - имя запроса, номера
+# дней и параметры; с каждым результатом хранится диапазон [start_day,
+# end_day], и запись через DatabaseManager удаляет только пересекающиеся с
+# ее днями результаты. Записи других соединений и процессов видны по PRAGMA
+# data_version отдельного соединения, которое само ничего не пишет; их дни
+# берутся из журнала correspondence_changes. Если журнал короче уже
+# прочитанного (база восстановлена из снимка), кэш очищается целиком.
+# Результат, вычисленный во время инвалидации, не сохраняется (generation).
+class ResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_rows=RESULT_CACHE_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.generation = 0
+        self.data_version = None
+        self.change_seq = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def check_changes(self, version_connection):
+        # version_connection общее для потоков и используется только под self.lock.
+        with self.lock:
+            data_version = version_connection.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version:
+                return
+            self.data_version = data_version
+            change_seq = version_connection.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM correspondence_changes').fetchone()[0]
+            if self.change_seq is not None and change_seq < self.change_seq:
+                self._remove(list(self.entries))
+            elif self.change_seq is not None and change_seq > self.change_seq:
+                days = [day for (day,) in version_connection.execute('''
+                    SELECT day FROM correspondence_changes WHERE seq > ? AND seq <= ? ORDER BY day
+                ''', (self.change_seq, change_seq))]
+                self._remove([key for key, (first, last, *_) in self.entries.items()
+                              if bisect.bisect_left(days, first) < bisect.bisect_right(days, last)])
+            self.change_seq = change_seq
+
+    def get(self, version_connection, key, start_day, end_day, compute):
+        self.check_changes(version_connection)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                # Списки хранятся кортежами, чтобы вызывающий не изменил кэш;
+                # кортежи-результаты (LoadAnalytics) возвращаются как есть.
+                return list(entry[2]) if entry[4] else entry[2]
+            self.misses += 1
+            generation = self.generation
+        result = compute()
+        size = len(result) if isinstance(result, list) else 1
+        with self.lock:
+            if generation == self.generation and size <= self.max_rows:
+                is_list = isinstance(result, list)
+                self.entries[key] = (start_day, end_day, tuple(result) if is_list else result, size, is_list)
+                self.rows += size
+                while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+                    _, (_, _, _, evicted, _) = self.entries.popitem(last=False)
+                    self.rows -= evicted
+        return result
+
+    def invalidate(self, start_day=None, end_day=None):
+        # Без аргументов - весь кэш.
+        with self.lock:
+            self._remove([key for key, (first, last, *_) in self.entries.items()
+                          if start_day is None or (first <= end_day and start_day <= last)])
+
+    def _remove(self, keys):
+        self.generation += 1
+        for key in keys:
+            self.rows -= self.entries.pop(key)[3]
+        self.invalidated += len(keys)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidated": self.invalidated,
+                    "entries": len(self.entries), "rows": self.rows}
+
+    def format_summary(self):
+        stats = self.stats()
+        requests = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / requests * 100 if requests else 0.0
+        return (f"кэш результатов: попаданий {stats['hits']}, промахов {stats['misses']} ({ratio:.0f}%), "
+                f"сброшено {stats['invalidated']}, записей {stats['entries']}, строк {stats['rows']}")
+
+# Архивы закрытых периодов: записи года (или месяца) переносятся в файл
+# <база>_archive_<период>.db рядом с базой и регистрируются в таблице archives.
+# Архив открывается только для чтения и только запросами, диапазон которых
+# пересекается с его периодом.
+ARCHIVE_GRANULARITIES = ("year", "month")
+# В архиве нет WAL: файл не меняется между переносами и копируется целиком.
+ARCHIVE_PRAGMAS = {"journal_mode": "DELETE"}
+
+def partition_bounds(day, granularity="year"):
+    # Имя периода, его первый и последний день для дня day.
+    value = date_type.fromordinal(day + EPOCH_ORDINAL)
+    if granularity == "year":
+        key, first, last = f"{value.year}", value.replace(month=1, day=1), value.replace(month=12, day=31)
+    elif granularity == "month":
+        key, first = value.strftime("%Y-%m"), value.replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    else:
+        raise ValueError(f"Неизвестный период архива: {granularity}")
+    return key, first.toordinal() - EPOCH_ORDINAL, last.toordinal() - EPOCH_ORDINAL
+
+# Резервные копии: каталог на снимок с базой и ее архивами, рядом с базой в
+# BACKUP_DIR_NAME. Копирование идет шагами по BACKUP_STEP_PAGES страниц с
+# паузой между ними, хранятся BACKUP_KEEP последних снимков.
+BACKUP_DIR_NAME = "backups"
+BACKUP_STEP_PAGES = 1024
+BACKUP_STEP_PAUSE = 0.005
+BACKUP_KEEP = 7
+BackupResult = namedtuple("BackupResult", "path size seconds")
+
+def snapshot_files(snapshot_path):
+    # Файл базы снимка и архивы, на которые ссылается его таблица archives.
+    connection = sqlite3.connect(read_only_uri(snapshot_path), uri=True)
+    try:
+        names = [name for (name,) in connection.execute('SELECT name FROM archives ORDER BY start_day')]
+    except sqlite3.OperationalError:
+        names = []
+    finally:
+        connection.close()
+    return [snapshot_path] + [os.path.join(os.path.dirname(snapshot_path), name) for name in names]
+
+def verify_snapshot(snapshot_path):
+    # PRAGMA integrity_check для базы снимка и каждого архива.
+    if not os.path.isfile(snapshot_path):
+        raise sqlite3.DatabaseError(f"Нет файла снимка {snapshot_path}")
+    for path in snapshot_files(snapshot_path):
+        if not os.path.exists(path):
+            raise sqlite3.DatabaseError(f"В снимке нет файла {os.path.basename(path)}")
+        connection = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+        finally:
+            connection.close()
+        if problems != ["ok"]:
+            raise sqlite3.DatabaseError(f"{os.path.basename(path)}: {'; '.join(problems[:5])}")
+
 class DatabaseManager:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pragmas=None, instrumentation=None, result_cache=None, read_only=False):
         self.db_path = db_path
+        self.instrumentation = instrumentation or Instrumentation()
+        self.connections = ConnectionManager(db_path, pragmas, instrumentation=self.instrumentation,
+                                             read_only=read_only)
+        self.duty_dus = DutyDusDirectory(self.connections)
+        self.result_cache = result_cache or ResultCache()
+        self.instrumentation.register_cache(self.result_cache)
+        self.archives = {}
+        self.archives_lock = threading.Lock()
+        self.version_connection = None
+        self.version_lock = threading.Lock()
+
+    def data_version_connection(self):
+        # Отдельное соединение для PRAGMA data_version кэша результатов.
+        with self.version_lock:
+            if self.version_connection is None:
+                read_only = self.connections.read_only
+                self.version_connection = sqlite3.connect(read_only_uri(self.db_path) if read_only else self.db_path,
+                                                          isolation_level=None, check_same_thread=False,
+                                                          uri=read_only)
+            return self.version_connection
+
+    def invalidate_cached(self, start_day=None, end_day=None):
+        self.connections.after_commit(functools.partial(self.result_cache.invalidate, start_day, end_day))
+
+    def cached(self, key, start_day, end_day, compute):
+        return self.result_cache.get(self.data_version_connection(), key, start_day, end_day, compute)
+
+    def close(self):
+        self.connections.close()
+        self.close_archives()
+        with self.version_lock:
+            if self.version_connection is not None:
+                self.version_connection.close()
+                self.version_connection = None
+
+    def close_archives(self, names=None):
+        with self.archives_lock:
+            closed = [self.archives.pop(name) for name in list(self.archives) if names is None or name in names]
+        for archive in closed:
+            archive.close()
+
+    def release_connections(self):
+        # Соединения текущего потока с базой и архивами: службе (service.py)
+        # поток на каждое подключение клиента, и соединения не должны копиться.
+        connection = self.connections.release()
+        if connection is not None:
+            self.duty_dus.forget(connection)
+        with self.archives_lock:
+            archives = list(self.archives.values())
+        for archive in archives:
+            archive.release()
+
+    def archive_path(self, name):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), name)
+
+    def partitions(self, start_day, end_day):
+        # Горячая база (в ней бывают и записи, внесенные задним числом) и архивы,
+        # период которых пересекается с диапазоном.
+        names = [name for (name,) in self.connections.execute(
+            'SELECT name FROM archives WHERE start_day <= ? AND end_day >= ? ORDER BY start_day',
+            (end_day, start_day))]
+        partitions = [self.connections]
+        with self.archives_lock:
+            for name in names:
+                archive = self.archives.get(name)
+                if archive is None:
+                    archive = self.archives[name] = ConnectionManager(
+                        self.archive_path(name), ARCHIVE_PRAGMAS, instrumentation=self.instrumentation, read_only=True)
+                partitions.append(archive)
+        return partitions
+
+    def execute_partitions(self, start_day, end_day, sql, parameters):
+        return [partition.execute(sql, parameters) for partition in self.partitions(start_day, end_day)]
+
+    def schema_version(self):
+        return self.connections.execute('PRAGMA user_version').fetchone()[0]
+
+    @instrumented("migrate")
+    def migrate(self, target=SCHEMA_VERSION):
+        if not 0 <= target <= SCHEMA_VERSION:
+            raise ValueError(f"Неизвестная версия схемы: {target} (поддерживаются 0-{SCHEMA_VERSION})")
+        with self.connections.transaction() as connection:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(
+                    f"Версия схемы базы ({version}) новее поддерживаемой ({SCHEMA_VERSION})")
+            applied = range(version + 1, max(version, target) + 1)
+            for number in applied:
+                MIGRATIONS[number - 1](connection)
+                connection.execute(f'PRAGMA user_version = {number}')
+        if applied:
+            self.result_cache.invalidate()
+        if VACUUM_AFTER_VERSIONS.intersection(applied):
+            self.vacuum()
+
+    def vacuum(self):
+        self.connections.execute('VACUUM')
 
     def create_tables(self):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS duty_dus (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    rank TEXT NOT NULL,
-                    first_name TEXT NOT NULL,
-                    last_name TEXT NOT NULL,
-                    last_last_name TEXT NOT NULL
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS correspondence (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    corr_type TEXT NOT NULL,
-                    urgency TEXT NOT NULL,
-                    incoming INTEGER,
-                    outgoing INTEGER,
-                    period TEXT NOT NULL,
-                    duty_dus_id INTEGER,
-                    FOREIGN KEY(duty_dus_id) REFERENCES duty_dus(id)
-                )
-            ''')
-
+        self.migrate()
+
+    @instrumented("rebuild_daily_totals")
+    def rebuild_daily_totals(self):
+        with self.connections.transaction() as connection:
+            _rebuild_daily_rollup(connection)
+        self.result_cache.invalidate()
+
+    def verify_daily_totals(self):
+        # Строки, в которых свертка расходится с исходными данными.
+        cursor = self.connections.execute(f'''
+            WITH expected AS ({ROLLUP_SOURCE_SQL}),
+                 actual AS (SELECT {ROLLUP_KEY}, incoming, outgoing, row_count FROM correspondence_daily)
+            SELECT 'expected', * FROM (SELECT * FROM expected EXCEPT SELECT * FROM actual)
+            UNION ALL
+            SELECT 'actual', * FROM (SELECT * FROM actual EXCEPT SELECT * FROM expected)
+        ''')
+        return cursor.fetchall()
+
+    def explain_query_plan(self, sql, parameters=()):
+        cursor = self.connections.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+        return [row[-1] for row in cursor.fetchall()]
+
+    def set_instrumentation(self, enabled):
+        self.connections.set_instrumentation(enabled)
+        with self.archives_lock:
+            for archive in self.archives.values():
+                archive.set_instrumentation(enabled)
+
+    @instrumented("add_duty_dus")
     def add_duty_dus(self, rank, first_name, last_name, last_last_name):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('''
+        with self.connections.transaction() as connection:
+            connection.execute('''
                 INSERT INTO duty_dus (rank, first_name, last_name, last_last_name)
                 VALUES (?, ?, ?, ?)
             ''', (rank, first_name, last_name, last_last_name))
+        self.connections.after_commit(self.duty_dus.invalidate)
 
-    def add_correspondence(self, date, corr_type, urgency, incoming, outgoing, period, duty_dus_id):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('''
-                INSERT INTO correspondence (date, corr_type, urgency, incoming, outgoing, period, duty_dus_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (date, corr_type, urgency, incoming, outgoing, period, duty_dus_id))
-
-    def update_duty_dus_list(self):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('SELECT id, rank, first_name, last_name, last_last_name FROM duty_dus')
-            return cursor.fetchall()
-
-    def search_correspondence(self, start_date, end_date):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('''
-                SELECT c.date, c.corr_type, c.urgency, c.incoming, c.outgoing, c.period,
-                       d.rank, d.first_name, d.last_name, d.last_last_name
-                FROM correspondence c
-                JOIN duty_dus d ON c.duty_dus_id = d.id
-                WHERE date(c.date) BETWEEN date(?) AND date(?)
-            ''', (start_date, end_date))
-            return cursor.fetchall()
-
-    def get_correspondence_count_by_type(self, start_date, end_date):
-        with db_connection(self.db_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute('''
-                SELECT corr_type, urgency, SUM(incoming) AS incoming_total, SUM(outgoing) AS outgoing_total
-                FROM correspondence
-                WHERE date(date) BETWEEN date(?) AND date(?)
-                GROUP BY corr_type, urgency
-            ''', (start_date, end_date))
-            return cursor.fetchall()
-
-class CorrespondenceApp(QWidget):
-    def __init__(self, db_path):
-        super().__init__()
-        self.db_path = db_path
-        self.db_manager = DatabaseManager(db_path)
-        self.init_ui()
-        self.create_tables()
-        self.update_export_duty_dus_list()
-
-    def init_ui(self):
-        self.setWindowTitle("Система учета корреспонденции")
-        main_layout = QVBoxLayout()
-        self.setLayout(main_layout)
-
-        tab_widget = QTabWidget()
-        main_layout.addWidget(tab_widget)
-
-        self.create_add_correspondence_tab(tab_widget)
-        self.create_manage_duty_dus_tab(tab_widget)
-        self.create_search_correspondence_tab(tab_widget)
-
-        self.setStyleSheet(self.get_stylesheet())
-
-    def get_stylesheet(self):
-        stylesheet = """
-            QWidget {
-                font-family: Arial;
-                font-size: 11pt;
-            }
-
-            QTabWidget {
-                border: none;
-            }
-
-            QTabWidget::pane {
-                border: none;
-            }
-
-            QTabBar::tab {
-                margin-left: 5px;
-                margin-right: 5px;
-                padding: 5px;
-                border-top-left-radius: 5px;
-                border-top-right-radius: 5px;
-                border: 1px solid #ccc;
-                color: #555;
-            }
-
-            QTabBar::tab:selected {
-                background-color: #f0f0f0;
-                border-bottom-color: #f0f0f0;
-                color: #333;
-            }
-
-            QPushButton {
-                border: 1px solid #555;
-                border-radius: 5px;
-                padding: 5px;
-            }
-
-            QPushButton:hover {
-                background-color: #f4f4f4;
-            }
-
-            QPushButton:pressed {
-                background-color: #eaeaea;
-            }
-
-            QLineEdit, QDateEdit, QComboBox {
-                border:hover {
-                    border: 1px solid #aaa;
-                }
-                border: 1px solid #ccc;
-                border-radius: 3px;
-                padding: 3px;
-            }
-
-            QTableWidget {
-                border: 1px solid #ccc;
-            }
-
-            QTableWidget::item {
-                border-bottom: 1px solid #ddd;
-                border-right: 1px solid #ddd;
-                padding: 5px;
-            }
-
-            QHeaderView::section {
-                background-color: #f0f0f0;
-                border: 1px solid #ccc;
-                padding: 3px;
-            }
-        """
-        return stylesheet
-
-    def create_add_correspondence_tab(self, tab_widget):
-        add_correspondence_tab = QWidget()
-        layout = QFormLayout()
-        add_correspondence_tab.setLayout(layout)
-
-        self.date_input = QDateEdit()
-        self.date_input.setDate(QDate.currentDate())
-        self.date_input.setCalendarPopup(True)
-
-        layout.addRow(QLabel("Дата:"), self.date_input)
-
-        self.corr_type_input = QComboBox()
-        self.corr_type_input.addItems(["ТЛФ", "ТЛГ", "ЗС СПД"])
-
-        layout.addRow(QLabel("Тип информации:"), self.corr_type_input)
-
-        self.urgency_input = QComboBox()
-        self.urgency_input.addItems([
-            "ОБК", "ДСП", "Секр.", "Срч.",
-            "Смл", "Ркт", "Воздух", "Мнлт",
-            "Секр. срч.", "Секр. смл.", "Секр. мнлт.",
-            "СС", "ОВ"
-        ])
-
-        layout.addRow(QLabel("Срочность:"), self.urgency_input)
-
-        self.incoming_input = QLineEdit()
-        layout.addRow(QLabel("Кол-во входящих:"), self.incoming_input)
-
-        self.outgoing_input = QLineEdit()
-        layout.addRow(QLabel("Кол-во исходящих:"), self.outgoing_input)
-
-        self.period_input = QComboBox()  # Создайте объект QComboBox перед использованием
-        self.period_input.addItems([
-            "С 10:00 по 22:00",
-            "С 22:00 по 10:00"
-        ])
-
-        layout.addRow(QLabel("Период дежурства:"), self.period_input)
-
-        self.duty_dus_input = QComboBox()
-        layout.addRow(QLabel("ДУС:"), self.duty_dus_input)
-
-
-        add_button = QPushButton("Добавить")
-        add_button.clicked.connect(self.add_correspondence)
-        layout.addRow(add_button)
-
-        tab_widget.addTab(add_correspondence_tab, "Добавлении нагрузки")
-    def create_manage_duty_dus_tab(self, tab_widget):
-        manage_duty_dus_tab = QWidget()
-        layout = QVBoxLayout()
-        manage_duty_dus_tab.setLayout(layout)
-
-        add_layout = QVBoxLayout()
-        add_layout.addWidget(QLabel("Добавить дежурного по узлу связи"))
-        layout.addLayout(add_layout)
-
-        rank_layout = QHBoxLayout()
-        rank_layout.addWidget(QLabel("Звание:"))
-        self.rank_input = QComboBox()
-        self.rank_input.addItems(["ефр.", "пр-к", "ст. л-т"])
-        rank_layout.addWidget(self.rank_input)
-        add_layout.addLayout(rank_layout)
-
-        name_layout = QHBoxLayout()
-        name_layout.addWidget(QLabel("Имя:"))
-        self.first_name_input = QLineEdit()
-        name_layout.addWidget(self.first_name_input)
-        add_layout.addLayout(name_layout)
-
-        last_name_layout = QHBoxLayout()
-        last_name_layout.addWidget(QLabel("Фамилия:"))
-        self.last_name_input = QLineEdit()
-        last_name_layout.addWidget(self.last_name_input)
-        add_layout.addLayout(last_name_layout)
-
-        last_last_name_layout = QHBoxLayout()
-        last_last_name_layout.addWidget(QLabel("Отчество:"))
-        self.last_last_name_input = QLineEdit()
-        last_last_name_layout.addWidget(self.last_last_name_input)
-        add_layout.addLayout(last_last_name_layout)
-
-        add_button = QPushButton("Добавить")
-        add_button.clicked.connect(self.add_duty_dus)
-        add_layout.addWidget(add_button)
-
-        delete_layout = QVBoxLayout()
-        delete_layout.addWidget(QLabel("Удаление дежурного по узлу связи"))
-        layout.addLayout(delete_layout)
-
-        self.delete_duty_dus_input = QComboBox()
-        delete_layout.addWidget(self.delete_duty_dus_input)
-
-        delete_button = QPushButton("Удалить")
-        delete_button.clicked.connect(self.delete_duty_dus)
-        delete_layout.addWidget(delete_button)
-
-        tab_widget.addTab(manage_duty_dus_tab, "Управление ДУС")
-
-    def create_search_correspondence_tab(self, tab_widget):
-        search_correspondence_tab = QWidget()
-        layout = QVBoxLayout()
-        search_correspondence_tab.setLayout(layout)
-
-        search_layout = QHBoxLayout()
-        search_layout.addWidget(QLabel("Начальная дата:"))
-        self.start_date_input = QDateEdit()
-        self.start_date_input.setDate(QDate.currentDate())
-        self.start_date_input.setCalendarPopup(True)
-        search_layout.addWidget(self.start_date_input)
-
-        search_layout.addWidget(QLabel("Конечная дата:"))
-        self.end_date_input = QDateEdit()
-        self.end_date_input.setDate(QDate.currentDate())
-        self.end_date_input.setCalendarPopup(True)
-        search_layout.addWidget(self.end_date_input)
-
-        search_button = QPushButton("Поиск")
-        search_button.clicked.connect(self.search_correspondence)
-        search_layout.addWidget(search_button)
-
-        layout.addLayout(search_layout)
-
-        self.search_results_table = QTableWidget()
-        self.search_results_table.setColumnCount(7)
-        self.search_results_table.setHorizontalHeaderLabels([
-            "Дата", "Тип", "Срочность", "Входящая", "Исходящая", "Период", "ДУС"
-        ])
-        layout.addWidget(self.search_results_table)
-
-        self.category_totals_table = QTableWidget()
-        self.category_totals_table.setColumnCount(4)
-        self.category_totals_table.setHorizontalHeaderLabels([
-            "Тип", "Срочность", "Входящая", "Исходящая"
-        ])
-        layout.addWidget(self.category_totals_table)
-
-        self.export_duty_dus_input = QComboBox()
-        self.update_export_duty_dus_list()
-        layout.addWidget(QLabel("Экспорт ДУС:"))
-        layout.addWidget(self.export_duty_dus_input)
-
-        self.export_search_results_checkbox = QCheckBox("Отобразить результаты всего поиска")
-        self.export_search_results_checkbox.setChecked(True)
-        self.export_search_results_checkbox.stateChanged.connect(self.toggle_search_results_export)
-        layout.addWidget(self.export_search_results_checkbox)
-
-        export_button = QPushButton("Экспортировать в PDF")
-        export_button.clicked.connect(self.export_to_pdf)
-        layout.addWidget(export_button)
-
-        tab_widget.addTab(search_correspondence_tab, "Статистика нагрузки")
-
-    def toggle_search_results_export(self, state):
-        if state == Qt.Checked:
-            self.search_results_table.show()
-        else:
-            self.search_results_table.hide()
-
-    def create_tables(self):
-        self.db_manager.create_tables()
-
-    def update_export_duty_dus_list(self):
-        duty_dus_list = self.db_manager.update_duty_dus_list()
-        self.export_duty_dus_input.clear()
-        for duty_dus in duty_dus_list:
-            rank = duty_dus[1]
-            first_name = duty_dus[2]
-            last_name = duty_dus[3]
-            last_last_name = duty_dus[4]
-            full_name = f"{rank} {first_name} {last_name} {last_last_name}"
-            self.export_duty_dus_input.addItem(full_name)
-
-    def add_duty_dus(self):
-        global connection
-        rank = self.rank_input.currentText()
-        first_name = self.first_name_input.text()
-        last_name = self.last_name_input.text()
-        last_last_name = self.last_last_name_input.text()
-
-        if not rank.strip() or not first_name.strip() or not last_name.strip() or not last_last_name.strip():
-            QMessageBox.warning(self, "Ошибка ввода", "Все поля должны быть заполнены!")
-            return
+    @instrumented("delete_duty_dus")
+    def delete_duty_dus(self, duty_dus_id):
+        with self.connections.transaction() as connection:
+            connection.execute('DELETE FROM duty_dus WHERE id = ?', (duty_dus_id,))
+        self.connections.after_commit(self.duty_dus.invalidate)
 
+    @instrumented("add_correspondence")
+    def add_correspondence(self, date, corr_type, urgency, incoming, outgoing, period, duty_dus_id):
+        day = date_to_day(date)
+        with self.connections.transaction() as connection:
+            connection.execute(INSERT_CORRESPONDENCE_SQL,
+                               (day, corr_type, urgency, incoming, outgoing, period, duty_dus_id))
+        self.invalidate_cached(day, day)
+
+    @instrumented("add_correspondence_many")
+    def add_correspondence_many(self, rows):
+        # rows - кортежи в порядке аргументов add_correspondence, одна транзакция на вызов.
+        rows = [(date_to_day(row[0]),) + tuple(row[1:]) for row in rows]
+        with self.connections.transaction() as connection:
+            connection.executemany(INSERT_CORRESPONDENCE_SQL, rows)
+        if rows:
+            self.invalidate_cached(min(row[0] for row in rows), max(row[0] for row in rows))
+
+    @instrumented("bulk_insert_correspondence")
+    def bulk_insert_correspondence(self, rows, checkpoint=None):
+        # rows - кортежи для INSERT_CORRESPONDENCE_IDS_SQL (номер дня и id
+        # справочников). Построчный триггер свертки на время пакета снимается,
+        # итоги добавляются одним запросом; все в одной транзакции. checkpoint -
+        # строка import_progress, сохраняемая вместе с пакетом.
+        with self.connections.transaction() as connection:
+            with suspended_trigger(connection, "trg_correspondence_daily_insert"):
+                last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM correspondence').fetchone()[0]
+                connection.executemany(INSERT_CORRESPONDENCE_IDS_SQL, rows)
+                connection.execute(ROLLUP_MERGE_SQL, (last_id,))
+            if checkpoint:
+                connection.execute('''
+                    INSERT OR REPLACE INTO import_progress
+                        (source, size, mtime_ns, position, inserted, rejected, finished)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', checkpoint)
+        if rows:
+            self.invalidate_cached(min(row[0] for row in rows), max(row[0] for row in rows))
+
+    @instrumented("archive_closed_periods")
+    def archive_closed_periods(self, before_date=None, granularity="year", progress=None):
+        # Переносит в архивы все периоды, закончившиеся до периода before_date
+        # (по умолчанию - текущего). Возвращает [(имя архива, записей в нем)].
+        _, cutoff, _ = partition_bounds(date_to_day(before_date or date_type.today()), granularity)
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        archived = []
+        day = self.connections.execute('SELECT MIN(day) FROM correspondence WHERE day < ?', (cutoff,)).fetchone()[0]
+        while day is not None:
+            key, start_day, end_day = partition_bounds(day, granularity)
+            name = f"{stem}_archive_{key}.db"
+            archived.append((name, self.archive_partition(name, start_day, end_day)))
+            if progress:
+                progress(name)
+            day = self.connections.execute('SELECT MIN(day) FROM correspondence WHERE day > ? AND day < ?',
+                                           (end_day, cutoff)).fetchone()[0]
+        return archived
+
+    def archive_partition(self, name, start_day, end_day):
+        # Архив собирается во временном файле (копии прежнего архива, если он
+        # есть) и заменяет старый файл целиком. Записи копируются с их id через
+        # INSERT OR IGNORE, поэтому повтор после сбоя между заменой файла и
+        # удалением из горячей базы не дублирует их в архиве.
+        path = self.archive_path(name)
+        temporary = f"{path}.tmp"
+        self.close_archives([name])
+        if os.path.exists(path):
+            import shutil
+            shutil.copyfile(path, temporary)
+        elif os.path.exists(temporary):
+            os.remove(temporary)
+        archive = DatabaseManager(temporary, ARCHIVE_PRAGMAS)
         try:
-            connection = sqlite3.connect(self.db_path)
-            cursor = connection.cursor()
-            cursor.execute('''
-                INSERT INTO duty_dus (rank, first_name, last_name, last_last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (rank, first_name, last_name, last_last_name))
-            connection.commit()
-            self.update_duty_dus_list()
-            self.first_name_input.clear()
-            self.last_name_input.clear()
-            self.last_last_name_input.clear()
-            QMessageBox.information(self, "Успех", "Дежурный по узлу связи добавлен.")
-        except sqlite3.DatabaseError as e:
-            QMessageBox.critical(self, "Ошибка базы данных", f"Не удалось добавить дежурного по узлу связи: {str(e)}")
+            archive.migrate()
+            connection = archive.connections.connection
+            connection.execute('ATTACH DATABASE ? AS hot', (os.path.abspath(self.db_path),))
+            with archive.connections.transaction():
+                # Справочники копируются с id горячей базы: в ней могут быть
+                # значения старых версий, которых нет среди встроенных, и без
+                # них соединения запросов потеряли бы такие записи.
+                for table in LOOKUP_TABLES:
+                    connection.execute(f'INSERT OR REPLACE INTO {table} (id, name) SELECT id, name FROM hot.{table}')
+                with suspended_trigger(connection, "trg_correspondence_daily_insert"):
+                    connection.execute('''
+                        INSERT OR IGNORE INTO correspondence
+                            (id, day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id)
+                        SELECT id, day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id
+                        FROM hot.correspondence WHERE day BETWEEN ? AND ?
+                    ''', (start_day, end_day))
+                    _rebuild_daily_rollup(connection)
+            connection.execute('DETACH DATABASE hot')
+            row_count = connection.execute('SELECT COUNT(*) FROM correspondence').fetchone()[0]
+            archive.vacuum()
+        finally:
+            archive.close()
+        os.replace(temporary, path)
+
+        # Из горячей базы удаляются только записи, которые есть в готовом
+        # архиве: запись за период, добавленная во время переноса, остается
+        # и уйдет в архив при следующем переносе. Свертка за дни периода
+        # пересчитывается по оставшимся записям, без построчного триггера.
+        connection = self.connections.connection
+        connection.execute('ATTACH DATABASE ? AS arch', (os.path.abspath(path),))
+        try:
+            with self.connections.transaction():
+                with suspended_trigger(connection, "trg_correspondence_daily_delete"):
+                    connection.execute('''
+                        DELETE FROM correspondence
+                        WHERE day BETWEEN ? AND ? AND id IN (SELECT id FROM arch.correspondence)
+                    ''', (start_day, end_day))
+                    connection.execute('DELETE FROM correspondence_daily WHERE day BETWEEN ? AND ?',
+                                       (start_day, end_day))
+                    connection.execute(f'''
+                        INSERT INTO correspondence_daily ({ROLLUP_KEY}, incoming, outgoing, row_count)
+                        SELECT day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0),
+                               SUM(COALESCE(incoming, 0)), SUM(COALESCE(outgoing, 0)), COUNT(*)
+                        FROM correspondence
+                        WHERE day BETWEEN ? AND ?
+                        GROUP BY day, period_id, corr_type_id, urgency_id, COALESCE(duty_dus_id, 0)
+                    ''', (start_day, end_day))
+                connection.execute('''
+                    INSERT OR REPLACE INTO archives (name, start_day, end_day, row_count) VALUES (?, ?, ?, ?)
+                ''', (name, start_day, end_day, row_count))
         finally:
-            if connection:
+            connection.execute('DETACH DATABASE arch')
+        self.invalidate_cached(start_day, end_day)
+        return row_count
+
+    def get_archives(self):
+        return self.connections.execute('''
+            SELECT name, date(start_day * 86400, 'unixepoch'), date(end_day * 86400, 'unixepoch'), row_count
+            FROM archives ORDER BY start_day
+        ''').fetchall()
+
+    def default_backup_dir(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), BACKUP_DIR_NAME)
+
+    def backup(self, backup_dir=None, compact=False, verify=True, keep=BACKUP_KEEP, progress=None,
+               pages=BACKUP_STEP_PAGES, pause=BACKUP_STEP_PAUSE):
+        # Снимок базы без остановки ввода. Отдельное соединение держит одну
+        # транзакцию чтения: в режиме WAL она не мешает записи, а копия
+        # получается согласованной и не начинается заново после каждой
+        # вставки из другого соединения. compact - VACUUM INTO вместо
+        # постраничного копирования: файл меньше, но одной командой.
+        import shutil
+        backup_dir = backup_dir or self.default_backup_dir()
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        path = os.path.join(backup_dir, f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        suffix = 1
+        while os.path.exists(path if suffix == 1 else f"{path}-{suffix}"):
+            suffix += 1
+        path = path if suffix == 1 else f"{path}-{suffix}"
+        temporary = f"{path}.tmp"
+        target = os.path.join(temporary, os.path.basename(self.db_path))
+        start = time.perf_counter()
+        os.makedirs(temporary)
+        try:
+            source = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                if compact:
+                    source.execute('VACUUM INTO ?', (target,))
+                else:
+                    def step(status, remaining, total):
+                        if progress:
+                            progress(total - remaining, total)
+                        time.sleep(pause)
+
+                    source.execute('BEGIN')
+                    source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                    destination = sqlite3.connect(target)
+                    try:
+                        source.backup(destination, pages=pages, progress=step)
+                    finally:
+                        destination.close()
+                    source.execute('COMMIT')
+            finally:
+                source.close()
+            # Снимок - один самостоятельный файл, без журнала WAL рядом.
+            connection = sqlite3.connect(target, isolation_level=None)
+            try:
+                connection.execute('PRAGMA journal_mode = DELETE')
+            finally:
                 connection.close()
+            # Архивы не меняются на месте (archive_partition заменяет файл
+            # целиком), поэтому копируются как есть.
+            for archive in snapshot_files(target)[1:]:
+                shutil.copyfile(self.archive_path(os.path.basename(archive)), archive)
+            if verify:
+                verify_snapshot(target)
+            os.replace(temporary, path)
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        if keep:
+            for old in self.list_backups(backup_dir)[:-keep]:
+                shutil.rmtree(os.path.dirname(old))
+        return BackupResult(os.path.join(path, os.path.basename(self.db_path)), size, time.perf_counter() - start)
+
+    def list_backups(self, backup_dir=None):
+        # Файлы баз готовых снимков, от старых к новым.
+        backup_dir = backup_dir or self.default_backup_dir()
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        try:
+            names = sorted(os.listdir(backup_dir))
+        except FileNotFoundError:
+            return []
+        snapshots = []
+        for name in names:
+            path = os.path.join(backup_dir, name, os.path.basename(self.db_path))
+            if name.startswith(f"{stem}-") and not name.endswith(".tmp") and os.path.exists(path):
+                snapshots.append(path)
+        return snapshots
+
+    def restore(self, snapshot_path, backup_dir=None):
+        # Снимок проверяется и записывается в рабочую базу через backup API,
+        # поэтому журнал WAL и открытые соединения остаются согласованными.
+        # Текущее состояние перед этим сохраняется отдельным снимком (без
+        # ротации, чтобы не удалить восстанавливаемый).
+        import shutil
+        verify_snapshot(snapshot_path)
+        saved = self.backup(backup_dir, keep=0)
+        self.close_archives()
+        for archive in snapshot_files(snapshot_path)[1:]:
+            path = self.archive_path(os.path.basename(archive))
+            shutil.copyfile(archive, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        source = sqlite3.connect(read_only_uri(snapshot_path), uri=True)
+        try:
+            source.backup(self.connections.connection)
+        finally:
+            source.close()
+        self.result_cache.invalidate()
+        self.duty_dus.invalidate()
+        return saved
+
+    def get_import_progress(self, source):
+        cursor = self.connections.execute('''
+            SELECT size, mtime_ns, position, inserted, rejected, finished FROM import_progress WHERE source = ?
+        ''', (source,))
+        return cursor.fetchone()
+
+    def get_lookup(self, table):
+        if table not in LOOKUP_TABLES:
+            raise ValueError(f"Неизвестный справочник: {table}")
+        return self.connections.execute(f'SELECT id, name FROM {table} ORDER BY id').fetchall()
+
+    def describe_filters(self, filters):
+        # Подпись отбора для отчета: "Тип: ТЛФ; ДУС: пр-к Иванов И.И.".
+        if not filters:
+            return ""
+        parts = []
+        for label, table, value in (("Тип", "corr_types", filters.corr_type_id),
+                                    ("Срочность", "urgencies", filters.urgency_id),
+                                    ("Период", "periods", filters.period_id)):
+            if value is not None:
+                parts.append(f"{label}: {dict(self.get_lookup(table)).get(value, value)}")
+        if filters.duty_dus_id is not None:
+            duty_dus = self.duty_dus.get(filters.duty_dus_id)
+            parts.append(f"ДУС: {duty_dus.short_name if duty_dus else filters.duty_dus_id}")
+        return "; ".join(parts)
+
+    def resolve_filters(self, corr_type=None, urgency=None, period=None, duty_dus_id=None):
+        # Отбор по именам значений справочников (командная строка).
+        ids = []
+        for label, table, name in (("тип", "corr_types", corr_type), ("срочность", "urgencies", urgency),
+                                   ("период", "periods", period)):
+            lookup_id = None
+            if name is not None:
+                lookup_id = {value: key for key, value in self.get_lookup(table)}.get(name)
+                if lookup_id is None:
+                    raise ValueError(f"Неизвестный {label}: {name}")
+            ids.append(lookup_id)
+        return SearchFilters(*ids, duty_dus_id)
+
+    def get_corr_types(self):
+        return self.get_lookup("corr_types")
+
+    def get_urgencies(self):
+        return self.get_lookup("urgencies")
+
+    def get_periods(self):
+        return self.get_lookup("periods")
+
+    @instrumented("update_duty_dus_list")
+    def update_duty_dus_list(self):
+        return self.duty_dus.list()
+
+    @instrumented("search_correspondence")
+    def search_correspondence(self, start_date, end_date, filters=None):
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        sql, parameters = with_filters(SEARCH_CORRESPONDENCE_SQL, filters)
+        self.duty_dus.refresh()
+        return self.cached(("search", start_day, end_day, sql, tuple(parameters)), start_day, end_day,
+                           lambda: [row for cursor in self.execute_partitions(start_day, end_day, sql,
+                                                                              [start_day, end_day] + parameters)
+                                    for row in cursor])
+
+    @instrumented("search_correspondence_page")
+    def search_correspondence_page(self, start_date, end_date, after=None, limit=SEARCH_PAGE_SIZE, filters=None):
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        after_day, after_id = (date_to_day(after[0]), after[1]) if after else (start_day, 0)
+        sql, parameters = with_filters(SEARCH_CORRESPONDENCE_PAGE_SQL, filters)
+        self.duty_dus.refresh()
+
+        def compute():
+            return merge_pages(self.execute_partitions(start_day, end_day, sql, [max(start_day, after_day), end_day,
+                                                                                 after_day, after_id]
+                                                       + parameters + [limit]), limit)
+
+        # В кэш попадает только первая страница: ее запрашивает каждое нажатие
+        # "Поиск", а полный обход диапазона при выгрузке вытеснил бы все остальное.
+        if after:
+            return compute()
+        return self.cached(("search_page", start_day, end_day, limit, sql, tuple(parameters)), start_day, end_day,
+                           compute)
+
+    def iter_search_pages(self, start_date, end_date, page_size=SEARCH_PAGE_SIZE, filters=None):
+        after = None
+        while True:
+            page = self.search_correspondence_page(start_date, end_date, after, page_size, filters)
+            yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1][1], page[-1][0])
+
+    def iter_search_correspondence(self, start_date, end_date, page_size=SEARCH_PAGE_SIZE, filters=None):
+        for page in self.iter_search_pages(start_date, end_date, page_size, filters):
+            yield from page
+
+    def correspondence_id_page(self, start_date, end_date, after=None, limit=EXPORT_PAGE_SIZE, filters=None):
+        # Страница CORRESPONDENCE_IDS_PAGE_SQL; в кэш результатов не попадает.
+        # after - (номер дня, id) последней строки предыдущей страницы.
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        after_day, after_id = after or (start_day, 0)
+        sql, parameters = with_filters(CORRESPONDENCE_IDS_PAGE_SQL, filters)
+        return merge_pages(self.execute_partitions(start_day, end_day, sql, [max(start_day, after_day), end_day,
+                                                                             after_day, after_id]
+                                                   + parameters + [limit]), limit)
+
+    def iter_correspondence_id_pages(self, start_date, end_date, page_size=EXPORT_PAGE_SIZE, filters=None):
+        after = None
+        while True:
+            page = self.correspondence_id_page(start_date, end_date, after, page_size, filters)
+            yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1][1], page[-1][0])
+
+    @instrumented("count_correspondence")
+    def count_correspondence(self, start_date, end_date, filters=None):
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        sql, parameters = with_filters(CORRESPONDENCE_COUNT_SQL, filters, alias="r")
+        return self.cached(("count", start_day, end_day, sql, tuple(parameters)), start_day, end_day,
+                           lambda: sum(cursor.fetchone()[0] for cursor in self.execute_partitions(
+                               start_day, end_day, sql, [start_day, end_day] + parameters)))
+
+    @instrumented("get_correspondence_count_by_type")
+    def get_correspondence_count_by_type(self, start_date, end_date, filters=None):
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        sql, parameters = with_filters(CORRESPONDENCE_COUNT_BY_TYPE_SQL, filters, alias="r")
+
+        def compute():
+            cursors = self.execute_partitions(start_day, end_day, sql, [start_day, end_day] + parameters)
+            if len(cursors) == 1:
+                return cursors[0].fetchall()
+            return list(sum_by_key(itertools.chain.from_iterable(cursors), 2, lookup_order(CORR_TYPES, URGENCIES)))
+
+        return self.cached(("count_by_type", start_day, end_day, sql, tuple(parameters)), start_day, end_day,
+                           compute)
+
+    @instrumented("get_load_analytics")
+    def get_load_analytics(self, start_date, end_date, filters=None):
+        start_day, end_day = date_to_day(start_date), date_to_day(end_date)
+        sql, parameters = with_filters(LOAD_ANALYTICS_SQL, filters, alias="r")
+        self.duty_dus.refresh()
+
+        def compute():
+            names = [dict(self.get_lookup(table)) for table in ("corr_types", "urgencies", "periods")]
+            cursors = self.execute_partitions(start_day, end_day, sql, [start_day, end_day] + parameters)
+            return aggregate_load(itertools.chain.from_iterable(cursors), *names)
+
+        return self.cached(("load_analytics", start_day, end_day, sql, tuple(parameters)), start_day, end_day,
+                           compute)
+
+def format_duty_dus_short(rank, first_name, last_name, last_last_name):
+    initial_first_name = first_name[0].upper() if first_name else ''
+    initial_last_last_name = last_last_name[0].upper() if last_last_name else ''
+    return f"{rank} {last_name} {initial_first_name}.{initial_last_last_name}."
+
+def format_correspondence_row(row, duty_dus):
+    # row - строка search_correspondence_page: id, поля записи, duty_dus_id.
+    return [str(value) for value in row[1:7]] + [duty_dus.short_name(row[7])]
+
+def format_category_totals(analytics, convert=str):
+    # Итоги по категориям с подытогом после каждого типа и общим итогом в конце;
+    # категории отсортированы по типу, поэтому строки одного типа идут подряд.
+    # convert - преобразование чисел и имен (для XLSX числа остаются числами).
+    type_totals = {row[0]: row for row in analytics.type_totals}
+    rows = []
+    for i, row in enumerate(analytics.categories):
+        rows.append([convert(value) for value in row[:4]])
+        if i + 1 == len(analytics.categories) or analytics.categories[i + 1][0] != row[0]:
+            corr_type, incoming, outgoing, _ = type_totals[row[0]]
+            rows.append([corr_type, "Итого", convert(incoming), convert(outgoing)])
+    if rows:
+        rows.append(["Всего", "", convert(analytics.grand_total[0]), convert(analytics.grand_total[1])])
+    return rows
+
+# Разрезы LoadAnalytics для таблиц статистики и разделов отчета: поле,
+# заголовок и колонки.
+LOAD_SECTIONS = (
+    ("days", "Нагрузка по дням", ["Дата", "Входящая", "Исходящая", "Записей"]),
+    ("shifts", "Нагрузка по сменам", ["Дата", "Период", "Входящая", "Исходящая", "Записей"]),
+    ("duty_dus", "Нагрузка по ДУС", ["ДУС", "Входящая", "Исходящая", "Записей"]),
+)
+
+def format_load_rows(analytics, section, duty_dus, convert=str):
+    rows = getattr(analytics, section)
+    if section == "duty_dus" and duty_dus is not None:
+        # duty_dus_id = 0 - записи без ДУС. Без справочника (сводка по узлам
+        # связи) первое поле - уже готовая подпись.
+        return [[duty_dus.short_name(row[0]) or "Не указан"] + [convert(value) for value in row[1:]] for row in rows]
+    return [[convert(value) for value in row] for row in rows]
+
+IMPORT_FIELDS = ("date", "corr_type", "urgency", "incoming", "outgoing", "period", "duty_dus")
+IMPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+IMPORT_BATCH = 50000
+# Сколько отклоненных записей возвращается в ImportResult; полный список
+# пишется в файл rejects_path.
+IMPORT_REJECTS_KEPT = 100
+
+# skipped - записи, обработанные прошлыми запусками; already_imported - файл
+# уже был загружен полностью и не читался.
+ImportResult = namedtuple("ImportResult", "source skipped inserted rejected rejects already_imported")
+
+def import_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {path} (ожидается CSV или JSONL)")
+    return IMPORT_FORMATS[extension]
+
+def read_import_records(source, file_format):
+    # CSV - заголовок с именами IMPORT_FIELDS; JSONL - объект с теми же ключами
+    # в каждой строке. Строки JSONL разбираются при проверке, чтобы ошибка
+    # разбора отклоняла одну запись, а не весь файл.
+    if file_format == "csv":
+        reader = csv.reader(source)
+        header = [name.strip() for name in next(reader, [])]
+        missing = [field for field in IMPORT_FIELDS if field not in header]
+        if missing:
+            raise ValueError(f"В заголовке CSV нет полей: {', '.join(missing)}")
+        positions = [header.index(field) for field in IMPORT_FIELDS]
+        width = max(positions) + 1
+        fields = operator.itemgetter(*positions)
+        for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            yield fields(row)
+    else:
+        for line in source:
+            if line.strip():
+                yield line
+
+# Массовая загрузка нагрузки из CSV/JSONL. Записи проверяются по справочникам
+# и списку ДУС в памяти и вставляются пакетами по IMPORT_BATCH. После каждого
+# пакета в import_progress сохраняется число обработанных записей файла, и
+# прерванная загрузка того же (не измененного) файла продолжается с него.
+class CorrespondenceImporter:
+    def __init__(self, db_manager, batch_size=IMPORT_BATCH):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.days = {}
+        self.lookups = {}
+        self.officers = {}
+
+    def load_lookups(self):
+        for table in LOOKUP_TABLES:
+            self.lookups[table] = {name: lookup_id for lookup_id, name in self.db_manager.get_lookup(table)}
+        # ДУС указывается id, полной подписью или сокращенной; неоднозначная
+        # сокращенная подпись не принимается.
+        self.officers = {}
+        for duty_dus in self.db_manager.update_duty_dus_list():
+            self.officers[str(duty_dus.id)] = duty_dus.id
+            self.officers[duty_dus.full_name] = duty_dus.id
+            short_name_id = self.officers.get(duty_dus.short_name, duty_dus.id)
+            self.officers[duty_dus.short_name] = short_name_id if short_name_id == duty_dus.id else None
+
+    def lookup(self, values, value, field):
+        # Медленный путь convert: значение с пробелами по краям или не строка.
+        lookup_id = values.get(str(value).strip())
+        if lookup_id is None:
+            raise ValueError(f"{field}: неизвестное значение {value!r}")
+        return lookup_id
+
+    def count(self, value, field):
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field}: не целое число {value!r}")
+        if count < 0:
+            raise ValueError(f"{field}: отрицательное число {count}")
+        return count
+
+    def convert(self, record):
+        # record - значения IMPORT_FIELDS по порядку или строка JSONL. Вызывается
+        # на каждую запись, поэтому обычный случай обходится поиском в словарях.
+        if isinstance(record, str):
+            record = json.loads(record)
+            if not isinstance(record, dict):
+                raise ValueError("запись должна быть объектом")
+            record = [record.get(field) for field in IMPORT_FIELDS]
+        if None in record or "" in record:
+            missing = [field for field, value in zip(IMPORT_FIELDS, record) if value in (None, "")]
+            raise ValueError(f"нет значений: {', '.join(missing)}")
+        date, corr_type, urgency, incoming, outgoing, period, duty_dus = record
+        day = self.days.get(date)
+        if day is None:
+            day = self.days[date] = date_to_day(date)
+        corr_types, urgencies, periods = self.lookups["corr_types"], self.lookups["urgencies"], self.lookups["periods"]
+        corr_type_id = corr_types.get(corr_type) or self.lookup(corr_types, corr_type, "corr_type")
+        urgency_id = urgencies.get(urgency) or self.lookup(urgencies, urgency, "urgency")
+        period_id = periods.get(period) or self.lookup(periods, period, "period")
+        duty_dus_id = self.officers.get(duty_dus) or self.officers.get(str(duty_dus).strip())
+        if duty_dus_id is None:
+            raise ValueError(f"duty_dus: неизвестный или неоднозначный ДУС {duty_dus!r}")
+        try:
+            incoming, outgoing = int(incoming), int(outgoing)
+        except (TypeError, ValueError):
+            incoming, outgoing = self.count(incoming, "incoming"), self.count(outgoing, "outgoing")
+        if incoming < 0 or outgoing < 0:
+            incoming, outgoing = self.count(incoming, "incoming"), self.count(outgoing, "outgoing")
+        return (day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id)
+
+    def run(self, path, file_format=None, rejects_path=None, restart=False, progress=None):
+        # progress(прочитано байт, размер файла) вызывается после каждого пакета.
+        source = os.path.abspath(path)
+        file_format = file_format or import_format(path)
+        stat = os.stat(source)
+        state = None if restart else self.db_manager.get_import_progress(source)
+        if state and state[:2] != (stat.st_size, stat.st_mtime_ns):
+            state = None
+        if state and state[5]:
+            return ImportResult(source, state[2], 0, 0, [], True)
+        skipped, inserted, rejected = state[2:5] if state else (0, 0, 0)
+        previously_inserted, previously_rejected = inserted, rejected
+        self.load_lookups()
+        rejects = []
+        batch = []
+        batch_rejects = []
+        position = skipped
+
+        reject_file = reject_writer = None
+
+        def open_rejects():
+            # Файл создается при первой отклоненной записи; продолжение
+            # загрузки дописывает файл прошлого запуска, если он есть.
+            nonlocal reject_file, reject_writer
+            resume = skipped and os.path.exists(rejects_path)
+            reject_file = open(rejects_path, "a" if resume else "w", newline="", encoding="utf-8")
+            reject_writer = csv.writer(reject_file)
+            if not resume:
+                reject_writer.writerow(["record", "error", "data"])
+
+        def flush(finished=False):
+            nonlocal inserted, rejected
+            inserted += len(batch)
+            rejected += len(batch_rejects)
+            self.db_manager.bulk_insert_correspondence(
+                batch, (source, stat.st_size, stat.st_mtime_ns, position, inserted, rejected, int(finished)))
+            # Отклоненные записи пишутся после фиксации пакета, чтобы при
+            # продолжении загрузки они не повторялись в файле.
+            if batch_rejects and rejects_path and not reject_file:
+                open_rejects()
+            for number, error, record in batch_rejects:
+                if len(rejects) < IMPORT_REJECTS_KEPT:
+                    rejects.append((number, error))
+                if reject_writer:
+                    data = record if isinstance(record, str) else json.dumps(
+                        dict(zip(IMPORT_FIELDS, record)), ensure_ascii=False)
+                    reject_writer.writerow([number, error, data.strip()])
+            if reject_file:
+                reject_file.flush()
+            batch.clear()
+            batch_rejects.clear()
 
-    def add_correspondence(self):
-        date = self.date_input.date().toString("yyyy-MM-dd")
-        corr_type = self.corr_type_input.currentText()
-        urgency = self.urgency_input.currentText()
-        incoming = self.incoming_input.text()
-        outgoing = self.outgoing_input.text()
-        period = self.period_input.currentText()
-        duty_dus_id = self.duty_dus_input.currentData()
-
-        if not all([date, corr_type, urgency, incoming, outgoing, period, duty_dus_id]):
-            QMessageBox.warning(self, "Ошибка ввода", "Все поля должны быть заполнены!")
+        try:
+            with open(source, newline="", encoding="utf-8-sig") as input_file:
+                for number, record in enumerate(read_import_records(input_file, file_format), start=1):
+                    if number <= skipped:
+                        continue
+                    try:
+                        batch.append(self.convert(record))
+                    except (TypeError, ValueError) as e:
+                        batch_rejects.append((number, str(e), record))
+                    position = number
+                    if len(batch) >= self.batch_size:
+                        flush()
+                        if progress:
+                            progress(input_file.buffer.tell(), stat.st_size)
+                flush(finished=True)
+        finally:
+            if reject_file:
+                reject_file.close()
+        return ImportResult(source, skipped, inserted - previously_inserted, rejected - previously_rejected,
+                            rejects, False)
+
+FONT_FAMILY = "DejaVu"
+FONT_FILES = {
+    "": "DejaVuSansCondensed.ttf",
+    "B": "DejaVuSansCondensed-Bold.ttf",
+    "I": "DejaVuSerifCondensed-Italic.ttf",
+}
+
+# Символы отчетов: латиница, кириллица, знаки препинания. FontCache готовит
+# копию шрифта только с ними - подмножество для документа fontTools строит
+# из нее в несколько раз быстрее, чем из полного DejaVu (более 6000 глифов).
+FONT_CHARSET = ((0x20, 0x24F), (0x400, 0x52F), (0x2000, 0x206F), (0x20A0, 0x20CF), (0x2100, 0x214F))
+
+def resource_dirs():
+    # Ресурсы ищутся в распакованном архиве PyInstaller, рядом с исполняемым
+    # файлом сборки и рядом с этим модулем - независимо от текущего каталога.
+    if getattr(sys, "frozen", False):
+        if hasattr(sys, "_MEIPASS"):
+            yield sys._MEIPASS
+        yield os.path.dirname(os.path.abspath(sys.executable))
+    yield os.path.dirname(os.path.abspath(__file__))
+
+def resource_path(name):
+    for directory in resource_dirs():
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"Не найден файл ресурса: {name}")
+
+def default_font_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "correspondence", "fonts")
+
+# Кэш разобранных TTF-шрифтов для fpdf2. Метрики шрифта (ширины символов,
+# cmap, дескриптор) не зависят от документа, поэтому разбираются один раз за
+# процесс и сохраняются на диск; каждый новый FPDF получает копию шрифта со
+# своим набором символов для подмножества и свежим ленивым TTFont.
+class FontCache:
+    DOCUMENT_SLOTS = ("ttfont", "subset", "missing_glyphs", "biggest_size_pt", "_hbfont", "i")
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = default_font_cache_dir() if cache_dir is None else cache_dir
+        self.prototypes = {}
+        self.parse_times = {}
+        self.saved_seconds = 0.0
+        self.lock = threading.Lock()
+        self.parse_seconds = 0.0
+        self.parse_count = 0
+        self.load_seconds = 0.0
+        self.disk_hits = 0
+        self.memory_hits = 0
+        self.charset_fonts = {}
+
+    def register(self, pdf, family=FONT_FAMILY, font_files=FONT_FILES):
+        try:
+            from fontTools import ttLib
+            from fpdf.fonts import SubsetMap, TTFFont
+        except ImportError:
+            # PyFPDF 1.7 сам кэширует метрики шрифтов в .pkl рядом с файлами шрифтов.
+            TTFFont = None
+        for style, name in font_files.items():
+            path = resource_path(name)
+            if TTFFont is None:
+                pdf.add_font(family, style, path, uni=True)
+                continue
+            prototype = self.prototype(family, style, path)
+            font = copy.copy(prototype)
+            font.i = len(pdf.fonts) + 1
+            charset_font = self.charset_font(path)
+            font.ttfont = ttLib.TTFont(io.BytesIO(charset_font) if charset_font else path, recalcTimestamp=False,
+                                       lazy=True)
+            font.subset = SubsetMap(font)
+            font.missing_glyphs = []
+            font.biggest_size_pt = 0
+            font._hbfont = None
+            pdf.fonts[font.fontkey] = font
+
+    def warm(self, family=FONT_FAMILY, font_files=FONT_FILES):
+        # Разбирает шрифты до запуска пула процессов: рабочие процессы
+        # пакетной выгрузки читают готовые метрики из дискового кэша.
+        # Без fontTools это PyFPDF 1.7 со своим кэшем .pkl (см. register).
+        import importlib.util
+        if importlib.util.find_spec("fontTools") is None:
             return
-
+        for style, name in font_files.items():
+            path = resource_path(name)
+            self.prototype(family, style, path)
+            self.charset_font(path)
+
+    def charset_font(self, path):
+        # Копия шрифта с FONT_CHARSET; имена глифов сохраняются, по ним fpdf
+        # строит подмножество. Хранится в памяти процесса и в каталоге кэша.
+        from fontTools import ttLib
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            entry = self.charset_fonts.get(path)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+            data = cache_file = None
+            if self.cache_dir:
+                cache_file = os.path.join(self.cache_dir,
+                                          f"{os.path.basename(path)}-{stat.st_size}-{stat.st_mtime_ns}-charset.ttf")
+                try:
+                    with open(cache_file, "rb") as charset_file:
+                        data = charset_file.read()
+                except OSError:
+                    pass
+            if not data:
+                from fontTools import subset
+                options = subset.Options(glyph_names=True, notdef_outline=True, recommended_glyphs=True,
+                                         name_IDs=["*"], name_languages=["*"], layout_features=[])
+                options.drop_tables += ["FFTM", "GSUB", "GPOS", "GDEF", "kern"]
+                subsetter = subset.Subsetter(options)
+                subsetter.populate(unicodes=[code for first, last in FONT_CHARSET for code in range(first, last + 1)])
+                ttfont = ttLib.TTFont(path, recalcTimestamp=False)
+                subsetter.subset(ttfont)
+                output = io.BytesIO()
+                ttfont.save(output)
+                data = output.getvalue()
+                if cache_file:
+                    try:
+                        os.makedirs(self.cache_dir, exist_ok=True)
+                        with open(cache_file, "wb") as charset_file:
+                            charset_file.write(data)
+                    except OSError:
+                        pass
+            glyph_names = frozenset(ttLib.TTFont(io.BytesIO(data), lazy=True).getGlyphOrder())
+            self.charset_fonts[path] = (key, data, glyph_names)
+            return data
+
+    def output(self, pdf, filename):
+        # Если в документе есть символы вне FONT_CHARSET, подмножество
+        # строится из полного шрифта.
         try:
-            with sqlite3.connect(self.db_path) as connection:
-                cursor = connection.cursor()
-                cursor.execute('''
-                    INSERT INTO correspondence (date, corr_type, urgency, incoming, outgoing, period, duty_dus_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (date, corr_type, urgency, incoming, outgoing, period, duty_dus_id))
-            self.incoming_input.clear()
-            self.outgoing_input.clear()
-            QMessageBox.information(self, "Успех", "Корреспонденция добавлена.")
-        except sqlite3.DatabaseError as e:
-            QMessageBox.critical(self, "Ошибка базы данных", f"Не удалось добавить нагрузку: {str(e)}")
-
-    def delete_duty_dus(self):
-        duty_dus_id = self.delete_duty_dus_input.currentData()
-
-        reply = QMessageBox.question(
-            self,
-            "Подтверждение удаления",
-            "Вы уверены, что хотите удалить этого дежурного по узлу связи?",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No
-        )
-
-        if reply == QMessageBox.Yes:
+            from fontTools import ttLib
+            from fpdf.fonts import TTFFont
+        except ImportError:
+            return pdf.output(filename)
+        for font in pdf.fonts.values():
+            entry = self.charset_fonts.get(os.fspath(font.ttffile)) if isinstance(font, TTFFont) else None
+            if entry is not None and any(glyph is not None and glyph.glyph_name not in entry[2]
+                                         for glyph, _ in font.subset.items()):
+                font.ttfont = ttLib.TTFont(font.ttffile, recalcTimestamp=False, lazy=True)
+        return pdf.output(filename)
+
+    def prototype(self, family, style, path):
+        stat = os.stat(path)
+        key = (family, style, path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            prototype = self.prototypes.get(key)
+            if prototype is not None:
+                self.memory_hits += 1
+                self.saved_seconds += self.parse_times[key]
+                return prototype
+            prototype = self.load(key)
+            if prototype is None:
+                from fpdf import FPDF
+                start = time.perf_counter()
+                pdf = FPDF()
+                pdf.add_font(family, style, path, uni=True)
+                prototype = next(iter(pdf.fonts.values()))
+                self.parse_times[key] = time.perf_counter() - start
+                self.parse_seconds += self.parse_times[key]
+                self.parse_count += 1
+                self.save(key, prototype)
+            self.prototypes[key] = prototype
+            return prototype
+
+    def cache_file(self, key):
+        import fpdf
+        family, style, path, size, mtime_ns = key
+        name = f"{os.path.basename(path)}-{family}{style}-{size}-{mtime_ns}-fpdf{fpdf.__version__}.pkl"
+        return os.path.join(self.cache_dir, name)
+
+    def load(self, key):
+        if not self.cache_dir:
+            return None
+        start = time.perf_counter()
+        path = self.cache_file(key)
+        try:
+            with open(path, "rb") as cache_file:
+                data = cache_file.read()
+        except OSError:
+            return None
+        try:
+            state = pickle.loads(data)
+            from fpdf.fonts import TTFFont
+            parse_seconds = state.pop("parse_seconds", 0.0)
+            prototype = TTFFont.__new__(TTFFont)
+            for slot, value in state.items():
+                setattr(prototype, slot, value)
+            missing_width = prototype.desc.missing_width
+            prototype.cw = defaultdict(lambda: missing_width, state["cw"])
+        except Exception:
+            # Поврежденный файл или внутренности TTFFont другой версии fpdf:
+            # файл удаляется, шрифт разбирается заново и кэш перезаписывается.
             try:
-                connection = sqlite3.connect(self.db_path)
-                cursor = connection.cursor()
-                cursor.execute('DELETE FROM duty_dus WHERE id = ?', (duty_dus_id,))
-                connection.commit()
-                QMessageBox.information(self, "Успех", "Дежурный по узлу связи удален.")
-            except sqlite3.DatabaseError as e:
-                QMessageBox.critical(self, "Ошибка базы данных",
-                                     f"Не удалось удалить дежурного по узлу связи: {str(e)}")
-            finally:
-                if connection:
-                    connection.close()
-            self.update_duty_dus_list()
-
-    def search_correspondence(self):
-        start_date = self.start_date_input.date().toString("yyyy-MM-dd")
-        end_date = self.end_date_input.date().toString("yyyy-MM-dd")
-
-        results = self.db_manager.search_correspondence(start_date, end_date)
-
-        self.search_results_table.clearContents()
-        self.search_results_table.setRowCount(len(results))
-
-        for i, row in enumerate(results):
-            rank = row[6]
-            first_name = row[7]
-            last_name = row[8]
-            last_last_name = row[9]
-
-            initial_first_name = first_name[0].upper()
-            initial_last_last_name = last_last_name[0].upper() if last_last_name else ''
-
-            duty_dus_str = f"{rank} {last_name} {initial_first_name}.{initial_last_last_name}."
-
-            for j, value in enumerate(row[:6]):
-                item = QTableWidgetItem(str(value))
-                self.search_results_table.setItem(i, j, item)
-
-            item = QTableWidgetItem(duty_dus_str)
-            self.search_results_table.setItem(i, 6, item)
-
-        # Calculate and display category totals
-        self.category_totals_table.clearContents()
-        self.category_totals_table.setRowCount(0)
-
-        category_totals = self.db_manager.get_correspondence_count_by_type(start_date, end_date)
-
-        self.category_totals_table.setRowCount(len(category_totals))
-
-        for i, row in enumerate(category_totals):
-            corr_type = row[0]
-            urgency = row[1]
-            incoming_total = row[2]
-            outgoing_total = row[3]
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        load_seconds = time.perf_counter() - start
+        self.parse_times[key] = parse_seconds
+        self.saved_seconds += max(0.0, parse_seconds - load_seconds)
+        self.load_seconds += load_seconds
+        self.disk_hits += 1
+        return prototype
+
+    def save(self, key, prototype):
+        if not self.cache_dir:
+            return
+        state = {}
+        for cls in type(prototype).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if slot not in self.DOCUMENT_SLOTS and hasattr(prototype, slot):
+                    state[slot] = getattr(prototype, slot)
+        state["cw"] = dict(state["cw"])
+        state["parse_seconds"] = self.parse_times[key]
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.cache_file(key), "wb") as cache_file:
+                pickle.dump(state, cache_file)
+        except (OSError, pickle.PickleError, TypeError, AttributeError):
+            pass
+
+    def summary(self):
+        # Экономия считается по измеренному времени первого разбора каждого шрифта.
+        return (f"шрифты: разобрано {self.parse_count} за {self.parse_seconds * 1e3:.1f} мс, "
+                f"из памяти {self.memory_hits}, с диска {self.disk_hits} за {self.load_seconds * 1e3:.1f} мс, "
+                f"сэкономлено ~{self.saved_seconds * 1e3:.1f} мс")
+
+FONT_CACHE = FontCache()
+
+# Отчет строится напрямую из базы: строки результатов читаются постранично и
+# сразу выводятся в PDF, заголовок таблицы повторяется на каждой новой странице.
+# Ячейки таблиц рисуются через rect()/text() с кэшем ширины строк: значения
+# в столбцах почти всегда повторяются, а FPDF.cell() в разы медленнее.
+class PdfReport:
+    RESULT_HEADERS = ["Дата", "Тип", "Срочность", "Входящая", "Исходящая", "Период", "ДУС"]
+    RESULT_WIDTHS = [25, 25, 30, 20, 20, 35, 40]
+    TOTAL_HEADERS = ["Тип", "Срочность", "Входящая", "Исходящая"]
+    TOTAL_WIDTHS = [40, 30, 20, 20]
+    LOAD_WIDTHS = {"days": [30, 25, 25, 20], "shifts": [30, 35, 25, 25, 20], "duty_dus": [70, 25, 25, 20]}
+    ROW_HEIGHT = 10
+
+    def __init__(self, db_manager, start_date, end_date, include_results=True, duty_dus_name="",
+                 generated_at=None, font_cache=None, filters=None):
+        self.db_manager = db_manager
+        self.font_cache = font_cache or FONT_CACHE
+        self.start_date = start_date
+        self.end_date = end_date
+        self.filters = filters
+        self.include_results = include_results
+        self.duty_dus_name = duty_dus_name
+        self.generated_at = generated_at or datetime.now()
+
+    def create_pdf(self):
+        from fpdf import FPDF
+        pdf = FPDF(orientation="P", unit="mm", format="A4")
+        self.font_cache.register(pdf)
+        pdf.add_page()
+        pdf.set_font("DejaVu", size=8)
+        return pdf
+
+    def write_title(self, pdf, title):
+        # Заголовок не остается внизу страницы без шапки и первой строки таблицы.
+        if pdf.will_page_break(10 + self.ROW_HEIGHT * 2):
+            pdf.add_page()
+        pdf.set_font("DejaVu", style="B", size=10)
+        pdf.cell(0, 10, title, ln=True, align="C")
+        pdf.set_font("DejaVu", size=8)
+
+    def write_row(self, pdf, widths, values, string_widths):
+        x = pdf.l_margin
+        y = pdf.get_y()
+        baseline = y + 0.5 * self.ROW_HEIGHT + 0.3 * pdf.font_size
+        for width, value in zip(widths, values):
+            pdf.rect(x, y, width, self.ROW_HEIGHT)
+            string_width = string_widths.get(value)
+            if string_width is None:
+                string_width = string_widths[value] = pdf.get_string_width(value)
+            pdf.text(x + (width - string_width) / 2, baseline, value)
+            x += width
+        pdf.set_y(y + self.ROW_HEIGHT)
+
+    def write_table(self, pdf, headers, widths, rows, progress=None, total=0):
+        string_widths = {}
+        # Шапка переносится на новую страницу вместе с первой строкой.
+        if pdf.will_page_break(self.ROW_HEIGHT * 2):
+            pdf.add_page()
+        self.write_row(pdf, widths, headers, string_widths)
+        for done, row in enumerate(rows, start=1):
+            if pdf.get_y() + self.ROW_HEIGHT > pdf.page_break_trigger:
+                pdf.add_page()
+                self.write_row(pdf, widths, headers, string_widths)
+            self.write_row(pdf, widths, row, string_widths)
+            if progress and done % SEARCH_PAGE_SIZE == 0:
+                progress(done, total)
+
+    def write(self, filename, progress=None):
+        instrumentation = self.db_manager.instrumentation
+        with instrumentation.timed("pdf.fonts"):
+            pdf = self.create_pdf()
+        filters_caption = self.db_manager.describe_filters(self.filters)
+        if filters_caption:
+            pdf.cell(0, 10, f"Отбор: {filters_caption}", ln=True, align="C")
+        if self.include_results:
+            with instrumentation.timed("pdf.results") as operation:
+                total = self.db_manager.count_correspondence(self.start_date, self.end_date, self.filters)
+                rows = (format_correspondence_row(row, self.db_manager.duty_dus)
+                        for row in self.db_manager.iter_search_correspondence(self.start_date, self.end_date,
+                                                                              filters=self.filters))
+                self.write_title(pdf, "Результаты поиска корреспонденции")
+                self.write_table(pdf, self.RESULT_HEADERS, self.RESULT_WIDTHS, rows, progress, total)
+                if operation is not None:
+                    operation["rows"] = total
+
+        pdf.ln(20)
+        with instrumentation.timed("pdf.totals"):
+            analytics = self.db_manager.get_load_analytics(self.start_date, self.end_date, self.filters)
+            self.write_analytics(pdf, analytics, self.db_manager.duty_dus)
+
+        self.write_footer(pdf)
+        with instrumentation.timed("pdf.output"):
+            self.font_cache.output(pdf, filename)
+        return filename
+
+    def write_analytics(self, pdf, analytics, duty_dus):
+        self.write_title(pdf, "Итоги по категориям")
+        self.write_table(pdf, self.TOTAL_HEADERS, self.TOTAL_WIDTHS, format_category_totals(analytics))
+        for section, title, headers in LOAD_SECTIONS:
+            pdf.ln(10)
+            self.write_title(pdf, title)
+            self.write_table(pdf, headers, self.LOAD_WIDTHS[section], format_load_rows(analytics, section, duty_dus))
+
+    def write_footer(self, pdf):
+        pdf.ln(20)
+        pdf.set_font("DejaVu", style="I", size=8)
+        pdf.cell(0, 10, f"Выгрузка выполнено: {self.generated_at.strftime('%d-%m-%Y_%H-%M')}", ln=True, align="C")
+        pdf.cell(0, 10, "Выгрузил:", ln=True, align="C")
+        pdf.cell(0, 10, self.duty_dus_name, ln=True, align="C")
+
+# Сводка по базам нескольких узлов связи. Каждая база считается в отдельном
+# процессе (get_load_analytics), частичные итоги складываются по именам
+# справочников: id в разных базах совпадать не обязаны. ДУС разных узлов -
+# разные люди, поэтому их нагрузка ведется с подписью узла.
+StationLoad = namedtuple("StationLoad", "station analytics duty_dus_names")
+ConsolidatedLoad = namedtuple("ConsolidatedLoad", "stations analytics")
+
+def station_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+# Базы узлов только читаются: режим журнала остается тем, что в файле.
+STATION_PRAGMAS = {"journal_mode": None}
+
+def schema_version(path):
+    connection = sqlite3.connect(read_only_uri(path), uri=True)
+    try:
+        return connection.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        connection.close()
 
-            item = QTableWidgetItem(corr_type)
-            self.category_totals_table.setItem(i, 0, item)
+def station_load(path, start_date, end_date, filter_names=(None, None, None)):
+    # Выполняется в процессе пула: аргументы и результат передаются через pickle.
+    # Файл узла открывается только для чтения. Базу старой версии схемы
+    # обновляет временная копия; базу новее поддерживаемой прочитать нельзя.
+    version = schema_version(path)
+    if version > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(
+            f"{path}: версия схемы базы ({version}) новее поддерживаемой ({SCHEMA_VERSION})")
+    if version == SCHEMA_VERSION:
+        return read_station_load(path, path, start_date, end_date, filter_names)
+    import tempfile
+    with tempfile.TemporaryDirectory() as temporary:
+        copy_path = os.path.join(temporary, os.path.basename(path))
+        source = sqlite3.connect(read_only_uri(path), uri=True)
+        destination = sqlite3.connect(copy_path)
+        try:
+            source.backup(destination)
+        finally:
+            destination.close()
+            source.close()
+        db_manager = DatabaseManager(copy_path)
+        try:
+            db_manager.migrate()
+        finally:
+            db_manager.close()
+        return read_station_load(path, copy_path, start_date, end_date, filter_names)
 
-            item = QTableWidgetItem(urgency)
-            self.category_totals_table.setItem(i, 1, item)
+def read_station_load(path, db_path, start_date, end_date, filter_names):
+    db_manager = DatabaseManager(db_path, STATION_PRAGMAS, read_only=True)
+    try:
+        analytics = db_manager.get_load_analytics(start_date, end_date, db_manager.resolve_filters(*filter_names))
+        duty_dus_names = {row[0]: db_manager.duty_dus.short_name(row[0]) for row in analytics.duty_dus}
+        return StationLoad(path, analytics, duty_dus_names)
+    finally:
+        db_manager.close()
+
+def merge_station_loads(loads):
+    # Имена узлов - имена файлов; если они совпадают (у всех correspondence.db),
+    # подписью служит путь.
+    names = [station_name(load.station) for load in loads]
+    if len(set(names)) < len(names):
+        names = [load.station for load in loads]
+    duty_dus = []
+    for name, load in zip(names, loads):
+        for duty_dus_id, *totals in load.analytics.duty_dus:
+            duty_dus.append((f"{name}: {load.duty_dus_names.get(duty_dus_id) or 'Не указан'}", *totals))
+    analytics = [load.analytics for load in loads]
+    merged = LoadAnalytics(
+        sum_by_key([row for item in analytics for row in item.categories], 2, lookup_order(CORR_TYPES, URGENCIES)),
+        sum_by_key([row for item in analytics for row in item.type_totals], 1, lookup_order(CORR_TYPES)),
+        tuple(sum(values) for values in zip(*(item.grand_total for item in analytics))) or (0, 0, 0),
+        sum_by_key([row for item in analytics for row in item.days], 1),
+        sum_by_key([row for item in analytics for row in item.shifts], 2, lookup_order((), PERIODS)),
+        tuple(duty_dus))
+    return ConsolidatedLoad(tuple((name, *load.analytics.grand_total) for name, load in zip(names, loads)), merged)
+
+def consolidate_stations(paths, start_date, end_date, filter_names=(None, None, None), jobs=None, progress=None):
+    # Базы считаются параллельно в пуле процессов: разбор строк свертки в
+    # Python держит GIL, поэтому потоки здесь не дали бы выигрыша.
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    loads = {}
+    if jobs <= 1:
+        for path in paths:
+            loads[path] = station_load(path, start_date, end_date, filter_names)
+            if progress:
+                progress(len(loads), len(paths))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(station_load, path, start_date, end_date, filter_names): path
+                       for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                loads[futures[future]] = future.result()
+                if progress:
+                    progress(len(loads), len(paths))
+    return merge_station_loads([loads[path] for path in paths])
+
+class ConsolidatedReport(PdfReport):
+    STATION_HEADERS = ["Узел связи", "Входящая", "Исходящая", "Записей"]
+    STATION_WIDTHS = [70, 25, 25, 20]
+
+    def __init__(self, consolidated, start_date, end_date, duty_dus_name="", generated_at=None, font_cache=None,
+                 filters_caption="", instrumentation=None):
+        self.consolidated = consolidated
+        self.font_cache = font_cache or FONT_CACHE
+        self.start_date = start_date
+        self.end_date = end_date
+        self.filters_caption = filters_caption
+        self.duty_dus_name = duty_dus_name
+        self.generated_at = generated_at or datetime.now()
+        self.instrumentation = instrumentation or Instrumentation()
+
+    def write(self, filename, progress=None):
+        with self.instrumentation.timed("pdf.fonts"):
+            pdf = self.create_pdf()
+        self.write_title(pdf, "Сводный отчет по узлам связи")
+        pdf.cell(0, 10, f"Период: {self.start_date} - {self.end_date}", ln=True, align="C")
+        if self.filters_caption:
+            pdf.cell(0, 10, f"Отбор: {self.filters_caption}", ln=True, align="C")
+        with self.instrumentation.timed("pdf.totals"):
+            self.write_title(pdf, "Итоги по узлам связи")
+            self.write_table(pdf, self.STATION_HEADERS, self.STATION_WIDTHS,
+                             [[str(value) for value in row] for row in self.consolidated.stations])
+            pdf.ln(10)
+            self.write_analytics(pdf, self.consolidated.analytics, None)
+        self.write_footer(pdf)
+        with self.instrumentation.timed("pdf.output"):
+            self.font_cache.output(pdf, filename)
+        return filename
+
+# Пакетная выгрузка: по PDF на каждого ДУС или на каждую смену за период, с
+# тем же содержимым, что и export_to_pdf, и отбором по этому ДУС или смене.
+# Отчеты строятся в пуле процессов: вывод fpdf держит GIL.
+BATCH_KINDS = ("duty_dus", "periods")
+BatchItem = namedtuple("BatchItem", "label filters duty_dus_name filename")
+
+def safe_filename(text):
+    return "".join(char if char.isalnum() or char in "-." else "_" for char in text).strip("._")
+
+def plan_batch_reports(db_manager, start_date, end_date, kind, keys=None, output_dir=".", filters=None,
+                       duty_dus_name=""):
+    # keys - id дежурных или названия смен; без них - все дежурные или все смены.
+    # Подпись "Выгрузил" в отчете ДУС по умолчанию - сам дежурный.
+    if kind not in BATCH_KINDS:
+        raise ValueError(f"Неизвестный вид пакетной выгрузки: {kind}")
+    filters = filters or SearchFilters()
+    prefix = f"{start_date}_{end_date}"
+    items = []
+    if kind == "duty_dus":
+        officers = {duty_dus.id: duty_dus for duty_dus in db_manager.duty_dus.list()}
+        for key in keys or list(officers):
+            duty_dus = officers.get(key)
+            if duty_dus is None:
+                raise ValueError(f"Дежурный с id {key} не найден")
+            filename = f"{prefix}_{key}_{safe_filename(duty_dus.short_name)}.pdf"
+            items.append(BatchItem(duty_dus.full_name, filters._replace(duty_dus_id=key),
+                                   duty_dus_name or duty_dus.full_name, os.path.join(output_dir, filename)))
+    else:
+        periods = {name: period_id for period_id, name in db_manager.get_periods()}
+        for key in keys or list(periods):
+            if key not in periods:
+                raise ValueError(f"Неизвестный период: {key}")
+            items.append(BatchItem(key, filters._replace(period_id=periods[key]), duty_dus_name,
+                                   os.path.join(output_dir, f"{prefix}_{safe_filename(key)}.pdf")))
+    return items
+
+def render_batch_report(db_path, start_date, end_date, item, include_results=True, generated_at=None):
+    # Выполняется в процессе пула, как station_load.
+    db_manager = DatabaseManager(db_path)
+    try:
+        return PdfReport(db_manager, start_date, end_date, include_results=include_results,
+                         duty_dus_name=item.duty_dus_name, generated_at=generated_at,
+                         filters=item.filters).write(item.filename)
+    finally:
+        db_manager.close()
+
+def run_batch_reports(db_path, start_date, end_date, items, include_results=True, generated_at=None, jobs=None,
+                      progress=None):
+    jobs = min(jobs or os.cpu_count() or 1, len(items))
+    generated_at = generated_at or datetime.now()
+    args = (db_path, start_date, end_date)
+    FONT_CACHE.warm()
+    if jobs <= 1:
+        for done, item in enumerate(items, start=1):
+            render_batch_report(*args, item, include_results, generated_at)
+            if progress:
+                progress(done, len(items))
+        return [item.filename for item in items]
+    # spawn, а не fork: выгрузка запускается и из фонового потока окна Qt.
+    # При отмене (исключение из progress) еще не начатые отчеты снимаются.
+    import multiprocessing
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [executor.submit(render_batch_report, *args, item, include_results, generated_at)
+                   for item in items]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            future.result()
+            if progress:
+                progress(done, len(items))
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+    return [item.filename for item in items]
+
+# Табличные выгрузки (CSV, XLSX) живут в export.py и загружаются только при
+# выгрузке; командной строке нужны лишь имена форматов.
+REPORT_FORMAT_NAMES = ("pdf", "csv", "xlsx")
+
+def run_gui(args):
+    from gui import run_gui
+    return run_gui(args)
+
+def run_serve(args):
+    from service import run_serve
+    return run_serve(args)
+
+def run_rollup(args):
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        if args.rebuild:
+            db_manager.rebuild_daily_totals()
+            print("Суточная свертка перестроена.")
+        mismatches = db_manager.verify_daily_totals()
+        for mismatch in mismatches:
+            print(*mismatch, sep="\t")
+        print(f"Расхождений: {len(mismatches)}")
+        return 1 if mismatches else 0
+    finally:
+        db_manager.close()
+
+def format_duty_dus_full(duty_dus):
+    return f"{duty_dus[1]} {duty_dus[2]} {duty_dus[3]} {duty_dus[4]}"
+
+def resolve_officer_name(db_manager, officer):
+    # --officer принимает id дежурного из duty_dus или готовую строку подписи.
+    if officer and officer.isdigit():
+        duty_dus = db_manager.duty_dus.get(int(officer))
+        if duty_dus:
+            return duty_dus.full_name
+        raise SystemExit(f"Дежурный с id {officer} не найден")
+    return officer or ""
+
+def run_report(args):
+    generated_at = datetime.now()
+    output = args.output or f"{generated_at.strftime('%d-%m-%Y_%H-%M')}_report.{args.format}"
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        try:
+            filters = db_manager.resolve_filters(args.corr_type, args.urgency, args.period, args.duty_dus)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        end_date = args.end_date or args.start_date
+        if args.format == "pdf":
+            report = PdfReport(db_manager, args.start_date, end_date, include_results=not args.totals_only,
+                               duty_dus_name=resolve_officer_name(db_manager, args.officer),
+                               generated_at=generated_at, filters=filters)
+        else:
+            from export import REPORT_FORMATS
+            report = REPORT_FORMATS[args.format](db_manager, args.start_date, end_date,
+                                                 include_results=not args.totals_only, filters=filters)
+        report.write(output)
+        print(output)
+        return 0
+    finally:
+        db_manager.close()
+
+def run_consolidate(args):
+    generated_at = datetime.now()
+    output = args.output or f"{generated_at.strftime('%d-%m-%Y_%H-%M')}_consolidated.pdf"
+    end_date = args.end_date or args.start_date
+    filter_names = (args.corr_type, args.urgency, args.period)
+    start = time.perf_counter()
+    try:
+        consolidated = consolidate_stations(args.files, args.start_date, end_date, filter_names, jobs=args.jobs)
+    except (sqlite3.DatabaseError, ValueError) as e:
+        raise SystemExit(f"Не удалось обработать базу: {e}")
+    elapsed = time.perf_counter() - start
+    filters_caption = "; ".join(f"{label}: {value}" for label, value in zip(("Тип", "Срочность", "Период"),
+                                                                          filter_names) if value is not None)
+    report = ConsolidatedReport(consolidated, args.start_date, end_date, duty_dus_name=args.officer or "",
+                                generated_at=generated_at, filters_caption=filters_caption,
+                                instrumentation=args.instrumentation)
+    report.write(output)
+    print(output)
+    print(f"Узлов связи: {len(consolidated.stations)}, записей: {consolidated.analytics.grand_total[2]}, "
+          f"{elapsed:.2f} с")
+    return 0
+
+def run_batch(args):
+    generated_at = datetime.now()
+    end_date = args.end_date or args.start_date
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        try:
+            keys = args.items
+            if args.by == "duty_dus":
+                keys = [int(key) if key.isdigit() else key for key in keys]
+            items = plan_batch_reports(db_manager, args.start_date, end_date, args.by, keys, args.output_dir,
+                                       db_manager.resolve_filters(args.corr_type, args.urgency),
+                                       args.officer or "")
+        except ValueError as e:
+            raise SystemExit(str(e))
+    finally:
+        db_manager.close()
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    filenames = run_batch_reports(args.db, args.start_date, end_date, items, include_results=not args.totals_only,
+                                  generated_at=generated_at, jobs=args.jobs)
+    elapsed = time.perf_counter() - start
+    for filename in filenames:
+        print(filename)
+    print(f"Отчетов: {len(filenames)}, {elapsed:.2f} с")
+    return 0
+
+def run_archive(args):
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        archived = db_manager.archive_closed_periods(args.before, args.granularity)
+        for name, row_count in archived:
+            print(f"{name}: {row_count} записей")
+        if not archived:
+            print("Закрытых периодов в базе нет.")
+        elif not args.no_vacuum:
+            db_manager.vacuum()
+        return 0
+    finally:
+        db_manager.close()
 
-            item = QTableWidgetItem(str(incoming_total))
-            self.category_totals_table.setItem(i, 2, item)
+def run_backup(args):
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        if args.list:
+            for path in db_manager.list_backups(args.backup_dir):
+                print(path)
+            return 0
+        db_manager.migrate()
+        result = db_manager.backup(args.backup_dir, compact=args.compact, verify=not args.no_verify, keep=args.keep)
+        print(result.path)
+        print(f"{result.size / 1e6:.1f} МБ за {result.seconds:.2f} с ({result.size / 1e6 / result.seconds:.1f} МБ/с)")
+        return 0
+    finally:
+        db_manager.close()
 
-            item = QTableWidgetItem(str(outgoing_total))
-            self.category_totals_table.setItem(i, 3, item)
+def run_restore(args):
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        try:
+            saved = db_manager.restore(args.snapshot, args.backup_dir)
+        except sqlite3.DatabaseError as e:
+            raise SystemExit(f"Снимок не восстановлен: {e}")
+        db_manager.migrate()
+        print(f"Прежнее состояние базы сохранено: {saved.path}")
+        print(f"База восстановлена из {args.snapshot}")
+        return 0
+    finally:
+        db_manager.close()
 
-    def export_to_pdf(self):
-        current_datetime = datetime.now()
-        formatted_datetime = current_datetime.strftime('%d-%m-%Y_%H-%M')
-        filename = f"{formatted_datetime}_report.pdf"
-        full_filename, _ = QFileDialog.getSaveFileName(self, "Сохранить PDF", filename, "PDF Files (*.pdf)")
+def format_import_result(result):
+    if result.already_imported:
+        return f"{result.source}: уже загружен ({result.skipped} записей)"
+    resumed = f", продолжено с записи {result.skipped + 1}" if result.skipped else ""
+    return f"{result.source}: добавлено {result.inserted}, отклонено {result.rejected}{resumed}"
 
-        if full_filename:
-            pdf = FPDF(orientation="P", unit="mm", format="A4")
-            font_path_regular = 'DejaVuSansCondensed.ttf'
-            font_path_bold = 'DejaVuSansCondensed-Bold.ttf'
-            font_path_italic = 'DejaVuSerifCondensed-Italic.ttf'
-            pdf.add_font('DejaVu', '', font_path_regular, uni=True)
-            pdf.add_font('DejaVu', 'B', font_path_bold, uni=True)
-            pdf.add_font('DejaVu', 'I', font_path_italic, uni=True)
-            pdf.add_page()
-            pdf.set_font("DejaVu", size=8)
-
-            if self.export_search_results_checkbox.isChecked():
-                pdf.set_font("DejaVu", style="B", size=10)
-                pdf.cell(0, 10, "Результаты поиска корреспонденции", ln=True, align="C")
-                pdf.set_font("DejaVu", size=8)
-                headers = ["Дата", "Тип", "Срочность", "Входящая", "Исходящая", "Период", "ДУС"]
-                column_widths = [25, 25, 30, 20, 20, 35, 40]
-                for i, header in enumerate(headers):
-                    pdf.cell(column_widths[i], 10, header, border=1, align="C")
-                pdf.ln()
-                for i in range(self.search_results_table.rowCount()):
-                    for j in range(self.search_results_table.columnCount()):
-                        cell_value = self.search_results_table.item(i, j).text()
-                        pdf.cell(column_widths[j], 10, cell_value, border=1, align="C")
-                    pdf.ln()
-
-            pdf.ln(20)
-            pdf.set_font("DejaVu", style="B", size=10)
-            pdf.cell(0, 10, "Итоги по категориям", ln=True, align="C")
-            pdf.set_font("DejaVu", size=8, align="C")
-            headers = ["Тип", "Срочность", "Входящая", "Исходящая"]
-            column_widths = [40, 30, 20, 20]
-            for i, header in enumerate(headers):
-                pdf.cell(column_widths[i], 10, header, border=1, align="C")
-            pdf.ln()
-            for i in range(self.category_totals_table.rowCount()):
-                for j in range(self.category_totals_table.columnCount()):
-                    cell_value = self.category_totals_table.item(i, j).text()
-                    pdf.cell(column_widths[j], 10, cell_value, border=1, align="C")
-                pdf.ln()
-
-            pdf.ln(20)
-            pdf.set_font("DejaVu", style="I", size=8)
-            pdf.cell(0, 10, f"Выгрузка выполнено: {formatted_datetime}", ln=True, align="C")
-            pdf.cell(0, 10, "Выгрузил:", ln=True, align="C")
-            selected_dus = self.export_duty_dus_input.currentText()
-            pdf.cell(0, 10, selected_dus, ln=True, align="C")
-
-            pdf.output(full_filename)
-            QMessageBox.information(self, "Успех", "Результаты поиска экспортированы в PDF")
+def run_import(args):
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        importer = CorrespondenceImporter(db_manager, batch_size=args.batch)
+        start = time.perf_counter()
+        result = importer.run(args.file, args.format, rejects_path=args.rejects, restart=args.restart)
+        elapsed = time.perf_counter() - start
+        print(format_import_result(result))
+        if result.inserted:
+            print(f"{result.inserted / elapsed:.0f} записей/с")
+        for number, error in result.rejects:
+            print(f"запись {number}: {error}", file=sys.stderr)
+        if result.rejected > len(result.rejects):
+            print(f"... и еще {result.rejected - len(result.rejects)}", file=sys.stderr)
+        return 1 if result.rejected else 0
+    finally:
+        db_manager.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Система учета корреспонденции")
+    parser.add_argument("--db", default="correspondence.db", help="путь к файлу базы данных")
+    parser.add_argument("--slow-log", help="журнал медленных операций (с ротацией)")
+    parser.add_argument("--slow-ms", type=float, default=SLOW_OPERATION_MS,
+                        help="порог медленной операции, мс")
+    parser.add_argument("--stats", action="store_true", help="вывести гистограммы задержек по завершении")
+    parser.add_argument("--backup-dir", help=f"каталог резервных копий, по умолчанию {BACKUP_DIR_NAME} рядом с базой")
+    parser.add_argument("--backup-every", type=float, default=0,
+                        help="интервал резервного копирования из окна программы, мин (0 - только вручную)")
+    parser.add_argument("--server", help="работать через службу serve по адресу, например 127.0.0.1:8765")
+    parser.set_defaults(handler=run_gui)
+    subparsers = parser.add_subparsers()
+
+    serve_parser = subparsers.add_parser("serve", help="служба ввода для нескольких рабочих мест (JSON по HTTP)")
+    serve_parser.add_argument("--host", help="адрес службы, по умолчанию 127.0.0.1; другой адрес - только с ключом "
+                                             "в переменной CORRESPONDENCE_SERVICE_TOKEN")
+    serve_parser.add_argument("--port", type=int, help="порт службы, по умолчанию 8765; 0 - любой свободный")
+    serve_parser.add_argument("--batch", type=int, help="больше всего записей в одной транзакции")
+    serve_parser.set_defaults(handler=run_serve)
+
+    rollup_parser = subparsers.add_parser("rollup", help="проверка и перестроение суточной свертки итогов")
+    rollup_parser.add_argument("--rebuild", action="store_true", help="перестроить свертку перед проверкой")
+    rollup_parser.set_defaults(handler=run_rollup)
+
+    report_parser = subparsers.add_parser("report", help="выгрузка отчета без графического интерфейса")
+    report_parser.add_argument("--from", dest="start_date", required=True, type=normalize_date,
+                               help="начальная дата (YYYY-MM-DD или DD.MM.YYYY)")
+    report_parser.add_argument("--to", dest="end_date", type=normalize_date,
+                               help="конечная дата, по умолчанию равна начальной")
+    report_parser.add_argument("--format", default="pdf", choices=REPORT_FORMAT_NAMES,
+                               help="формат отчета: PDF или таблица CSV/XLSX для дальнейшей обработки")
+    report_parser.add_argument("--officer", help="id дежурного из базы или текст подписи \"Выгрузил\"")
+    report_parser.add_argument("--output", help="файл отчета, по умолчанию <дата>_report.<формат>")
+    report_parser.add_argument("--totals-only", action="store_true",
+                               help="без результатов поиска, только итоги по категориям")
+    report_parser.add_argument("--corr-type", help="отбор по типу информации, например ТЛФ")
+    report_parser.add_argument("--urgency", help="отбор по срочности")
+    report_parser.add_argument("--period", help="отбор по периоду дежурства")
+    report_parser.add_argument("--duty-dus", type=int, help="отбор по id дежурного")
+    report_parser.set_defaults(handler=run_report)
+
+    batch_parser = subparsers.add_parser("batch", help="отчеты PDF по каждому ДУС или по каждой смене")
+    batch_parser.add_argument("items", nargs="*",
+                              help="id дежурных или названия смен, по умолчанию - все")
+    batch_parser.add_argument("--by", choices=BATCH_KINDS, default="duty_dus",
+                              help="отчет на каждого дежурного (duty_dus) или на каждую смену (periods)")
+    batch_parser.add_argument("--from", dest="start_date", required=True, type=normalize_date,
+                              help="начальная дата (YYYY-MM-DD или DD.MM.YYYY)")
+    batch_parser.add_argument("--to", dest="end_date", type=normalize_date,
+                              help="конечная дата, по умолчанию равна начальной")
+    batch_parser.add_argument("--output-dir", default=".", help="каталог для отчетов")
+    batch_parser.add_argument("--officer",
+                              help="текст подписи \"Выгрузил\", по умолчанию в отчетах ДУС - сам дежурный")
+    batch_parser.add_argument("--jobs", type=int, help="число процессов, по умолчанию по числу ядер")
+    batch_parser.add_argument("--totals-only", action="store_true",
+                              help="без результатов поиска, только итоги по категориям")
+    batch_parser.add_argument("--corr-type", help="отбор по типу информации, например ТЛФ")
+    batch_parser.add_argument("--urgency", help="отбор по срочности")
+    batch_parser.set_defaults(handler=run_batch)
+
+    archive_parser = subparsers.add_parser("archive", help="перенос закрытых периодов в архивные файлы")
+    archive_parser.add_argument("--before", type=normalize_date,
+                                help="архивировать периоды, закончившиеся до периода этой даты, по умолчанию - сегодня")
+    archive_parser.add_argument("--granularity", choices=ARCHIVE_GRANULARITIES, default="year",
+                                help="период архива: год или месяц")
+    archive_parser.add_argument("--no-vacuum", action="store_true", help="не сжимать базу после переноса")
+    archive_parser.set_defaults(handler=run_archive)
+
+    backup_parser = subparsers.add_parser("backup", help="резервная копия базы без остановки работы")
+    backup_parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="сколько последних снимков хранить")
+    backup_parser.add_argument("--compact", action="store_true", help="сжать снимок (VACUUM INTO)")
+    backup_parser.add_argument("--no-verify", action="store_true", help="не проверять снимок (integrity_check)")
+    backup_parser.add_argument("--list", action="store_true", help="вывести имеющиеся снимки")
+    backup_parser.set_defaults(handler=run_backup)
+
+    restore_parser = subparsers.add_parser("restore", help="восстановление базы из снимка (текущее состояние "
+                                                          "сохраняется в --backup-dir)")
+    restore_parser.add_argument("snapshot", help="файл базы в каталоге снимка (backup --list)")
+    restore_parser.set_defaults(handler=run_restore)
+
+    consolidate_parser = subparsers.add_parser("consolidate", help="сводный отчет по базам нескольких узлов связи")
+    consolidate_parser.add_argument("files", nargs="+", help="файлы баз данных узлов связи")
+    consolidate_parser.add_argument("--from", dest="start_date", required=True, type=normalize_date,
+                                    help="начальная дата (YYYY-MM-DD или DD.MM.YYYY)")
+    consolidate_parser.add_argument("--to", dest="end_date", type=normalize_date,
+                                    help="конечная дата, по умолчанию равна начальной")
+    consolidate_parser.add_argument("--output", help="файл отчета, по умолчанию <дата>_consolidated.pdf")
+    consolidate_parser.add_argument("--officer", help="текст подписи \"Выгрузил\"")
+    consolidate_parser.add_argument("--jobs", type=int, help="число процессов, по умолчанию по числу ядер")
+    consolidate_parser.add_argument("--corr-type", help="отбор по типу информации, например ТЛФ")
+    consolidate_parser.add_argument("--urgency", help="отбор по срочности")
+    consolidate_parser.add_argument("--period", help="отбор по периоду дежурства")
+    consolidate_parser.set_defaults(handler=run_consolidate)
+
+    import_parser = subparsers.add_parser("import", help="массовая загрузка нагрузки из CSV или JSONL")
+    import_parser.add_argument("file", help=f"файл с полями {', '.join(IMPORT_FIELDS)}")
+    import_parser.add_argument("--format", choices=sorted(set(IMPORT_FORMATS.values())),
+                               help="формат файла, по умолчанию по расширению")
+    import_parser.add_argument("--rejects", help="CSV-файл для отклоненных записей")
+    import_parser.add_argument("--restart", action="store_true",
+                               help="загрузить файл заново, не продолжая прерванную загрузку")
+    import_parser.add_argument("--batch", type=int, default=IMPORT_BATCH, help="записей в одной транзакции")
+    import_parser.set_defaults(handler=run_import)
+
+    args = parser.parse_args(argv)
+    args.instrumentation = Instrumentation(enabled=args.stats, slow_ms=args.slow_ms, log_path=args.slow_log)
+    try:
+        return args.handler(args)
+    finally:
+        if args.stats:
+            print(args.instrumentation.format_summary(), file=sys.stderr)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    db_path = "correspondence.db"
-    window = CorrespondenceApp(db_path)
-    window.show()
-    sys.exit(app.exec_())
+    # Процессы пула в собранном PyInstaller exe запускаются тем же exe.
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
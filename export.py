@@ -0,0 +1,238 @@
+import csv
+import itertools
+import os
+
+from database import (EXPORT_PAGE_SIZE, LOAD_SECTIONS, PdfReport, date_to_day, day_to_date, format_category_totals,
+                      format_load_rows)
+
+# Табличные выгрузки для дальнейшей обработки. Строки результатов читаются
+# постранично (iter_search_correspondence) и сразу пишутся в файл, поэтому
+# память не зависит от диапазона; итоги и разрезы LoadAnalytics идут
+# отдельными разделами (CSV) или листами (XLSX).
+
+class TableReport:
+    def __init__(self, db_manager, start_date, end_date, include_results=True, filters=None):
+        self.db_manager = db_manager
+        self.start_date = start_date
+        self.end_date = end_date
+        self.include_results = include_results
+        self.filters = filters
+
+    def result_pages(self, progress=None):
+        # Страницы строк в колонках RESULT_HEADERS: поля записи и подпись ДУС.
+        total = self.db_manager.count_correspondence(self.start_date, self.end_date, self.filters)
+        corr_types, urgencies, periods = (dict(self.db_manager.get_lookup(table))
+                                          for table in ("corr_types", "urgencies", "periods"))
+        short_names = {duty_dus.id: duty_dus.short_name for duty_dus in self.db_manager.duty_dus.list()}
+        dates = {}
+        done = 0
+        for page in self.db_manager.iter_correspondence_id_pages(self.start_date, self.end_date, EXPORT_PAGE_SIZE,
+                                                                 self.filters):
+            for day in {row[1] for row in page}.difference(dates):
+                dates[day] = day_to_date(day)
+            yield [(dates[day], corr_types[corr_type_id], urgencies[urgency_id], incoming, outgoing,
+                    periods[period_id], short_names.get(duty_dus_id, ""))
+                   for _, day, corr_type_id, urgency_id, incoming, outgoing, period_id, duty_dus_id in page]
+            done += len(page)
+            if progress:
+                progress(done, total)
+
+    def write(self, filename, progress=None):
+        # Прерванная выгрузка (отмена задачи, ошибка) не оставляет неполный файл.
+        try:
+            return self.write_file(filename, progress)
+        except BaseException:
+            if os.path.exists(filename):
+                os.remove(filename)
+            raise
+
+    def sections(self, convert=str):
+        # (заголовок, колонки, строки) итогов - те же разделы, что в PDF.
+        analytics = self.db_manager.get_load_analytics(self.start_date, self.end_date, self.filters)
+        sections = [("Итоги по категориям", PdfReport.TOTAL_HEADERS, format_category_totals(analytics, convert))]
+        for section, title, headers in LOAD_SECTIONS:
+            sections.append((title, headers,
+                             format_load_rows(analytics, section, self.db_manager.duty_dus, convert)))
+        return sections
+
+class CsvReport(TableReport):
+    # UTF-8 с BOM: по нему Excel распознает кодировку кириллических заголовков.
+    ENCODING = "utf-8-sig"
+
+    def write_file(self, filename, progress=None):
+        instrumentation = self.db_manager.instrumentation
+        with open(filename, "w", newline="", encoding=self.ENCODING) as output:
+            writer = csv.writer(output)
+            if self.include_results:
+                with instrumentation.timed("csv.results"):
+                    writer.writerow(PdfReport.RESULT_HEADERS)
+                    for page in self.result_pages(progress):
+                        writer.writerows(page)
+                    writer.writerow([])
+            with instrumentation.timed("csv.totals"):
+                for title, headers, rows in self.sections():
+                    writer.writerow([title])
+                    writer.writerow(headers)
+                    writer.writerows(rows)
+                    writer.writerow([])
+        return filename
+
+# Минимальная книга XLSX (ZIP с XML-частями) без сторонних библиотек: лист
+# пишется в архив по мере поступления строк. Разметка ячейки строится один раз
+# на значение (XlsxCells); строки идут в общую таблицу строк книги, которая
+# растет с числом разных имен, а не записей. Даты 'YYYY-MM-DD' - числа Excel с
+# форматом даты.
+XLSX_MAX_ROWS = 1048576
+XLSX_SHEET_NAME_LENGTH = 31
+
+def xml_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+class XlsxCells(dict):
+    def __init__(self):
+        super().__init__()
+        self.strings = []
+
+    def __missing__(self, value):
+        if value is None:
+            xml = "<c/>"
+        elif isinstance(value, (int, float)):
+            xml = f"<c><v>{value}</v></c>"
+        elif len(value) == 10 and value[4] == "-" and value[7] == "-" and value.replace("-", "").isdigit():
+            # Номер дня от 1970-01-01 плюс 25569 - серийный номер даты Excel.
+            xml = f'<c s="1"><v>{date_to_day(value) + 25569}</v></c>'
+        else:
+            xml = f'<c t="s"><v>{len(self.strings)}</v></c>'
+            self.strings.append(value)
+        self[value] = xml
+        return xml
+
+class XlsxWriter:
+    NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+    def __init__(self, filename):
+        import zipfile
+        self.archive = zipfile.ZipFile(filename, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets = []
+        self.cells = XlsxCells()
+
+    def add_sheet(self, name, headers, rows, widths=None):
+        # Строки сверх предела Excel продолжаются на листах "name (2)", ...
+        rows = iter(rows)
+        part = 1
+        while True:
+            title = name if part == 1 else f"{name} ({part})"
+            self.sheets.append(title[:XLSX_SHEET_NAME_LENGTH])
+            if not self.write_sheet(len(self.sheets), headers, rows, widths):
+                return
+            # Лист заполнен до предела; пустое продолжение не создается.
+            first = next(rows, None)
+            if first is None:
+                return
+            rows = itertools.chain([first], rows)
+            part += 1
+
+    def write_sheet(self, number, headers, rows, widths):
+        # Возвращает True, если лист заполнен до XLSX_MAX_ROWS.
+        cell = self.cells.__getitem__
+        with self.archive.open(f"xl/worksheets/sheet{number}.xml", "w", force_zip64=True) as sheet:
+            columns = "".join(f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>'
+                              for i, width in enumerate(widths or [], start=1))
+            sheet.write(f'{self.XML_HEADER}<worksheet xmlns="{self.NAMESPACE}">'
+                        f'{f"<cols>{columns}</cols>" if columns else ""}<sheetData>'.encode("utf-8"))
+            chunk = ['<row r="1">', *map(cell, headers), "</row>"]
+            row_number = 1
+            for row in rows:
+                row_number += 1
+                chunk.append(f'<row r="{row_number}">')
+                chunk.extend(map(cell, row))
+                chunk.append("</row>")
+                if len(chunk) > 20000:
+                    sheet.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+                if row_number == XLSX_MAX_ROWS:
+                    break
+            chunk.append("</sheetData></worksheet>")
+            sheet.write("".join(chunk).encode("utf-8"))
+        return row_number == XLSX_MAX_ROWS
+
+    def close(self):
+        sheets = "".join(f'<sheet name="{xml_escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+                         for i, name in enumerate(self.sheets, start=1))
+        strings = "".join(f'<si><t xml:space="preserve">{xml_escape(value)}</t></si>'
+                          for value in self.cells.strings)
+        relationships = "".join(
+            f'<Relationship Id="rId{i}" Type="{self.RELATIONSHIPS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(self.sheets) + 1))
+        styles_id = len(self.sheets) + 1
+        strings_id = styles_id + 1
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(self.sheets) + 1))
+        parts = {
+            "[Content_Types].xml":
+                f'{self.XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/xl/workbook.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                '<Override PartName="/xl/styles.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                '<Override PartName="/xl/sharedStrings.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                f'{overrides}</Types>',
+            "_rels/.rels":
+                f'{self.XML_HEADER}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                f'<Relationship Id="rId1" Type="{self.RELATIONSHIPS}/officeDocument" Target="xl/workbook.xml"/>'
+                '</Relationships>',
+            "xl/workbook.xml":
+                f'{self.XML_HEADER}<workbook xmlns="{self.NAMESPACE}" xmlns:r="{self.RELATIONSHIPS}">'
+                f'<sheets>{sheets}</sheets></workbook>',
+            "xl/_rels/workbook.xml.rels":
+                f'{self.XML_HEADER}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                f'{relationships}<Relationship Id="rId{styles_id}" Type="{self.RELATIONSHIPS}/styles" '
+                'Target="styles.xml"/>'
+                f'<Relationship Id="rId{strings_id}" Type="{self.RELATIONSHIPS}/sharedStrings" '
+                'Target="sharedStrings.xml"/></Relationships>',
+            "xl/sharedStrings.xml":
+                f'{self.XML_HEADER}<sst xmlns="{self.NAMESPACE}" uniqueCount="{len(self.cells.strings)}">'
+                f'{strings}</sst>',
+            # Стиль 1 - встроенный формат даты 14 (по региональным настройкам).
+            "xl/styles.xml":
+                f'{self.XML_HEADER}<styleSheet xmlns="{self.NAMESPACE}">'
+                '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+                '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+                '<fill><patternFill patternType="gray125"/></fill></fills>'
+                '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+                '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+                '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+                '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+                '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+                '</styleSheet>',
+        }
+        for name, content in parts.items():
+            self.archive.writestr(name, content)
+        self.archive.close()
+
+class XlsxReport(TableReport):
+    RESULT_WIDTHS = [12, 10, 14, 11, 11, 18, 24]
+
+    def write_file(self, filename, progress=None):
+        instrumentation = self.db_manager.instrumentation
+        workbook = XlsxWriter(filename)
+        try:
+            if self.include_results:
+                with instrumentation.timed("xlsx.results"):
+                    workbook.add_sheet("Результаты", PdfReport.RESULT_HEADERS,
+                                       itertools.chain.from_iterable(self.result_pages(progress)), self.RESULT_WIDTHS)
+            with instrumentation.timed("xlsx.totals"):
+                for title, headers, rows in self.sections(convert=lambda value: value):
+                    workbook.add_sheet(title, headers, rows, [18] + [12] * (len(headers) - 1))
+        finally:
+            workbook.close()
+        return filename
+
+REPORT_FORMATS = {"pdf": PdfReport, "csv": CsvReport, "xlsx": XlsxReport}
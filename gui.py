@@ -0,0 +1,819 @@
+import sys
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
+                             QLineEdit, QPushButton, QComboBox, QTableWidget, QTableWidgetItem,
+                             QDateEdit, QTabWidget, QMessageBox, QFileDialog, QFormLayout, QCheckBox,
+                             QTableView, QHeaderView, QProgressBar)
+from PyQt5.QtCore import (QDate,Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer,
+                          pyqtSignal)
+import os
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+from database import (LOAD_SECTIONS, RANKS, CorrespondenceImporter, DatabaseManager, PdfReport, SEARCH_PAGE_SIZE,
+                      SearchFilters, format_category_totals, format_correspondence_row,
+                      format_import_result, format_load_rows, import_format, plan_batch_reports,
+                      run_batch_reports)
+from export import REPORT_FORMATS
+from service import ServiceClient
+
+# Модель результатов поиска: строки подгружаются страницами по мере прокрутки,
+# в памяти остаются не больше WINDOW_PAGES последних использованных страниц.
+# Вытесненная страница перечитывается по ключу (дата, id) последней строки
+# предыдущей страницы; эти ключи - единственное, что растет с диапазоном.
+class CorrespondenceResultsModel(QAbstractTableModel):
+    HEADERS = ["Дата", "Тип", "Срочность", "Входящая", "Исходящая", "Период", "ДУС"]
+    WINDOW_PAGES = 10
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.start_date = None
+        self.end_date = None
+        self.filters = None
+        self.pages = OrderedDict()
+        self.page_keys = []
+        self.next_key = None
+        self.row_count = 0
+        self.has_more = False
+
+    def set_range(self, start_date, end_date, first_page=None, filters=None):
+        self.beginResetModel()
+        self.start_date = start_date
+        self.end_date = end_date
+        self.filters = filters
+        self.pages = OrderedDict()
+        self.page_keys = []
+        self.next_key = None
+        self.row_count = 0
+        self.has_more = True
+        if first_page is not None:
+            self.add_page(list(first_page))
+        self.endResetModel()
+        if first_page is None:
+            self.fetchMore(QModelIndex())
+
+    def add_page(self, page):
+        self.page_keys.append(None if not self.page_keys else self.next_key)
+        self.has_more = len(page) == SEARCH_PAGE_SIZE
+        if page:
+            self.next_key = (page[-1][1], page[-1][0])
+            self.row_count += len(page)
+            self.store_page(len(self.page_keys) - 1, page)
+
+    def store_page(self, number, page):
+        self.pages[number] = page
+        self.pages.move_to_end(number)
+        while len(self.pages) > self.WINDOW_PAGES:
+            self.pages.popitem(last=False)
+
+    def page(self, number):
+        page = self.pages.get(number)
+        if page is not None:
+            self.pages.move_to_end(number)
+            return page
+        with self.db_manager.instrumentation.timed("gui.refetch_page"):
+            page = self.db_manager.search_correspondence_page(self.start_date, self.end_date, self.page_keys[number],
+                                                              filters=self.filters)
+        self.store_page(number, page)
+        return page
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        with self.db_manager.instrumentation.timed("gui.fetch_more"):
+            page = self.db_manager.search_correspondence_page(self.start_date, self.end_date, self.next_key,
+                                                              filters=self.filters)
+            if page:
+                self.beginInsertRows(QModelIndex(), self.row_count, self.row_count + len(page) - 1)
+                self.add_page(page)
+                self.endInsertRows()
+            else:
+                self.has_more = False
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        number, offset = divmod(index.row(), SEARCH_PAGE_SIZE)
+        page = self.page(number)
+        # После удаления записей перечитанная страница может оказаться короче.
+        if offset >= len(page):
+            return None
+        row = page[offset]
+        column = index.column()
+        if column == 6:
+            return self.db_manager.duty_dus.short_name(row[7])
+        return str(row[column + 1])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def iter_display_rows(self):
+        if self.start_date is None:
+            return
+        for row in self.db_manager.iter_search_correspondence(self.start_date, self.end_date, filters=self.filters):
+            yield format_correspondence_row(row, self.db_manager.duty_dus)
+
+class TaskCancelled(Exception):
+    pass
+
+class TaskSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+# Фоновая задача для QThreadPool. Функция получает саму задачу и через нее
+# сообщает прогресс и проверяет отмену. Соединения с базой ConnectionManager
+# создает отдельно для каждого потока пула.
+class Task(QRunnable):
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.signals = TaskSignals()
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def check_cancelled(self):
+        if self.is_cancelled:
+            raise TaskCancelled()
+
+    def report_progress(self, done, total):
+        self.check_cancelled()
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.func(self, *self.args)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+# Не более одной выполняющейся задачи на операцию ("search", "export", ...).
+class TaskRunner(QObject):
+    started = pyqtSignal(str)
+    stopped = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self.tasks = {}
+
+    def is_running(self, operation):
+        return operation in self.tasks
+
+    def submit(self, operation, func, *args, on_finished=None, on_failed=None, on_progress=None):
+        if self.is_running(operation):
+            return None
+        task = Task(func, *args)
+        task.setAutoDelete(False)
+        if on_finished:
+            task.signals.finished.connect(on_finished)
+        if on_failed:
+            task.signals.failed.connect(on_failed)
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *_, operation=operation: self._task_done(operation))
+        self.tasks[operation] = task
+        self.started.emit(operation)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, operation=None):
+        for name, task in self.tasks.items():
+            if operation is None or name == operation:
+                task.cancel()
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _task_done(self, operation):
+        self.tasks.pop(operation, None)
+        self.stopped.emit(operation)
+
+class CorrespondenceApp(QWidget):
+    def __init__(self, db_path, instrumentation=None, backup_dir=None, backup_minutes=0, server=None):
+        super().__init__()
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.server = server
+        # С --server базой владеет служба (service.py), окно - ее клиент.
+        if server:
+            self.db_manager = ServiceClient(server, instrumentation)
+        else:
+            self.db_manager = DatabaseManager(db_path, instrumentation=instrumentation)
+        self.task_runner = TaskRunner(self)
+        self.task_runner.started.connect(self.update_task_controls)
+        self.task_runner.stopped.connect(self.update_task_controls)
+        self.create_tables()
+        self.init_ui()
+        self.update_duty_dus_list()
+        self.update_task_controls()
+        # Резервное копирование по расписанию идет фоновой задачей и не мешает вводу.
+        self.backup_timer = QTimer(self)
+        self.backup_timer.timeout.connect(lambda: self.backup_database(notify=False))
+        if backup_minutes and not server:
+            self.backup_timer.start(int(backup_minutes * 60000))
+
+    def init_ui(self):
+        self.setWindowTitle("Система учета корреспонденции")
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
+
+        tab_widget = QTabWidget()
+        main_layout.addWidget(tab_widget)
+
+        self.create_add_correspondence_tab(tab_widget)
+        self.create_manage_duty_dus_tab(tab_widget)
+        self.create_search_correspondence_tab(tab_widget)
+
+        # Индикатор фоновых задач общий для всех вкладок.
+        progress_layout = QHBoxLayout()
+        self.task_progress_bar = QProgressBar()
+        progress_layout.addWidget(self.task_progress_bar)
+        self.cancel_task_button = QPushButton("Отмена")
+        self.cancel_task_button.clicked.connect(lambda: self.task_runner.cancel())
+        progress_layout.addWidget(self.cancel_task_button)
+        main_layout.addLayout(progress_layout)
+        self.task_progress_bar.hide()
+        self.cancel_task_button.hide()
+
+        self.setStyleSheet(self.get_stylesheet())
+
+    def get_stylesheet(self):
+        stylesheet = """
+            QWidget {
+                font-family: Arial;
+                font-size: 11pt;
+            }
+
+            QTabWidget {
+                border: none;
+            }
+
+            QTabWidget::pane {
+                border: none;
+            }
+
+            QTabBar::tab {
+                margin-left: 5px;
+                margin-right: 5px;
+                padding: 5px;
+                border-top-left-radius: 5px;
+                border-top-right-radius: 5px;
+                border: 1px solid #ccc;
+                color: #555;
+            }
+
+            QTabBar::tab:selected {
+                background-color: #f0f0f0;
+                border-bottom-color: #f0f0f0;
+                color: #333;
+            }
+
+            QPushButton {
+                border: 1px solid #555;
+                border-radius: 5px;
+                padding: 5px;
+            }
+
+            QPushButton:hover {
+                background-color: #f4f4f4;
+            }
+
+            QPushButton:pressed {
+                background-color: #eaeaea;
+            }
+
+            QLineEdit, QDateEdit, QComboBox {
+                border:hover {
+                    border: 1px solid #aaa;
+                }
+                border: 1px solid #ccc;
+                border-radius: 3px;
+                padding: 3px;
+            }
+
+            QTableWidget, QTableView {
+                border: 1px solid #ccc;
+            }
+
+            QTableWidget::item, QTableView::item {
+                border-bottom: 1px solid #ddd;
+                border-right: 1px solid #ddd;
+                padding: 5px;
+            }
+
+            QHeaderView::section {
+                background-color: #f0f0f0;
+                border: 1px solid #ccc;
+                padding: 3px;
+            }
+        """
+        return stylesheet
+
+    def create_add_correspondence_tab(self, tab_widget):
+        add_correspondence_tab = QWidget()
+        layout = QFormLayout()
+        add_correspondence_tab.setLayout(layout)
+
+        self.date_input = QDateEdit()
+        self.date_input.setDate(QDate.currentDate())
+        self.date_input.setCalendarPopup(True)
+
+        layout.addRow(QLabel("Дата:"), self.date_input)
+
+        self.corr_type_input = QComboBox()
+        self.corr_type_input.addItems([name for _, name in self.db_manager.get_corr_types()])
+
+        layout.addRow(QLabel("Тип информации:"), self.corr_type_input)
+
+        self.urgency_input = QComboBox()
+        self.urgency_input.addItems([name for _, name in self.db_manager.get_urgencies()])
+
+        layout.addRow(QLabel("Срочность:"), self.urgency_input)
+
+        self.incoming_input = QLineEdit()
+        layout.addRow(QLabel("Кол-во входящих:"), self.incoming_input)
+
+        self.outgoing_input = QLineEdit()
+        layout.addRow(QLabel("Кол-во исходящих:"), self.outgoing_input)
+
+        self.period_input = QComboBox()  # Создайте объект QComboBox перед использованием
+        self.period_input.addItems([name for _, name in self.db_manager.get_periods()])
+
+        layout.addRow(QLabel("Период дежурства:"), self.period_input)
+
+        self.duty_dus_input = QComboBox()
+        layout.addRow(QLabel("ДУС:"), self.duty_dus_input)
+
+
+        add_button = QPushButton("Добавить")
+        add_button.clicked.connect(self.add_correspondence)
+        layout.addRow(add_button)
+
+        self.import_button = QPushButton("Загрузить из файла (CSV, JSONL)")
+        self.import_button.clicked.connect(self.import_correspondence)
+        layout.addRow(self.import_button)
+
+        tab_widget.addTab(add_correspondence_tab, "Добавлении нагрузки")
+    def create_manage_duty_dus_tab(self, tab_widget):
+        manage_duty_dus_tab = QWidget()
+        layout = QVBoxLayout()
+        manage_duty_dus_tab.setLayout(layout)
+
+        add_layout = QVBoxLayout()
+        add_layout.addWidget(QLabel("Добавить дежурного по узлу связи"))
+        layout.addLayout(add_layout)
+
+        rank_layout = QHBoxLayout()
+        rank_layout.addWidget(QLabel("Звание:"))
+        self.rank_input = QComboBox()
+        self.rank_input.addItems(RANKS)
+        rank_layout.addWidget(self.rank_input)
+        add_layout.addLayout(rank_layout)
+
+        name_layout = QHBoxLayout()
+        name_layout.addWidget(QLabel("Имя:"))
+        self.first_name_input = QLineEdit()
+        name_layout.addWidget(self.first_name_input)
+        add_layout.addLayout(name_layout)
+
+        last_name_layout = QHBoxLayout()
+        last_name_layout.addWidget(QLabel("Фамилия:"))
+        self.last_name_input = QLineEdit()
+        last_name_layout.addWidget(self.last_name_input)
+        add_layout.addLayout(last_name_layout)
+
+        last_last_name_layout = QHBoxLayout()
+        last_last_name_layout.addWidget(QLabel("Отчество:"))
+        self.last_last_name_input = QLineEdit()
+        last_last_name_layout.addWidget(self.last_last_name_input)
+        add_layout.addLayout(last_last_name_layout)
+
+        add_button = QPushButton("Добавить")
+        add_button.clicked.connect(self.add_duty_dus)
+        add_layout.addWidget(add_button)
+
+        delete_layout = QVBoxLayout()
+        delete_layout.addWidget(QLabel("Удаление дежурного по узлу связи"))
+        layout.addLayout(delete_layout)
+
+        self.delete_duty_dus_input = QComboBox()
+        delete_layout.addWidget(self.delete_duty_dus_input)
+
+        delete_button = QPushButton("Удалить")
+        delete_button.clicked.connect(self.delete_duty_dus)
+        delete_layout.addWidget(delete_button)
+
+        backup_layout = QVBoxLayout()
+        backup_layout.addWidget(QLabel("Резервное копирование базы"))
+        layout.addLayout(backup_layout)
+
+        self.backup_button = QPushButton("Создать резервную копию")
+        self.backup_button.clicked.connect(lambda: self.backup_database())
+        backup_layout.addWidget(self.backup_button)
+
+        self.restore_button = QPushButton("Восстановить из копии")
+        self.restore_button.clicked.connect(self.restore_database)
+        backup_layout.addWidget(self.restore_button)
+
+        tab_widget.addTab(manage_duty_dus_tab, "Управление ДУС")
+
+    def create_search_correspondence_tab(self, tab_widget):
+        search_correspondence_tab = QWidget()
+        layout = QVBoxLayout()
+        search_correspondence_tab.setLayout(layout)
+
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(QLabel("Начальная дата:"))
+        self.start_date_input = QDateEdit()
+        self.start_date_input.setDate(QDate.currentDate())
+        self.start_date_input.setCalendarPopup(True)
+        search_layout.addWidget(self.start_date_input)
+
+        search_layout.addWidget(QLabel("Конечная дата:"))
+        self.end_date_input = QDateEdit()
+        self.end_date_input.setDate(QDate.currentDate())
+        self.end_date_input.setCalendarPopup(True)
+        search_layout.addWidget(self.end_date_input)
+
+        self.search_button = QPushButton("Поиск")
+        self.search_button.clicked.connect(self.search_correspondence)
+        search_layout.addWidget(self.search_button)
+
+        layout.addLayout(search_layout)
+
+        # Отбор выполняется в SQL; "Все" - без условия по полю.
+        filter_layout = QHBoxLayout()
+        self.corr_type_filter = QComboBox()
+        self.urgency_filter = QComboBox()
+        self.period_filter = QComboBox()
+        self.duty_dus_filter = QComboBox()
+        for label, combo, values in (("Тип:", self.corr_type_filter, self.db_manager.get_corr_types()),
+                                     ("Срочность:", self.urgency_filter, self.db_manager.get_urgencies()),
+                                     ("Период:", self.period_filter, self.db_manager.get_periods()),
+                                     ("ДУС:", self.duty_dus_filter, [])):
+            combo.addItem("Все", None)
+            for value_id, name in values:
+                combo.addItem(name, value_id)
+            filter_layout.addWidget(QLabel(label))
+            filter_layout.addWidget(combo)
+        layout.addLayout(filter_layout)
+
+        self.search_results_model = CorrespondenceResultsModel(self.db_manager, self)
+        self.search_results_table = QTableView()
+        self.search_results_table.setModel(self.search_results_model)
+        self.search_results_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        layout.addWidget(self.search_results_table)
+
+        # Итоги и ряды нагрузки считаются одним проходом (get_load_analytics).
+        analytics_tabs = QTabWidget()
+        self.category_totals_table = QTableWidget()
+        self.category_totals_table.setColumnCount(4)
+        self.category_totals_table.setHorizontalHeaderLabels([
+            "Тип", "Срочность", "Входящая", "Исходящая"
+        ])
+        analytics_tabs.addTab(self.category_totals_table, "По категориям")
+        self.load_tables = {}
+        for section, title, headers in LOAD_SECTIONS:
+            table = QTableWidget()
+            table.setColumnCount(len(headers))
+            table.setHorizontalHeaderLabels(headers)
+            analytics_tabs.addTab(table, title)
+            self.load_tables[section] = table
+        layout.addWidget(analytics_tabs)
+
+        self.export_duty_dus_input = QComboBox()
+        layout.addWidget(QLabel("Экспорт ДУС:"))
+        layout.addWidget(self.export_duty_dus_input)
+
+        self.export_search_results_checkbox = QCheckBox("Отобразить результаты всего поиска")
+        self.export_search_results_checkbox.setChecked(True)
+        self.export_search_results_checkbox.stateChanged.connect(self.toggle_search_results_export)
+        layout.addWidget(self.export_search_results_checkbox)
+
+        export_layout = QHBoxLayout()
+        self.export_button = QPushButton("Экспортировать в PDF")
+        self.export_button.clicked.connect(self.export_to_pdf)
+        export_layout.addWidget(self.export_button)
+        # Таблицы для дальнейшей обработки: строки выгружаются постранично.
+        self.export_csv_button = QPushButton("Экспортировать в CSV")
+        self.export_csv_button.clicked.connect(lambda: self.export_table("csv"))
+        export_layout.addWidget(self.export_csv_button)
+        self.export_xlsx_button = QPushButton("Экспортировать в XLSX")
+        self.export_xlsx_button.clicked.connect(lambda: self.export_table("xlsx"))
+        export_layout.addWidget(self.export_xlsx_button)
+        layout.addLayout(export_layout)
+
+        # Пакетная выгрузка: отдельный PDF на каждого ДУС или на каждую смену.
+        batch_layout = QHBoxLayout()
+        self.batch_duty_dus_button = QPushButton("PDF по каждому ДУС")
+        self.batch_duty_dus_button.clicked.connect(lambda: self.export_batch("duty_dus"))
+        batch_layout.addWidget(self.batch_duty_dus_button)
+        self.batch_periods_button = QPushButton("PDF по каждой смене")
+        self.batch_periods_button.clicked.connect(lambda: self.export_batch("periods"))
+        batch_layout.addWidget(self.batch_periods_button)
+        layout.addLayout(batch_layout)
+
+        tab_widget.addTab(search_correspondence_tab, "Статистика нагрузки")
+
+    def toggle_search_results_export(self, state):
+        if state == Qt.Checked:
+            self.search_results_table.show()
+        else:
+            self.search_results_table.hide()
+
+    def create_tables(self):
+        self.db_manager.create_tables()
+
+    def update_task_controls(self, operation=None):
+        busy = bool(self.task_runner.tasks)
+        self.search_button.setEnabled(not self.task_runner.is_running("search"))
+        for button in (self.export_button, self.export_csv_button, self.export_xlsx_button,
+                       self.batch_duty_dus_button, self.batch_periods_button):
+            button.setEnabled(not self.task_runner.is_running("export"))
+        self.import_button.setEnabled(not self.task_runner.is_running("import"))
+        self.backup_button.setEnabled(not self.task_runner.is_running("backup"))
+        self.restore_button.setEnabled(not busy)
+        if self.server:
+            # Загрузка, пакетная выгрузка и резервные копии работают с файлом
+            # базы напрямую и выполняются на компьютере службы.
+            for button in (self.import_button, self.batch_duty_dus_button, self.batch_periods_button,
+                           self.backup_button, self.restore_button):
+                button.setEnabled(False)
+        self.task_progress_bar.setVisible(busy)
+        self.cancel_task_button.setVisible(busy)
+        if busy:
+            # Пока задача не сообщила прогресс, индикатор в режиме ожидания.
+            self.task_progress_bar.setRange(0, 0)
+
+    def show_task_progress(self, done, total):
+        self.task_progress_bar.setRange(0, total)
+        self.task_progress_bar.setValue(done)
+
+    def show_task_error(self, message):
+        QMessageBox.critical(self, "Ошибка", message)
+
+    def update_duty_dus_list(self):
+        duty_dus_list = self.db_manager.update_duty_dus_list()
+        for combo in (self.duty_dus_input, self.delete_duty_dus_input, self.export_duty_dus_input):
+            selected = combo.currentData()
+            combo.clear()
+            for duty_dus in duty_dus_list:
+                combo.addItem(duty_dus.full_name, duty_dus.id)
+            if selected is not None and combo.findData(selected) >= 0:
+                combo.setCurrentIndex(combo.findData(selected))
+        selected = self.duty_dus_filter.currentData()
+        self.duty_dus_filter.clear()
+        self.duty_dus_filter.addItem("Все", None)
+        for duty_dus in duty_dus_list:
+            self.duty_dus_filter.addItem(duty_dus.short_name, duty_dus.id)
+        self.duty_dus_filter.setCurrentIndex(max(0, self.duty_dus_filter.findData(selected)))
+
+    def closeEvent(self, event):
+        self.task_runner.cancel()
+        self.task_runner.wait()
+        self.db_manager.close()
+        super().closeEvent(event)
+
+    def add_duty_dus(self):
+        rank = self.rank_input.currentText()
+        first_name = self.first_name_input.text()
+        last_name = self.last_name_input.text()
+        last_last_name = self.last_last_name_input.text()
+
+        if not rank.strip() or not first_name.strip() or not last_name.strip() or not last_last_name.strip():
+            QMessageBox.warning(self, "Ошибка ввода", "Все поля должны быть заполнены!")
+            return
+
+        try:
+            self.db_manager.add_duty_dus(rank, first_name, last_name, last_last_name)
+            self.update_duty_dus_list()
+            self.first_name_input.clear()
+            self.last_name_input.clear()
+            self.last_last_name_input.clear()
+            QMessageBox.information(self, "Успех", "Дежурный по узлу связи добавлен.")
+        except sqlite3.DatabaseError as e:
+            QMessageBox.critical(self, "Ошибка базы данных", f"Не удалось добавить дежурного по узлу связи: {str(e)}")
+
+    def add_correspondence(self):
+        date = self.date_input.date().toString("yyyy-MM-dd")
+        corr_type = self.corr_type_input.currentText()
+        urgency = self.urgency_input.currentText()
+        incoming = self.incoming_input.text()
+        outgoing = self.outgoing_input.text()
+        period = self.period_input.currentText()
+        duty_dus_id = self.duty_dus_input.currentData()
+
+        if not all([date, corr_type, urgency, incoming, outgoing, period, duty_dus_id]):
+            QMessageBox.warning(self, "Ошибка ввода", "Все поля должны быть заполнены!")
+            return
+
+        try:
+            self.db_manager.add_correspondence(date, corr_type, urgency, incoming, outgoing, period, duty_dus_id)
+            self.incoming_input.clear()
+            self.outgoing_input.clear()
+            QMessageBox.information(self, "Успех", "Корреспонденция добавлена.")
+        except sqlite3.DatabaseError as e:
+            QMessageBox.critical(self, "Ошибка базы данных", f"Не удалось добавить нагрузку: {str(e)}")
+
+    def import_correspondence(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Загрузить нагрузку", "",
+                                                  "CSV, JSONL (*.csv *.jsonl *.ndjson *.json)")
+        if not filename:
+            return
+        try:
+            file_format = import_format(filename)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка ввода", str(e))
+            return
+        # Отклоненные записи сохраняются рядом с исходным файлом.
+        rejects_path = f"{os.path.splitext(filename)[0]}_rejected.csv"
+        importer = CorrespondenceImporter(self.db_manager)
+        self.task_runner.submit("import",
+                                lambda task: importer.run(filename, file_format, rejects_path=rejects_path,
+                                                          progress=task.report_progress),
+                                on_finished=lambda result: self.show_import_done(result, rejects_path),
+                                on_failed=self.show_task_error, on_progress=self.show_task_progress)
+
+    def show_import_done(self, result, rejects_path):
+        message = format_import_result(result)
+        # Файл отклоненных записей создается только при первой из них (в этом
+        # или в прерванном прошлом запуске).
+        if result.rejected or (result.skipped and os.path.exists(rejects_path)):
+            message += f"\nОтклоненные записи: {rejects_path}"
+        QMessageBox.information(self, "Загрузка завершена", message)
+
+    def backup_database(self, notify=True):
+        self.task_runner.submit("backup",
+                                lambda task: self.db_manager.backup(self.backup_dir, progress=task.report_progress),
+                                on_finished=self.show_backup_done if notify else None,
+                                on_failed=self.show_task_error, on_progress=self.show_task_progress)
+
+    def show_backup_done(self, result):
+        QMessageBox.information(self, "Успех", f"Резервная копия создана:\n{result.path}")
+
+    def restore_database(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Восстановить из копии",
+                                                  self.backup_dir or self.db_manager.default_backup_dir(),
+                                                  "SQLite (*.db)")
+        if not filename:
+            return
+        reply = QMessageBox.question(self, "Подтверждение восстановления",
+                                     "Текущие данные будут заменены данными копии. Продолжить?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+
+        def run(task):
+            saved = self.db_manager.restore(filename, self.backup_dir)
+            self.db_manager.migrate()
+            return saved
+
+        self.task_runner.submit("restore", run, on_finished=self.show_restore_done, on_failed=self.show_task_error)
+
+    def show_restore_done(self, saved):
+        self.update_duty_dus_list()
+        QMessageBox.information(self, "Успех", f"База восстановлена. Прежнее состояние сохранено:\n{saved.path}")
+
+    def delete_duty_dus(self):
+        duty_dus_id = self.delete_duty_dus_input.currentData()
+
+        reply = QMessageBox.question(
+            self,
+            "Подтверждение удаления",
+            "Вы уверены, что хотите удалить этого дежурного по узлу связи?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            try:
+                self.db_manager.delete_duty_dus(duty_dus_id)
+                QMessageBox.information(self, "Успех", "Дежурный по узлу связи удален.")
+            except sqlite3.DatabaseError as e:
+                QMessageBox.critical(self, "Ошибка базы данных",
+                                     f"Не удалось удалить дежурного по узлу связи: {str(e)}")
+            self.update_duty_dus_list()
+
+    def search_correspondence(self):
+        start_date = self.start_date_input.date().toString("yyyy-MM-dd")
+        end_date = self.end_date_input.date().toString("yyyy-MM-dd")
+
+        self.task_runner.submit("search", self.run_search, start_date, end_date, self.search_filters(),
+                                on_finished=self.show_search_results, on_failed=self.show_task_error)
+
+    def search_filters(self):
+        return SearchFilters(self.corr_type_filter.currentData(), self.urgency_filter.currentData(),
+                             self.period_filter.currentData(), self.duty_dus_filter.currentData())
+
+    def run_search(self, task, start_date, end_date, filters):
+        first_page = self.db_manager.search_correspondence_page(start_date, end_date, filters=filters)
+        task.check_cancelled()
+        analytics = self.db_manager.get_load_analytics(start_date, end_date, filters)
+        return start_date, end_date, first_page, analytics, filters
+
+    def show_search_results(self, result):
+        with self.db_manager.instrumentation.timed("gui.show_search_results"):
+            self.populate_search_results(*result)
+
+    def populate_search_results(self, start_date, end_date, first_page, analytics, filters=None):
+        self.search_results_model.set_range(start_date, end_date, first_page, filters)
+        self.fill_table(self.category_totals_table, format_category_totals(analytics))
+        for section, table in self.load_tables.items():
+            self.fill_table(table, format_load_rows(analytics, section, self.db_manager.duty_dus))
+
+    def fill_table(self, table, rows):
+        table.clearContents()
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                table.setItem(i, j, QTableWidgetItem(value))
+
+    def export_to_pdf(self):
+        current_datetime = datetime.now()
+        formatted_datetime = current_datetime.strftime('%d-%m-%Y_%H-%M')
+        filename = f"{formatted_datetime}_report.pdf"
+        full_filename, _ = QFileDialog.getSaveFileName(self, "Сохранить PDF", filename, "PDF Files (*.pdf)")
+
+        if full_filename:
+            start_date, end_date, filters = self.export_range()
+            report = PdfReport(self.db_manager, start_date, end_date,
+                               include_results=self.export_search_results_checkbox.isChecked(),
+                               duty_dus_name=self.export_duty_dus_input.currentText(),
+                               generated_at=current_datetime, filters=filters)
+            self.task_runner.submit("export", lambda task: report.write(full_filename, task.report_progress),
+                                    on_finished=lambda _: self.show_export_done("PDF"), on_failed=self.show_task_error,
+                                    on_progress=self.show_task_progress)
+
+    def export_range(self):
+        # Выгружается последний выполненный поиск, а без него - даты и отбор формы.
+        model = self.search_results_model
+        if model.start_date is not None:
+            return model.start_date, model.end_date, model.filters
+        return (self.start_date_input.date().toString("yyyy-MM-dd"), self.end_date_input.date().toString("yyyy-MM-dd"),
+                self.search_filters())
+
+    def export_table(self, file_format):
+        label = file_format.upper()
+        filename = f"{datetime.now().strftime('%d-%m-%Y_%H-%M')}_report.{file_format}"
+        full_filename, _ = QFileDialog.getSaveFileName(self, f"Сохранить {label}", filename,
+                                                       f"{label} Files (*.{file_format})")
+        if full_filename:
+            start_date, end_date, filters = self.export_range()
+            report = REPORT_FORMATS[file_format](self.db_manager, start_date, end_date,
+                                                 include_results=self.export_search_results_checkbox.isChecked(),
+                                                 filters=filters)
+            self.task_runner.submit("export", lambda task: report.write(full_filename, task.report_progress),
+                                    on_finished=lambda _: self.show_export_done(label),
+                                    on_failed=self.show_task_error, on_progress=self.show_task_progress)
+
+    def show_export_done(self, label):
+        QMessageBox.information(self, "Успех", f"Результаты поиска экспортированы в {label}")
+
+    def export_batch(self, kind):
+        output_dir = QFileDialog.getExistingDirectory(self, "Папка для отчетов")
+        if not output_dir:
+            return
+        start_date, end_date, filters = self.export_range()
+        include_results = self.export_search_results_checkbox.isChecked()
+        # В отчетах ДУС подписывает сам дежурный, в отчетах смен - выбранный "Экспорт ДУС".
+        duty_dus_name = "" if kind == "duty_dus" else self.export_duty_dus_input.currentText()
+
+        def run(task):
+            items = plan_batch_reports(self.db_manager, start_date, end_date, kind, output_dir=output_dir,
+                                       filters=filters, duty_dus_name=duty_dus_name)
+            return run_batch_reports(self.db_path, start_date, end_date, items, include_results=include_results,
+                                     progress=task.report_progress)
+
+        self.task_runner.submit("export", run, on_finished=self.show_batch_done, on_failed=self.show_task_error,
+                                on_progress=self.show_task_progress)
+
+    def show_batch_done(self, filenames):
+        QMessageBox.information(self, "Успех", f"Сохранено отчетов: {len(filenames)}")
+
+def run_gui(args):
+    app = QApplication(sys.argv[:1])
+    window = CorrespondenceApp(args.db, getattr(args, "instrumentation", None), getattr(args, "backup_dir", None),
+                               getattr(args, "backup_every", 0), getattr(args, "server", None))
+    window.show()
+    return app.exec_()
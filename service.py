@@ -0,0 +1,395 @@
+import concurrent.futures
+import hmac
+import http.client
+import http.server
+import ipaddress
+import json
+import logging
+import os
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+
+from database import (EXPORT_PAGE_SIZE, SEARCH_PAGE_SIZE, DatabaseManager, DutyDus, Instrumentation, LoadAnalytics,
+                      SearchFilters)
+
+# Служба ввода для нескольких рабочих мест узла связи. Базой владеет один
+# процесс: записи всех клиентов идут через единственный поток записи, который
+# собирает накопившиеся запросы в одну транзакцию (group commit), а запросы
+# поиска и итогов выполняются в потоках подключений параллельно (WAL).
+# Протокол - JSON по HTTP: POST /api/<метод> с именованными аргументами
+# метода DatabaseManager, ответ {"result": ...} или {"error": ...}.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_TIMEOUT = 30
+API_PREFIX = "/api/"
+# Больше записей в одной транзакции - дольше ждут ответа первые из них.
+GROUP_COMMIT_MAX = 500
+# Общий ключ службы и клиентов (заголовок Authorization: Bearer). Без него
+# служба слушает только петлевой адрес: любой, кто до нее достучится, может
+# добавлять записи и удалять ДУС.
+SERVICE_TOKEN_ENV = "CORRESPONDENCE_SERVICE_TOKEN"
+
+WRITE_METHODS = {"add_correspondence", "add_correspondence_many", "add_duty_dus", "delete_duty_dus"}
+READ_METHODS = {"get_lookup", "update_duty_dus_list", "search_correspondence_page", "correspondence_id_page",
+                "count_correspondence", "get_correspondence_count_by_type", "get_load_analytics",
+                "describe_filters"}
+# Ошибки в данных запроса; остальные - ошибки службы или базы.
+CLIENT_ERRORS = (TypeError, ValueError, KeyError, sqlite3.IntegrityError)
+
+class ServiceError(sqlite3.DatabaseError):
+    pass
+
+class GroupCommitWriter:
+    def __init__(self, db_manager, max_batch=GROUP_COMMIT_MAX):
+        self.db_manager = db_manager
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="group-commit", daemon=True)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, method, params):
+        future = concurrent.futures.Future()
+        self.queue.put((method, params, future))
+        return future
+
+    def run(self):
+        # Пока идет COMMIT, новые запросы копятся в очереди и уходят следующей
+        # транзакцией: чем больше клиентов, тем крупнее пачки, без таймеров.
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [request for request in batch if request is not None]
+            if batch:
+                self.commit(batch)
+
+    def commit(self, batch):
+        try:
+            with self.db_manager.connections.transaction():
+                results = [getattr(self.db_manager, method)(**params) for method, params, _ in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # Ошибка в одном запросе не должна отменять чужие: пачка
+            # откатывается и повторяется по одному запросу.
+            for request in batch:
+                self.commit([request])
+            return
+        with self.lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "batches": self.batches, "largest_batch": self.largest_batch,
+                    "queued": self.queue.qsize()}
+
+def decode_params(params):
+    # JSON не различает списки и кортежи: отбор и позиция страницы
+    # восстанавливаются в том виде, в каком их ждет DatabaseManager.
+    if params.get("filters") is not None:
+        params["filters"] = SearchFilters(*params["filters"])
+    if params.get("after") is not None:
+        params["after"] = tuple(params["after"])
+    return params
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело ответа уходят разными пакетами; с алгоритмом Нейгла
+    # второй ждет подтверждения первого (delayed ACK, около 40 мс на запрос).
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        try:
+            super().handle()
+        finally:
+            self.server.db_manager.release_connections()
+
+    def do_POST(self):
+        method = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else None
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            # Тело читается и без ключа: иначе его остаток попал бы в следующий запрос соединения.
+            token = self.server.token
+            if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+                self.reply(401, {"error": "Неверный ключ службы"})
+                return
+            params = decode_params(json.loads(body or b"{}"))
+            if method in WRITE_METHODS:
+                result = self.server.writer.submit(method, params).result()
+            elif method in READ_METHODS:
+                result = getattr(self.server.db_manager, method)(**params)
+            elif method == "stats":
+                result = self.server.writer.stats()
+            else:
+                self.reply(404, {"error": f"Неизвестный метод: {method}"})
+                return
+        except CLIENT_ERRORS as e:
+            self.reply(400, {"error": str(e)})
+        except sqlite3.Error as e:
+            self.reply(500, {"error": str(e)})
+        except Exception as e:
+            # Без ответа клиент принял бы службу за недоступную.
+            logging.getLogger("correspondence.service").exception("Ошибка запроса %s", method)
+            self.reply(500, {"error": f"Внутренняя ошибка службы: {e!r}"})
+        else:
+            self.reply(200, {"result": result})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса в stderr замедляет службу под нагрузкой;
+        # медленные операции пишет Instrumentation (--slow-log).
+        pass
+
+class IngestionService(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Все рабочие места подключаются разом после перезапуска службы.
+    request_queue_size = 128
+
+    def __init__(self, db_manager, host=SERVICE_HOST, port=SERVICE_PORT, max_batch=GROUP_COMMIT_MAX, token=None):
+        super().__init__((host, port), ServiceRequestHandler)
+        self.db_manager = db_manager
+        self.token = token
+        self.writer = GroupCommitWriter(db_manager, max_batch)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self, poll_interval=0.5):
+        self.writer.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.writer.stop()
+
+# Справочник ДУС клиента: те же методы, что у DutyDusDirectory. Список
+# перечитывается со службы, когда в ответе встречается незнакомый id.
+class RemoteDutyDusDirectory:
+    def __init__(self, client):
+        self.client = client
+        self.entries = {}
+
+    def invalidate(self):
+        self.entries = {}
+
+    def refresh(self):
+        self.client.update_duty_dus_list()
+
+    def ensure(self, duty_dus_ids):
+        if set(duty_dus_ids).difference(self.entries, [None]):
+            self.refresh()
+
+    def list(self):
+        self.refresh()
+        return list(self.entries.values())
+
+    def get(self, duty_dus_id):
+        self.ensure([duty_dus_id])
+        return self.entries.get(duty_dus_id)
+
+    def short_name(self, duty_dus_id):
+        duty_dus = self.entries.get(duty_dus_id)
+        return duty_dus.short_name if duty_dus else ""
+
+# Клиент службы с методами DatabaseManager, которые нужны окну программы и
+# отчетам. Ошибки службы - sqlite3.DatabaseError, как и при работе с файлом.
+class ServiceClient:
+    def __init__(self, url, instrumentation=None, timeout=SERVICE_TIMEOUT, token=None):
+        parts = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+        self.url = url
+        self.host = parts.hostname or SERVICE_HOST
+        self.port = parts.port or SERVICE_PORT
+        self.timeout = timeout
+        self.token = token if token is not None else os.environ.get(SERVICE_TOKEN_ENV)
+        self.instrumentation = instrumentation or Instrumentation()
+        self.duty_dus = RemoteDutyDusDirectory(self)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                              timeout=self.timeout)
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def call(self, method, **params):
+        body = json.dumps(params, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        with self.instrumentation.timed(f"service.{method}"):
+            for attempt in range(2):
+                connection = self.connection()
+                sent = False
+                try:
+                    connection.request("POST", f"{API_PREFIX}{method}", body, headers)
+                    sent = True
+                    response = connection.getresponse()
+                    payload = json.loads(response.read())
+                    break
+                except (http.client.HTTPException, OSError) as e:
+                    connection.close()
+                    # Запись повторяется, только если запрос не ушел: иначе
+                    # служба могла ее уже сохранить.
+                    if attempt or (sent and method in WRITE_METHODS):
+                        raise ServiceError(f"Служба {self.url} недоступна: {e}")
+        if response.status != 200:
+            raise ServiceError(payload.get("error") or f"HTTP {response.status}")
+        return payload["result"]
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    # Схему базы создает и обновляет служба.
+    def create_tables(self):
+        pass
+
+    def migrate(self):
+        pass
+
+    def stats(self):
+        return self.call("stats")
+
+    def get_lookup(self, table):
+        return [tuple(row) for row in self.call("get_lookup", table=table)]
+
+    def get_corr_types(self):
+        return self.get_lookup("corr_types")
+
+    def get_urgencies(self):
+        return self.get_lookup("urgencies")
+
+    def get_periods(self):
+        return self.get_lookup("periods")
+
+    def update_duty_dus_list(self):
+        duty_dus_list = [DutyDus(*row) for row in self.call("update_duty_dus_list")]
+        self.duty_dus.entries = {duty_dus.id: duty_dus for duty_dus in duty_dus_list}
+        return duty_dus_list
+
+    def add_duty_dus(self, rank, first_name, last_name, last_last_name):
+        self.call("add_duty_dus", rank=rank, first_name=first_name, last_name=last_name,
+                  last_last_name=last_last_name)
+
+    def delete_duty_dus(self, duty_dus_id):
+        self.call("delete_duty_dus", duty_dus_id=duty_dus_id)
+
+    def add_correspondence(self, date, corr_type, urgency, incoming, outgoing, period, duty_dus_id):
+        self.call("add_correspondence", date=date, corr_type=corr_type, urgency=urgency, incoming=incoming,
+                  outgoing=outgoing, period=period, duty_dus_id=duty_dus_id)
+
+    def add_correspondence_many(self, rows):
+        self.call("add_correspondence_many", rows=[list(row) for row in rows])
+
+    def search_correspondence_page(self, start_date, end_date, after=None, limit=SEARCH_PAGE_SIZE, filters=None):
+        page = [tuple(row) for row in self.call("search_correspondence_page", start_date=start_date,
+                                                end_date=end_date, after=after, limit=limit, filters=filters)]
+        self.duty_dus.ensure(row[7] for row in page)
+        return page
+
+    def correspondence_id_page(self, start_date, end_date, after=None, limit=EXPORT_PAGE_SIZE, filters=None):
+        return [tuple(row) for row in self.call("correspondence_id_page", start_date=start_date, end_date=end_date,
+                                                after=after, limit=limit, filters=filters)]
+
+    # Обход страниц тот же, что у DatabaseManager.
+    iter_search_pages = DatabaseManager.iter_search_pages
+    iter_search_correspondence = DatabaseManager.iter_search_correspondence
+    iter_correspondence_id_pages = DatabaseManager.iter_correspondence_id_pages
+
+    def count_correspondence(self, start_date, end_date, filters=None):
+        return self.call("count_correspondence", start_date=start_date, end_date=end_date, filters=filters)
+
+    def get_correspondence_count_by_type(self, start_date, end_date, filters=None):
+        return [tuple(row) for row in self.call("get_correspondence_count_by_type", start_date=start_date,
+                                                end_date=end_date, filters=filters)]
+
+    def get_load_analytics(self, start_date, end_date, filters=None):
+        result = self.call("get_load_analytics", start_date=start_date, end_date=end_date, filters=filters)
+        analytics = LoadAnalytics(*(tuple(tuple(row) for row in rows) if name != "grand_total" else tuple(rows)
+                                    for name, rows in zip(LoadAnalytics._fields, result)))
+        self.duty_dus.ensure(row[0] for row in analytics.duty_dus)
+        return analytics
+
+    def describe_filters(self, filters):
+        return self.call("describe_filters", filters=filters) if filters else ""
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+def run_serve(args):
+    host = args.host or SERVICE_HOST
+    token = os.environ.get(SERVICE_TOKEN_ENV) or None
+    if not token and not is_loopback(host):
+        print(f"Служба на адресе {host} требует ключа: задайте его в переменной {SERVICE_TOKEN_ENV} "
+              f"у службы и у клиентов", file=sys.stderr)
+        return 2
+    db_manager = DatabaseManager(args.db, instrumentation=args.instrumentation)
+    try:
+        db_manager.migrate()
+        service = IngestionService(db_manager, host, SERVICE_PORT if args.port is None else args.port,
+                                   args.batch or GROUP_COMMIT_MAX, token)
+        print(f"Служба учета корреспонденции: {service.url}", flush=True)
+        # По SIGTERM служба дописывает очередь записи и завершается, как по Ctrl+C.
+        # shutdown() ждет выхода из serve_forever, поэтому вызывается из другого потока.
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=service.shutdown).start())
+        start = time.perf_counter()
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.server_close()
+        stats = service.writer.stats()
+        if stats["batches"]:
+            print(f"Записей: {stats['requests']} в {stats['batches']} транзакциях "
+                  f"(в среднем {stats['requests'] / stats['batches']:.1f}, больше всего {stats['largest_batch']}), "
+                  f"{time.perf_counter() - start:.0f} с")
+        return 0
+    finally:
+        db_manager.close()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from database import (CORR_TYPES, CORRESPONDENCE_COUNT_BY_TYPE_SQL, CORRESPONDENCE_COUNT_SQL,
+                      CORRESPONDENCE_IDS_PAGE_SQL, LOAD_ANALYTICS_SQL, PERIODS, SEARCH_CORRESPONDENCE_PAGE_SQL,
+                      SEARCH_CORRESPONDENCE_SQL, URGENCIES, DatabaseManager, SearchFilters, date_to_day, day_to_date,
+                      with_filters)
+
+# Запросы поиска, итогов и выгрузок должны читать диапазон дат по индексу, а
+# не просматривать таблицу целиком: с отбором по ДУС или срочности - по
+# составному индексу (отбор, day), без отбора - по индексу day записей или
+# по первичному ключу (day, ...) суточной свертки.
+RECORD_QUERIES = {
+    "search": (SEARCH_CORRESPONDENCE_SQL, 2),
+    "search_page": (SEARCH_CORRESPONDENCE_PAGE_SQL, 5),
+    "export_page": (CORRESPONDENCE_IDS_PAGE_SQL, 5),
+}
+ROLLUP_QUERIES = {
+    "count_by_type": (CORRESPONDENCE_COUNT_BY_TYPE_SQL, 2),
+    "count": (CORRESPONDENCE_COUNT_SQL, 2),
+    "load_analytics": (LOAD_ANALYTICS_SQL, 2),
+}
+RECORD_INDEXES = [
+    (None, "idx_correspondence_day"),
+    (SearchFilters(duty_dus_id=1), "idx_correspondence_duty_dus_day"),
+    (SearchFilters(urgency_id=1), "idx_correspondence_urgency_day"),
+    (SearchFilters(corr_type_id=1), "idx_correspondence_day"),
+    (SearchFilters(period_id=1), "idx_correspondence_day"),
+]
+ROLLUP_INDEXES = [
+    (None, "PRIMARY KEY"),
+    (SearchFilters(duty_dus_id=1), "idx_correspondence_daily_duty_dus"),
+    (SearchFilters(urgency_id=1), "PRIMARY KEY"),
+    (SearchFilters(corr_type_id=1), "PRIMARY KEY"),
+    (SearchFilters(period_id=1), "PRIMARY KEY"),
+]
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_manager = DatabaseManager(os.path.join(self.directory, "correspondence.db"))
+        self.db_manager.migrate()
+
+    def tearDown(self):
+        self.db_manager.close()
+        shutil.rmtree(self.directory)
+
+    def query_plan(self, sql, parameter_count, filters):
+        sql, parameters = with_filters(sql, filters, "r" if "correspondence_daily r" in sql else "c")
+        days = [date_to_day("2024-02-01"), date_to_day("2024-02-07")]
+        bounds = (days + [days[0], 0, 500])[:parameter_count]
+        return self.db_manager.explain_query_plan(sql, bounds + parameters)
+
+    def assert_range_index(self, queries, indexes, alias, exact=True):
+        # exact=False допускает любой индекс с диапазоном по day: со
+        # статистикой планировщик может, например, перебрать справочник
+        # срочностей и читать idx_correspondence_urgency_day.
+        for name, (sql, parameter_count) in queries.items():
+            for filters, index in indexes:
+                with self.subTest(query=name, filters=filters):
+                    details = self.query_plan(sql, parameter_count, filters)
+                    self.assertFalse([detail for detail in details if detail.startswith(f"SCAN {alias}")], details)
+                    searches = [detail for detail in details if detail.startswith(f"SEARCH {alias} USING ")]
+                    self.assertEqual(len(searches), 1, details)
+                    self.assertIn("day>? AND day<?", searches[0])
+                    if exact:
+                        self.assertIn(f" {index} (", searches[0])
+
+    def test_record_queries_use_day_indexes(self):
+        self.assert_range_index(RECORD_QUERIES, RECORD_INDEXES, "c")
+
+    def test_rollup_queries_use_day_indexes(self):
+        self.assert_range_index(ROLLUP_QUERIES, ROLLUP_INDEXES, "r")
+
+    def test_plans_after_analyze(self):
+        # Со статистикой ANALYZE по заполненной базе планировщик не должен
+        # переходить на полный просмотр.
+        rows = []
+        for i in range(5000):
+            day = date_to_day("2024-01-01") + i % 366
+            rows.append((day_to_date(day), CORR_TYPES[i % len(CORR_TYPES)], URGENCIES[i % len(URGENCIES)],
+                         i % 7, i % 5, PERIODS[i % len(PERIODS)], None))
+        self.db_manager.add_correspondence_many(rows)
+        self.db_manager.connections.execute("ANALYZE")
+        self.assert_range_index(RECORD_QUERIES, RECORD_INDEXES, "c", exact=False)
+        self.assert_range_index(ROLLUP_QUERIES, ROLLUP_INDEXES, "r", exact=False)
+
+
+if __name__ == "__main__":
+    unittest.main()